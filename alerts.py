@@ -0,0 +1,29 @@
+# --- SMS alert texts (shared by the app and sms_scheduler.py) ---
+MOTIVATIONS = {
+    "Weight Loss (Cut)": "קצת רעב עכשיו = תוצאות מחר! תמשיך בגירעון הקלורי, אתה בדרך הנכונה. 💪",
+    "Maintenance": "הסוד הוא התמדה! לשמור על מאזן זה לא קל, אבל אתה עושה את זה מעולה. ⚖️",
+    "Lean Muscle Gain": "כל אימון וכל ארוחה בונים אותך. אל תשכח את החלבון שלך היום! 🥩",
+    "Bodybuilding (Bulk)": "כדי לגדול צריך לאכול! אל תפחד מהפחמימות, הן הדלק שלך לאימון. 🚀"
+}
+
+def generate_sms_alert(user_data, rem_c, rem_p, rem_water, goal):
+    msg = ""
+    if rem_water > 0.5: msg += f"💧 חסר לך עדיין {rem_water:.1f} ליטר מים ליעד! אל תשכח לשתות.\n"
+    if rem_p > 20: msg += f"🥩 יש לך עוד {rem_p:.0f} גרם חלבון להשלים היום בשביל השרירים.\n"
+    if rem_c > 300: msg += f"🔥 נשארו לך {rem_c:.0f} קלוריות! זמן לארוחה טובה.\n"
+    if not msg: msg = "🏆 עמדת בכל היעדים שלך להיום! עבודה מדהימה."
+    msg += f"\n💡 {MOTIVATIONS.get(goal, '')}"
+    return msg
+
+def send_real_sms_mock(phone_number, text_message):
+    """
+    זו הפונקציה שבעתיד תתחבר ל-API אמיתי כמו Twilio.
+    כרגע היא רק מדמה שליחה.
+    """
+    # example real code: requests.post("https://api.twilio.com/...", data={"to": phone_number, "body": text_message})
+    print(f"MOCK SMS SENT TO {phone_number}: {text_message}")
+    return True
+
+def remaining(targets, food, burned, protein, water):
+    """(calories, protein, water) still left against the day's targets, as the Summary tab shows them."""
+    return targets["cals"] - (food - burned), max(0, targets["prot"] - protein), max(0, targets.get("water", 0) - water)
@@ -0,0 +1,88 @@
+"""Content-addressed avatar files.
+
+    python avatars.py migrate --db myfitness.db
+
+Uploads are stored once per distinct image under ``static/avatars/<h[:2]>/<h>_<size>.jpg`` (h = sha256 of
+the uploaded bytes) in every THUMB_SIZES size, and users.profile_pic holds only ``h``. Streamlit serves the
+directory at ``app/static/...`` when ``server.enableStaticServing`` is on (see .streamlit/config.toml),
+with ETag/Last-Modified revalidation. File names never change content, so a front proxy or CDN pointed at
+the same directory can add ``Cache-Control: public, max-age=31536000, immutable``; set AVATAR_BASE_URL
+to its URL prefix.
+
+The app runs ``migrate`` once per process at start-up (a no-op after the first run); on a large store, run
+the command above before deploying so the first page load does not wait for it.
+"""
+import os
+import re
+import io
+import sys
+import base64
+import hashlib
+import argparse
+from PIL import Image, ImageOps
+
+AVATAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "avatars")
+AVATAR_BASE_URL = os.environ.get("AVATAR_BASE_URL", "app/static/avatars")
+THUMB_SIZES = (64, 128, 256)
+JPEG_QUALITY = 85
+_DIGEST = re.compile("^[0-9a-f]{64}$")
+
+def is_digest(value):
+    return bool(value) and bool(_DIGEST.match(value))
+
+class AvatarStore:
+    def __init__(self, root=AVATAR_DIR, base_url=AVATAR_BASE_URL):
+        self.root, self.base_url = root, base_url.rstrip("/")
+
+    def path(self, digest, size):
+        return os.path.join(self.root, digest[:2], f"{digest}_{size}.jpg")
+
+    def url(self, digest, size=128):
+        return f"{self.base_url}/{digest[:2]}/{digest}_{size}.jpg"
+
+    def put(self, data):
+        """Stores raw image bytes (or a file-like upload); returns the content hash. Re-uploads are free."""
+        if not isinstance(data, bytes): data = data.getvalue() if hasattr(data, "getvalue") else data.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if all(os.path.exists(self.path(digest, s)) for s in THUMB_SIZES): return digest
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+        os.makedirs(os.path.dirname(self.path(digest, 0)), exist_ok=True)
+        for size in THUMB_SIZES:
+            side = min(size, img.width, img.height)
+            buf = io.BytesIO(); ImageOps.fit(img, (side, side), Image.LANCZOS).save(buf, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            # Write-then-rename: a concurrent reader sees either no file or the whole file.
+            tmp = self.path(digest, size) + f".{os.getpid()}.tmp"
+            with open(tmp, "wb") as f: f.write(buf.getvalue())
+            os.replace(tmp, self.path(digest, size))
+        return digest
+
+    def migrate(self, store):
+        """Moves base64 avatars still inlined in users.profile_pic into files; returns how many were moved."""
+        if store.get_meta("avatars_extracted"): return 0
+        moved = 0
+        for page in store.inline_avatars():
+            changes = []
+            for email, pic in page:
+                try: digest = self.put(base64.b64decode(pic))
+                except Exception: digest = ""  # undecodable leftovers are dropped rather than rendered broken
+                changes.append((email, digest))
+            # Files first, then one short write per page: the image work never holds the write lock.
+            store.set_avatars(changes); moved += len(changes)
+        store.set_meta("avatars_extracted", "1")
+        if moved: store.vacuum()
+        return moved
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("migrate", help="extract inline base64 avatars from the user store")
+    p.add_argument("--db", default="myfitness.db")
+    args = parser.parse_args()
+    from store import FitnessStore
+    store = FitnessStore(args.db, legacy_json=None)
+    before = os.path.getsize(args.db)
+    n = AvatarStore().migrate(store)
+    print(f"{n} avatars extracted; {args.db}: {before / 1e6:.1f} MB -> {os.path.getsize(args.db) / 1e6:.1f} MB", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
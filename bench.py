@@ -0,0 +1,507 @@
+"""Micro-benchmarks for MyFitness Pro's storage and lookup paths.
+
+    python bench.py rerun --users 1000 10000 100000
+    python bench.py search --items 500000
+    python bench.py lookup --translate-ms 300 --remote-ms 800
+    python bench.py barcode --images 20 --workers 4
+    python bench.py summary --years 1 3 5
+    python bench.py avatars --users 5000
+    python bench.py sms --users 100000 --rate 500
+    python bench.py accounts --users 1000000
+    python bench.py targets --users 1000000
+    python bench.py weight --years 1 3 5 10
+    python bench.py metrics
+    python bench.py io --users 1000 4000 16000 --days 90
+"""
+import io
+import sys
+import argparse
+import json
+import os
+import random
+import statistics
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+from store import FitnessStore
+from food_search import FoodIndex, load_fitness_db
+from lookup import LookupService
+
+MEALS = ["Breakfast", "Lunch", "Dinner", "Snacks"]
+
+# --- Synthetic data ---
+def synthetic_user(i, rng, days=30):
+    return {
+        "password": "pw", "username": f"user{i}", "profile_pic": "", "phone": "", "sms_alerts": False, "onboarding_done": True,
+        "profile": {"gender": "Male", "age": 30, "height": 175, "activity": "Sedentary", "goal": "Maintenance", "targets": {"cals": 2200, "prot": 165, "carb": 220, "fat": 73, "water": 2.6}},
+        "daily_log": [{"Meal": rng.choice(MEALS), "Food": "Egg", "Grams": 100.0, "Calories": 155.0, "Protein": 13.0, "Carbs": 1.1, "Fat": 11.0} for _ in range(rng.randint(3, 12))],
+        "exercise_log": [{"Exercise": "Yoga / Stretching", "Burned": 120}],
+        "weight_log": [{"Date": f"2024-{1 + d // 28:02d}-{1 + d % 28:02d}", "Weight": 80 - d * 0.05} for d in range(days)],
+        "custom_foods": {}, "water_liters": 1.0,
+    }
+
+def write_legacy_json(path, n_users, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"users": {f"user{i}@example.com": synthetic_user(i, rng) for i in range(n_users)}}, f, indent=4)
+
+def synthetic_catalog(n_items, seed=0):
+    rng = random.Random(seed)
+    words = sorted({w for name in load_fitness_db() for w in name.replace("(", " ").replace(")", " ").split()})
+    brands = ["tnuva", "strauss", "osem", "elite", "yotvata", "tara", "sugat", "telma", "maadanot", "shufersal"]
+    catalog = {}
+    while len(catalog) < n_items:
+        name = " ".join(rng.sample(words, rng.randint(1, 3))) + f" {rng.choice(brands)} {rng.randint(1, 999)}"
+        catalog[name] = {"cals": rng.uniform(20, 600), "prot": rng.uniform(0, 30), "carb": rng.uniform(0, 80), "fat": rng.uniform(0, 40)}
+    return catalog
+
+def timed(fn, samples):
+    out = []
+    for _ in range(samples):
+        t0 = time.perf_counter(); fn(); out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+EAN_L = ["0001101", "0011001", "0010011", "0111101", "0100011", "0110001", "0101111", "0111011", "0110111", "0001011"]
+EAN_PARITY = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG", "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL"]
+
+def ean13(digits12):
+    s = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits12))
+    return digits12 + str((10 - s % 10) % 10)
+
+def ean13_modules(code):
+    """95 bar/space modules ("1" = bar) for a 13-digit EAN."""
+    r = lambda d: "".join("1" if c == "0" else "0" for c in EAN_L[int(d)])
+    left = "".join(EAN_L[int(d)] if p == "L" else r(d)[::-1] for d, p in zip(code[1:7], EAN_PARITY[int(code[0])]))
+    return "101" + left + "01010" + "".join(r(d) for d in code[7:]) + "101"
+
+def synthetic_photo(code, condition, rng):
+    """A phone-sized JPEG with one EAN-13 label somewhere in it, degraded according to `condition`."""
+    from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+    module = 2 if condition == "small" else rng.randint(4, 6)
+    bars = ean13_modules(code)
+    label = Image.new("L", ((len(bars) + 22) * module, 70 * module), 255)
+    draw = ImageDraw.Draw(label)
+    for i, b in enumerate(bars):
+        if b == "1": draw.rectangle([(11 + i) * module, 5 * module, (12 + i) * module - 1, 65 * module], fill=0)
+    if condition == "rotated": label = label.rotate(rng.uniform(-12, 12), expand=True, fillcolor=255)
+    photo = Image.effect_noise((3024, 4032), 25).point(lambda p: 90 + p // 3)
+    photo.paste(label, (rng.randint(0, photo.width - label.width), rng.randint(0, photo.height - label.height)))
+    if condition == "low_contrast": photo = ImageEnhance.Contrast(photo).enhance(0.25)
+    if condition == "blur": photo = photo.filter(ImageFilter.GaussianBlur(module * 0.6))
+    if condition == "noise": photo = Image.blend(photo, Image.effect_noise(photo.size, 80), 0.35)
+    buf = io.BytesIO(); photo.convert("RGB").save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+# --- Benchmarks ---
+def bench_rerun(sizes, samples):
+    """Per-rerun cost of finding the logged-in user: legacy json.load vs. store lookup (cold and cached)."""
+    print(f"{'users':>8} {'json.load ms':>13} {'store cold ms':>14} {'store warm ms':>14}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy, db_path = os.path.join(tmp, "legacy.json"), os.path.join(tmp, "bench.db")
+            write_legacy_json(legacy, n)
+            emails = [f"user{i}@example.com" for i in random.Random(1).sample(range(n), min(samples, n))]
+            legacy_ms = timed(lambda: json.load(open(legacy, encoding="utf-8"))["users"][emails[0]], max(1, min(samples, 3)))
+            store = FitnessStore(db_path, legacy_json=legacy)
+            it = iter(emails * 2)
+            cold_ms = timed(lambda: store.get_user(next(it)), len(emails))
+            warm_ms = timed(lambda: store.get_user(emails[0]), samples)
+            print(f"{n:>8} {legacy_ms:>13.2f} {cold_ms:>14.3f} {warm_ms:>14.3f}")
+
+def bench_search(n_items, samples):
+    """Add Food lookup: the old `en in k` scan over a merged dict vs. the trigram index."""
+    catalog = synthetic_catalog(n_items)
+    t0 = time.perf_counter()
+    index = FoodIndex(); index.add_many(catalog)
+    print(f"items={n_items}  index build {time.perf_counter() - t0:.1f}s")
+    queries = ["chicken breast", "chikcen", "cottage cheese", "tnuva 42", "humus", "greek yogurt", "banana", "tuna in water"]
+    print(f"{'query':>16} {'scan ms':>9} {'index ms':>9} {'hits':>6}")
+    for q in queries:
+        scan_ms = timed(lambda: [k for k in catalog if q in k], max(1, samples // 10))
+        index_ms = timed(lambda: index.search(q), samples)
+        print(f"{q:>16} {scan_ms:>9.2f} {index_ms:>9.3f} {len(index.search(q)):>6}")
+
+def bench_lookup(translate_ms, remote_ms, keystrokes):
+    """Time-to-first-results with a fake slow translator/OFF: serial calls vs. the background LookupService."""
+    calls = {"translate": 0, "remote": 0}
+    def translate(q): calls["translate"] += 1; time.sleep(translate_ms / 1000); return q.lower()
+    def remote(q): calls["remote"] += 1; time.sleep(remote_ms / 1000); return [{"product_name": q}]
+    local = lambda *q: []
+    t0 = time.perf_counter(); translate("pizza"); remote("pizza"); serial_ms = (time.perf_counter() - t0) * 1000
+    service = LookupService(translate, remote, lambda code: None)
+    t0 = time.perf_counter(); lk = service.start("pasta", local); first_ms = (time.perf_counter() - t0) * 1000
+    lk.wait(); remote_done_ms = (time.perf_counter() - t0) * 1000
+    print(f"serial translate+search blocks the rerun: {serial_ms:.0f} ms")
+    print(f"service: rerun unblocked after {first_ms:.2f} ms, remote results after {remote_done_ms:.0f} ms")
+    # Typing: each keystroke supersedes the previous query; stale lookups must not reach the remote backend.
+    calls.update(translate=0, remote=0)
+    prev = None
+    for i in range(1, keystrokes + 1):
+        if prev: prev.cancel()
+        prev = service.start("hamburger"[:i] + f" {i}", local); time.sleep(translate_ms / 4000)
+    prev.wait()
+    print(f"{keystrokes} superseded keystrokes: {calls['translate']} translations, {calls['remote']} remote searches")
+
+def bench_barcode(n_images, workers, seed=0):
+    """Camera decode rate and latency: the old full-frame two-pass decode vs. barcode.decode_barcode."""
+    from concurrent.futures import ThreadPoolExecutor
+    from PIL import Image, ImageEnhance
+    from barcode import decode_barcode, zbar_decode
+    def legacy(data):
+        dec = zbar_decode(Image.open(io.BytesIO(data)))
+        if not dec: dec = zbar_decode(ImageEnhance.Contrast(Image.open(io.BytesIO(data)).convert('L')).enhance(3.0))
+        return dec[0].data.decode("utf-8") if dec else None
+    pool = ThreadPoolExecutor(max_workers=workers)
+    methods = {"legacy": legacy, "pipeline": lambda data: decode_barcode(io.BytesIO(data)),
+               f"pipeline x{workers}": lambda data: decode_barcode(io.BytesIO(data), pool=pool)}
+    rng = random.Random(seed)
+    print(f"{'condition':>13} {'method':>12} {'decoded':>8} {'median ms':>10} {'p90 ms':>8}")
+    for condition in ["clean", "small", "rotated", "low_contrast", "blur", "noise"]:
+        corpus = [(code, synthetic_photo(code, condition, rng)) for code in (ean13(f"729{rng.randrange(10 ** 9):09d}") for _ in range(n_images))]
+        for name, fn in methods.items():
+            ok, ms = 0, []
+            for code, data in corpus:
+                t0 = time.perf_counter(); got = fn(data); ms.append((time.perf_counter() - t0) * 1000)
+                ok += got == code
+            print(f"{condition:>13} {name:>12} {ok:>4}/{len(corpus):<3} {statistics.median(ms):>10.0f} {statistics.quantiles(ms, n=10)[-1]:>8.0f}")
+    pool.shutdown()
+
+def bench_summary(years, samples, per_day=12):
+    """Summary tab cost for users with years of dated diary entries: pandas sums over the whole log vs.
+    today's partition, compared with a brand-new user; plus week/month history queries."""
+    import pandas as pd
+    from datetime import date, timedelta
+    from store import FOOD_SELECT, week_range, month_range
+    def legacy_summary(log):
+        df_f = pd.DataFrame(log)
+        out = [df_f['Calories'].sum(), df_f['Protein'].sum(), df_f['Carbs'].sum(), df_f['Fat'].sum()]
+        return out + [df_f[df_f["Meal"] == m]['Calories'].sum() for m in MEALS]
+    print(f"{'entries':>8} {'load+pandas ms':>15} {'today warm ms':>14} {'today cold ms':>14} {'new user ms':>12} {'week ms':>8} {'month ms':>9}")
+    rng, today = random.Random(0), date.today()
+    for y in years:
+        with tempfile.TemporaryDirectory() as tmp:
+            store, email = FitnessStore(os.path.join(tmp, "bench.db"), legacy_json=None), "user@example.com"
+            store.create_user(email, "pw"); store.create_user("new@example.com", "pw")
+            with store.transaction():
+                for d in range(y * 365):
+                    day = today - timedelta(days=d)
+                    for _ in range(per_day): store.add_food(email, {"Meal": rng.choice(MEALS), "Food": "Egg", "Grams": 100, "Calories": rng.uniform(50, 600), "Protein": 13, "Carbs": 1.1, "Fat": 11}, day)
+                    store.add_exercise(email, {"Exercise": "Yoga / Stretching", "Burned": 120}, day); store.set_water(email, 2.0, day)
+            conn = store._conn()
+            legacy_ms = timed(lambda: legacy_summary([dict(r) for r in conn.execute(f"SELECT {FOOD_SELECT} FROM food_log WHERE email=?", (email,))]), max(1, samples // 10))
+            warm_ms = timed(lambda: store.get_user(email)["totals"]["Calories"], samples)
+            cold = lambda who: lambda: (store._touch(conn, who), store.get_user(who))
+            cold_ms, new_ms = timed(cold(email), samples), timed(cold("new@example.com"), samples)
+            week_ms, month_ms = timed(lambda: store.get_history(email, *week_range()), samples), timed(lambda: store.get_history(email, *month_range()), samples)
+            print(f"{y * 365 * per_day:>8} {legacy_ms:>15.1f} {warm_ms:>14.3f} {cold_ms:>14.3f} {new_ms:>12.3f} {week_ms:>8.3f} {month_ms:>9.3f}")
+
+def bench_avatars(n_users, samples, distinct=500):
+    """DB size, cold user load and sidebar payload with base64 avatars inlined vs. extracted to files."""
+    import base64
+    from PIL import Image
+    from avatars import AvatarStore
+    rng = random.Random(0)
+    def jpeg(i):
+        # The old save path: <=150px JPEG. Photo-like noise keeps the size realistic (~10 KB).
+        img = Image.effect_noise((150, 150), 40 + i % 30).convert("RGB").resize((150, 150))
+        buf = io.BytesIO(); img.save(buf, format="JPEG"); return base64.b64encode(buf.getvalue()).decode()
+    pics = [jpeg(i) for i in range(distinct)]
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        store, avatars = FitnessStore(db, legacy_json=None), AvatarStore(root=os.path.join(tmp, "avatars"))
+        with store.transaction():
+            for i in range(n_users): store.create_user(f"user{i}@example.com", "pw", profile_pic=rng.choice(pics))
+        store.vacuum()
+        emails = [f"user{i}@example.com" for i in rng.sample(range(n_users), min(samples, n_users))]
+        def measure():
+            sidebar = lambda u: f'<img src="data:image/jpeg;base64,{u["profile_pic"]}">' if len(u["profile_pic"]) > 64 else f'<img src="{avatars.url(u["profile_pic"])}">'
+            it = iter(emails)
+            load_ms = timed(lambda: (store._touch(store._conn(), e := next(it)), store.get_user(e)), len(emails))
+            payload = statistics.mean(len(sidebar(store.get_user(e))) for e in emails)
+            render_ms = timed(lambda: sidebar(store.get_user(emails[0])), samples)
+            return os.path.getsize(db) / 1e6, load_ms, payload, render_ms
+        before = measure()
+        t0 = time.perf_counter(); moved = avatars.migrate(store); migrate_s = time.perf_counter() - t0
+        after = measure()
+        files = sum(len(f) for _, _, f in os.walk(avatars.root))
+        print(f"users={n_users}  distinct avatars={distinct}  extracted={moved} in {migrate_s:.1f}s  files={files}")
+        print(f"{'':>8} {'db MB':>8} {'cold load ms':>13} {'sidebar bytes':>14} {'sidebar ms':>11}")
+        for name, (mb, load_ms, payload, render_ms) in (("inline", before), ("files", after)):
+            print(f"{name:>8} {mb:>8.1f} {load_ms:>13.3f} {payload:>14.0f} {render_ms:>11.4f}")
+
+def bench_sms(n_users, rate, workers, latency_ms, fail_rate, budget):
+    """A full scheduler pass against a local fake HTTP gateway (latency, 503s and 429s), then a second pass."""
+    import threading
+    from collections import Counter
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from sms_scheduler import HTTPSender, run_pass
+    received, lock, rng = Counter(), threading.Lock(), random.Random(0)
+    class Gateway(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def log_message(self, *a): pass
+        def do_POST(self):
+            msg = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency_ms / 1000)
+            roll = random.random()
+            code = 503 if roll < fail_rate else 429 if roll < fail_rate * 1.5 else 200
+            if code == 200:
+                with lock: received[msg["to"]] += 1
+            self.send_response(code)
+            if code == 429: self.send_header("Retry-After", "0.1")
+            self.send_header("Content-Length", "0"); self.end_headers()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Gateway); server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/send"
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FitnessStore(os.path.join(tmp, "bench.db"), legacy_json=None)
+        t0 = time.perf_counter()
+        with store.transaction():
+            for i in range(n_users):
+                u = synthetic_user(i, rng)
+                store.create_user(f"user{i}@example.com", "pw", phone=f"05{i:08d}", sms_alerts=True, onboarding_done=True, profile=u["profile"])
+                if i % 3 == 0: store.add_food(f"user{i}@example.com", u["daily_log"][0])
+        print(f"users={n_users} (setup {time.perf_counter() - t0:.0f}s)  gateway latency={latency_ms}ms fail={fail_rate:.0%}  rate={rate}/s workers={workers} budget={budget}s")
+        sender = HTTPSender(url, pool_size=workers)
+        for n in (1, 2):
+            stats = run_pass(store, sender, rate=rate, workers=workers, budget=budget, log=open(os.devnull, "w"))
+            print(f"pass {n}: {stats}  -> {stats['sent'] / max(stats['seconds'], 1e-9):.0f} msg/s")
+        dupes = sum(1 for c in received.values() if c > 1)
+        print(f"gateway: {len(received):,} distinct phones, {sum(received.values()):,} deliveries, {dupes} duplicates")
+    server.shutdown()
+
+def bench_accounts(n_users, samples):
+    """Registration/rename at scale: the old full scan for a free username vs. the unique index; password hash cost."""
+    from credentials import hash_password
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FitnessStore(os.path.join(tmp, "bench.db"), legacy_json=None)
+        t0 = time.perf_counter()
+        with store.transaction() as conn:
+            conn.executemany("INSERT INTO users (email, password, username) VALUES (?, 'x', ?)", ((f"user{i}@example.com", f"user{i}") for i in range(n_users)))
+        print(f"users={n_users:,} (setup {time.perf_counter() - t0:.0f}s)")
+        users = {f"user{i}@example.com": {"username": f"user{i}"} for i in range(n_users)}
+        legacy_ms = timed(lambda: any(u.get("username") == "nobody" for e, u in users.items() if e != "user0@example.com"), 3)
+        del users
+        conn = store._conn()
+        scan_ms = timed(lambda: conn.execute("SELECT 1 FROM users NOT INDEXED WHERE username=? AND email IS NOT ?", ("nobody", "x")).fetchone(), 3)
+        taken_ms = timed(lambda: store.username_taken(f"user{rng.randrange(n_users)}", "x"), samples)
+        it = iter(range(10 ** 9))
+        # Colliding prefixes ("user5" exists) exercise the suffix search on every registration.
+        register_ms = timed(lambda: store.create_user(f"new{next(it)}@example.org", "x", f"user{rng.randrange(1000)}"), samples)
+        rename_ms = timed(lambda: store.update_user(f"user{rng.randrange(n_users)}@example.com", username=f"renamed{next(it)}"), samples)
+        print(f"username check: dict scan {legacy_ms:.1f} ms, SQL scan {scan_ms:.1f} ms, index {taken_ms:.3f} ms")
+        print(f"register (incl. free-name search) {register_ms:.3f} ms, rename {rename_ms:.3f} ms   (password hashing excluded)")
+    for n in (2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16):
+        print(f"scrypt N={n:>6} r=8: {timed(lambda: hash_password('correct horse', n=n), 5):6.1f} ms/hash")
+
+def bench_targets(n_users, chunk):
+    """Scalar vs. vectorized target calculation, and a full `targets.py recalc` over a store."""
+    import numpy as np
+    from targets import MULTIPLIERS, GOAL_SPLITS, calculate_targets, calculate_targets_batch, recalc
+    rng = random.Random(0)
+    goals = ["Weight Loss (Cut)", "Maintenance", "Lean Muscle Gain", "Bodybuilding (Bulk)"]
+    cols = ([rng.choice(["Male", "Female"]) for _ in range(n_users)], [rng.randint(16, 80) for _ in range(n_users)],
+            [round(rng.uniform(45, 140), 1) for _ in range(n_users)], [rng.randint(150, 200) for _ in range(n_users)],
+            [rng.choice(list(MULTIPLIERS)) for _ in range(n_users)], [rng.choice(goals) for _ in range(n_users)])
+    t0 = time.perf_counter(); ref = [calculate_targets(*row) for row in zip(*cols)]; scalar_s = time.perf_counter() - t0
+    t0 = time.perf_counter(); out = calculate_targets_batch(*cols); batch_s = time.perf_counter() - t0
+    same = all(np.array_equal(np.array([r[k] for r in ref]), out[k]) for k in range(5))
+    print(f"users={n_users:,}: scalar {scalar_s:.2f} s, batch {batch_s:.2f} s ({scalar_s / batch_s:.1f}x), identical={same}")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FitnessStore(os.path.join(tmp, "bench.db"), legacy_json=None)
+        with store.transaction() as conn:
+            conn.executemany("INSERT INTO users (email, password, username, onboarding_done, profile) VALUES (?, 'x', ?, 1, ?)",
+                ((f"user{i}@example.com", f"user{i}", json.dumps({"gender": cols[0][i], "age": cols[1][i], "height": cols[3][i], "activity": cols[4][i], "goal": cols[5][i]})) for i in range(n_users)))
+            conn.executemany('INSERT INTO weight_log (email, "Date", "Weight") VALUES (?, ?, ?)', ((f"user{i}@example.com", d, cols[2][i] + k) for i in range(n_users) for k, d in enumerate(("2024-01-01", "2024-02-01"))))
+        for label in ("first run", "no-op rerun"):
+            t0 = time.perf_counter(); stats = recalc(store, chunk, log=open(os.devnull, "w"))
+            print(f"recalc {label} (chunk {chunk:,}): {stats} in {time.perf_counter() - t0:.1f} s")
+        GOAL_SPLITS[1] = ("Maintenance", 0, (0.35, 0.35, 0.30))
+        t0 = time.perf_counter(); stats = recalc(store, chunk, log=open(os.devnull, "w"))
+        print(f"recalc after a macro-split change: {stats} in {time.perf_counter() - t0:.1f} s")
+
+def bench_weight(years, samples):
+    """Weight tab: the old full-history pandas/Plotly figure vs. cached, resampled and LTTB-downsampled series."""
+    import pandas as pd
+    import plotly.graph_objects as go
+    from trends import weight_series
+    def figure(x, y, ideal, trend=None):
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=x, y=y, mode='lines', name='Actual'))
+        if trend is not None: fig.add_trace(go.Scatter(x=x, y=trend, mode='lines', name='Trend'))
+        fig.add_trace(go.Scatter(x=x, y=ideal, mode='lines', name='Target'))
+        return fig
+    def legacy(log):
+        df_w = pd.DataFrame(log); df_w['Date'] = pd.to_datetime(df_w['Date'])
+        df_w['Ideal'] = df_w['Weight'].iloc[0] + (df_w['Date'] - df_w['Date'].iloc[0]).dt.days * -0.07
+        return figure(df_w['Date'], df_w['Weight'], df_w['Ideal'])
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FitnessStore(os.path.join(tmp, "bench.db"), legacy_json=None)
+        for y in years:
+            email, start = f"w{y}@example.com", date(2015, 1, 1)
+            store.create_user(email, "x")
+            with store.transaction():
+                for d in range(365 * y): store.upsert_weight(email, start + timedelta(days=d), 90 - d * 0.01 + rng.gauss(0, 0.6))
+            log = store.get_weights(email)
+            old_ms = timed(lambda: legacy(log).to_json(), samples)
+            old_kb = len(legacy(log).to_json()) / 1024
+            miss_ms = {res: timed(lambda: weight_series(store.get_weights(email), "Weight Loss", res), samples) for res in ("Daily", "Weekly", "Monthly")}
+            ws = weight_series(store.get_weights(email), "Weight Loss", "Daily")
+            hit_ms = timed(lambda: figure(ws["Date"], ws["Weight"], ws["Ideal"], ws["Trend"]).to_json(), samples)
+            new_kb = len(figure(ws["Date"], ws["Weight"], ws["Ideal"], ws["Trend"]).to_json()) / 1024
+            day = iter(range(365 * y, 10 ** 6))
+            append_ms = timed(lambda: store.upsert_weight(email, start + timedelta(days=next(day)), 80), samples)
+            print(f"{y:>2}y ({len(log):,} weigh-ins): old {old_ms:.1f} ms/rerun, {old_kb:.0f} KB figure | "
+                  f"new {hit_ms:.1f} ms/rerun (cached), {new_kb:.0f} KB; recompute on change "
+                  + ", ".join(f"{k.lower()} {v:.1f}" for k, v in miss_ms.items()) + f" ms; weigh-in {append_ms:.2f} ms")
+
+def bench_metrics(calls):
+    """Per-call cost of the instrumentation primitives with metrics off and on, and on a cached get_user()."""
+    import importlib
+    import metrics
+    import store as store_mod
+    for label, env in (("off", {}), ("on", {"METRICS_ADMINS": "bench@example.com"})):
+        for k in ("METRICS_LOG", "METRICS_PORT", "METRICS_ADMINS"): os.environ.pop(k, None)
+        os.environ.update(env)
+        importlib.reload(metrics); importlib.reload(store_mod)
+        f = metrics.timed("bench.fn")(lambda: None)
+        def spans():
+            for _ in range(calls):
+                with metrics.span("bench.span"): pass
+        def counts():
+            for _ in range(calls): metrics.count("bench.count")
+        def fns():
+            for _ in range(calls): f()
+        with tempfile.TemporaryDirectory() as tmp:
+            s = store_mod.FitnessStore(os.path.join(tmp, "bench.db"), legacy_json=None)
+            s.create_user("u@example.com", "x"); s.get_user("u@example.com")
+            get_ms = timed(lambda: s.get_user("u@example.com"), 2000)
+        metrics.begin_rerun("bench")
+        ns = {name: timed(fn, 5) * 1e6 / calls for name, fn in (("span", spans), ("count", counts), ("timed", fns))}
+        metrics.end_rerun()
+        print(f"metrics {label:>3}: " + ", ".join(f"{k} {v:.0f} ns" for k, v in ns.items()) + f"; cached get_user {get_ms * 1000:.1f} us")
+
+# Runs a script or snippet in a child process and reports its peak RSS (ru_maxrss, KB on Linux).
+_PEAK = """import resource, runpy, sys
+sys.argv = sys.argv[1:]
+try: runpy.run_path(sys.argv[0], run_name="__main__") if sys.argv[0].endswith(".py") else exec(sys.argv[0])
+finally: print("peak_kb", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)"""
+
+def peak_run(*argv):
+    """(seconds, peak RSS MB) of one child run."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    t0 = time.perf_counter()
+    res = subprocess.run([sys.executable, "-c", _PEAK, *argv], capture_output=True, text=True, cwd=here, env={**os.environ, "PYTHONPATH": here})
+    seconds = time.perf_counter() - t0
+    if res.returncode: raise RuntimeError(res.stderr[-2000:])
+    return seconds, int(res.stderr.rsplit("peak_kb", 1)[1]) / 1024
+
+def bench_io(sizes, days, formats, chunk):
+    """Peak RSS of diary_io export/import and of the legacy JSON migration as the store grows: flat means streaming."""
+    rng, start = random.Random(0), date(2024, 1, 1)
+    days_ = [str(start + timedelta(days=d)) for d in range(days)]
+    base = {name: peak_run(stmt)[1] for name, stmt in (("imports", "import diary_io"), ("with pyarrow", "import diary_io, pyarrow.parquet"))}
+    print("baseline RSS: " + ", ".join(f"{k} {v:.0f} MB" for k, v in base.items()) + f"; {days} days per user, 4 meals + 1 workout + weight + water a day")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            db = os.path.join(tmp, f"src{n}.db")
+            store = FitnessStore(db, legacy_json=None)
+            with store.transaction() as conn:
+                conn.executemany("INSERT INTO users (email, password, username) VALUES (?, 'x', ?)", ((f"user{i}@example.com", f"user{i}") for i in range(n)))
+                for i in range(n):
+                    e = f"user{i}@example.com"
+                    conn.executemany(f'INSERT INTO food_log (email, "Date", "Meal", "Food", "Grams", "Calories", "Protein", "Carbs", "Fat") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                     ((e, d, m, "Chicken Breast (Cooked)", 150.0, 247.5, 46.5, 0.0, 5.4) for d in days_ for m in MEALS))
+                    conn.executemany('INSERT INTO exercise_log (email, "Date", "Exercise", "Burned") VALUES (?, ?, ?, ?)', ((e, d, "Running", 300.0) for d in days_))
+                    conn.executemany('INSERT INTO weight_log (email, "Date", "Weight", "Trend") VALUES (?, ?, ?, ?)', ((e, d, 80.0 + rng.random(), 80.0) for d in days_))
+                    conn.executemany('INSERT INTO water_log (email, "Date", liters) VALUES (?, ?, ?)', ((e, d, 2.5) for d in days_))
+            store.vacuum()
+            rows, db_mb = n * days * 7, os.path.getsize(db) / 2 ** 20
+            print(f"users={n:,}: {rows:,} log rows, {db_mb:.0f} MB database")
+            for fmt in formats:
+                out, target = os.path.join(tmp, f"out{n}.{fmt}"), os.path.join(tmp, f"dst{n}.db")
+                exp_s, exp_mb = peak_run("diary_io.py", "export", "--db", db, "--out", out, "--format", fmt, "--chunk", str(chunk))
+                size_mb = sum(os.path.getsize(os.path.join(out, f)) for f in os.listdir(out)) / 2 ** 20
+                shutil.copy(db, target)   # same users, so every row is a replace
+                imp_s, imp_mb = peak_run("diary_io.py", "import", out, "--db", target, "--chunk", str(chunk))
+                print(f"  {fmt:>7}: {size_mb:6.0f} MB | export {exp_s:6.1f} s ({rows / exp_s / 1000:4.0f}k rows/s), peak {exp_mb:4.0f} MB"
+                      f" | import {imp_s:6.1f} s ({rows / imp_s / 1000:4.0f}k rows/s), peak {imp_mb:4.0f} MB")
+                shutil.rmtree(out); os.remove(target)
+            legacy = os.path.join(tmp, f"legacy{n}.json")
+            with open(legacy, "w", encoding="utf-8") as f:
+                f.write('{"users": {')
+                for i in range(n):
+                    u = synthetic_user(i, rng, days)
+                    u["daily_log"] = [{"Meal": m, "Food": "Chicken Breast (Cooked)", "Grams": 150.0, "Calories": 247.5, "Protein": 46.5, "Carbs": 0.0, "Fat": 5.4} for d in days_ for m in MEALS]
+                    f.write(("," if i else "") + json.dumps(f"user{i}@example.com") + ": " + json.dumps(u))
+                f.write("}}")
+            snippet = "import json, sys\n{}\nfor e, u in users: pass"
+            _, load_mb = peak_run(snippet.format("users = json.load(open(sys.argv[1], encoding='utf-8'))['users'].items()"), legacy)
+            _, stream_mb = peak_run(snippet.format("from store import iter_legacy_users; users = iter_legacy_users(sys.argv[1])"), legacy)
+            print(f"  legacy JSON {os.path.getsize(legacy) / 2 ** 20:.0f} MB: json.load peak {load_mb:.0f} MB, iter_legacy_users peak {stream_mb:.0f} MB")
+            os.remove(legacy); os.remove(db)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("rerun", help="rerun latency vs. number of users")
+    p.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    p.add_argument("--samples", type=int, default=50)
+    p = sub.add_parser("search", help="food search latency on a synthetic catalog")
+    p.add_argument("--items", type=int, default=500000)
+    p.add_argument("--samples", type=int, default=50)
+    p = sub.add_parser("lookup", help="UI blocking time with a fake slow translator/OFF backend")
+    p.add_argument("--translate-ms", type=int, default=300)
+    p.add_argument("--remote-ms", type=int, default=800)
+    p.add_argument("--keystrokes", type=int, default=8)
+    p = sub.add_parser("barcode", help="camera barcode decode rate/latency on a synthetic photo corpus (needs libzbar)")
+    p.add_argument("--images", type=int, default=20, help="photos per condition")
+    p.add_argument("--workers", type=int, default=4)
+    p = sub.add_parser("summary", help="Summary tab aggregates for users with years of diary entries")
+    p.add_argument("--years", type=int, nargs="+", default=[1, 3, 5])
+    p.add_argument("--samples", type=int, default=50)
+    p = sub.add_parser("avatars", help="inline base64 avatars vs. content-addressed files")
+    p.add_argument("--users", type=int, default=5000)
+    p.add_argument("--samples", type=int, default=200)
+    p = sub.add_parser("sms", help="SMS scheduler pass against a local fake gateway")
+    p.add_argument("--users", type=int, default=100000)
+    p.add_argument("--rate", type=float, default=500)
+    p.add_argument("--workers", type=int, default=64)
+    p.add_argument("--latency-ms", type=float, default=20)
+    p.add_argument("--fail-rate", type=float, default=0.02)
+    p.add_argument("--budget", type=float, default=300)
+    p = sub.add_parser("accounts", help="username index and password hashing at 1M users")
+    p.add_argument("--users", type=int, default=1000000)
+    p.add_argument("--samples", type=int, default=200)
+    p = sub.add_parser("targets", help="vectorized bulk target recalculation")
+    p.add_argument("--users", type=int, default=1000000)
+    p.add_argument("--chunk", type=int, default=5000)
+    p = sub.add_parser("weight", help="Weight tab chart cost vs. years of daily weigh-ins")
+    p.add_argument("--years", type=int, nargs="+", default=[1, 3, 5, 10])
+    p.add_argument("--samples", type=int, default=20)
+    p = sub.add_parser("metrics", help="instrumentation overhead, metrics off vs. on")
+    p.add_argument("--calls", type=int, default=200000)
+    p = sub.add_parser("io", help="diary export/import and legacy JSON migration: peak memory vs. store size")
+    p.add_argument("--users", type=int, nargs="+", default=[1000, 4000, 16000])
+    p.add_argument("--days", type=int, default=90)
+    p.add_argument("--formats", nargs="+", default=["csv", "ndjson", "parquet"])
+    p.add_argument("--chunk", type=int, default=5000)
+    args = parser.parse_args()
+    if args.cmd == "rerun": bench_rerun(args.users, args.samples)
+    elif args.cmd == "search": bench_search(args.items, args.samples)
+    elif args.cmd == "lookup": bench_lookup(args.translate_ms, args.remote_ms, args.keystrokes)
+    elif args.cmd == "barcode": bench_barcode(args.images, args.workers)
+    elif args.cmd == "summary": bench_summary(args.years, args.samples)
+    elif args.cmd == "avatars": bench_avatars(args.users, args.samples)
+    elif args.cmd == "sms": bench_sms(args.users, args.rate, args.workers, args.latency_ms, args.fail_rate, args.budget)
+    elif args.cmd == "accounts": bench_accounts(args.users, args.samples)
+    elif args.cmd == "targets": bench_targets(args.users, args.chunk)
+    elif args.cmd == "weight": bench_weight(args.years, args.samples)
+    elif args.cmd == "metrics": bench_metrics(args.calls)
+    elif args.cmd == "io": bench_io(args.users, args.days, args.formats, args.chunk)
+
+if __name__ == "__main__":
+    main()
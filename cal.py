@@ -1,36 +1,62 @@
 import streamlit as st
 import pandas as pd
-import requests
-from PIL import Image, ImageEnhance
-from pyzbar.pyzbar import decode
 from deep_translator import GoogleTranslator
 import plotly.express as px
 import plotly.graph_objects as go
-import base64
 from datetime import date
-import json
-import os
-import io
 import time
+from store import FitnessStore, UsernameTaken, week_range, month_range
+from credentials import Credentials
+from food_search import build_default_index
+from off_client import OFFClient
+from lookup import LookupService, replace_lookup
+from translate import TranslationTable
+from barcode import decode_barcode
+from avatars import AvatarStore, is_digest
+from alerts import generate_sms_alert, send_real_sms_mock, remaining
+from targets import calculate_targets, recommended_water, DEFAULT_WEIGHT
+from trends import weight_series, RESOLUTIONS
+from diary_io import user_archive, APP_FORMATS
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import metrics
+
+metrics.begin_rerun(getattr(get_script_run_ctx(), "session_id", "local"))
 
 # --- 0. Database Setup (Persistence) ---
-DB_FILE = "myfitness_users_db.json"
+# SQLite (WAL) store; the legacy JSON file is migrated into it once on first open.
+DB_FILE = "myfitness.db"
+LEGACY_DB_FILE = "myfitness_users_db.json"
 
-def load_db():
-    if os.path.exists(DB_FILE):
-        try:
-            with open(DB_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except: return {"users": {}}
-    return {"users": {}}
+@st.cache_resource(show_spinner=False)
+def get_store():
+    return FitnessStore(DB_FILE, legacy_json=LEGACY_DB_FILE)
 
-def sync_db():
-    with open(DB_FILE, "w", encoding="utf-8") as f:
-        json.dump(db, f, indent=4)
+store = get_store()
 
-db = load_db()
+@st.cache_resource(show_spinner=False)
+def get_metrics_server():
+    # Prometheus text on METRICS_PORT, once per process (see metrics.py).
+    return metrics.serve() if metrics.METRICS_PORT else None
 
-# --- 1. Constants & Motivations ---
+get_metrics_server()
+
+@st.cache_resource(show_spinner=False)
+def get_credentials():
+    credentials = Credentials(store)
+    credentials.migrate_in_background()  # one-time: plaintext passwords from the legacy JSON store; logins rehash meanwhile
+    return credentials
+
+get_credentials()
+
+@st.cache_resource(show_spinner=False)
+def get_avatars():
+    avatars = AvatarStore()
+    avatars.migrate(store)  # one-time: base64 avatars still inlined in the user rows
+    return avatars
+
+get_avatars()  # at start-up, not on first use: a legacy avatar is not a digest, so nothing else would trigger it
+
+# --- 1. Constants ---
 EXERCISE_METS = {
     "Weightlifting (Standard)": 5.0, "Weightlifting (Heavy)": 6.0,
     "Running (10 km/h)": 9.8, "Running (12 km/h)": 11.8,
@@ -52,68 +78,43 @@ OFFLINE_DB = {
     "bamba": {"cals": 534, "prot": 15.0, "carb": 40.0, "fat": 35.0}
 }
 
-MOTIVATIONS = {
-    "Weight Loss (Cut)": "קצת רעב עכשיו = תוצאות מחר! תמשיך בגירעון הקלורי, אתה בדרך הנכונה. 💪",
-    "Maintenance": "הסוד הוא התמדה! לשמור על מאזן זה לא קל, אבל אתה עושה את זה מעולה. ⚖️",
-    "Lean Muscle Gain": "כל אימון וכל ארוחה בונים אותך. אל תשכח את החלבון שלך היום! 🥩",
-    "Bodybuilding (Bulk)": "כדי לגדול צריך לאכול! אל תפחד מהפחמימות, הן הדלק שלך לאימון. 🚀"
-}
-
 # --- 2. Core Functions ---
-@st.cache_data(show_spinner=False)
-def translate_query(query):
-    try: return GoogleTranslator(source='auto', target='en').translate(query).lower()
-    except: return query.lower()
+@st.cache_resource(show_spinner=False)
+def get_food_index():
+    # Catalog built once per process from OFFLINE_DB + fitness_db.json; each user's custom foods get their own small index.
+    return build_default_index(OFFLINE_DB)
 
-def get_food_by_barcode(barcode):
-    url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json"
-    try:
-        res = requests.get(url, timeout=5)
-        if res.status_code == 200 and res.json().get("status") == 1: return res.json().get("product")
+def google_translate(query):
+    try: return GoogleTranslator(source='auto', target='en').translate(query).lower()
     except: return None
-    return None
-
-def robust_global_search(en_query):
-    results, url = [], "https://world.openfoodfacts.org/cgi/search.pl"
-    try:
-        res = requests.get(url, params={"action": "process", "search_terms": en_query, "json": "True", "fields": "product_name,nutriments,brands"}, timeout=5)
-        if res.status_code == 200: results.extend(res.json().get("products", []))
-    except: pass
-    seen, unique = set(), []
-    for p in results:
-        name = p.get('product_name')
-        if name and name not in seen: seen.add(name); unique.append(p)
-    return unique
-
-def calculate_targets(gender, age, weight, height, activity, goal):
-    multipliers = {"Sedentary": 1.2, "Lightly active": 1.375, "Moderately active": 1.55, "Very active": 1.725, "Super active": 1.9}
-    bmr = (10 * weight) + (6.25 * height) - (5 * age) + (5 if gender == "Male" else -161)
-    tdee = bmr * multipliers[activity]
-    if "Weight Loss" in goal: cals = int(tdee - 500); p_pct, c_pct, f_pct = 0.40, 0.35, 0.25
-    elif "Maintenance" in goal: cals = int(tdee); p_pct, c_pct, f_pct = 0.30, 0.40, 0.30
-    elif "Muscle" in goal: cals = int(tdee + 300); p_pct, c_pct, f_pct = 0.25, 0.50, 0.25
-    else: cals = int(tdee + 500); p_pct, c_pct, f_pct = 0.30, 0.50, 0.20
-    prot, carb, fat = int((cals*p_pct)/4), int((cals*c_pct)/4), int((cals*f_pct)/9)
-    water = round((weight * 35) / 1000 + (0.75 if "active" in activity.lower() else 0), 1)
-    return cals, prot, carb, fat, water
-
-def generate_sms_alert(user_data, rem_c, rem_p, rem_water, goal):
-    msg = ""
-    if rem_water > 0.5: msg += f"💧 חסר לך עדיין {rem_water:.1f} ליטר מים ליעד! אל תשכח לשתות.\n"
-    if rem_p > 20: msg += f"🥩 יש לך עוד {rem_p:.0f} גרם חלבון להשלים היום בשביל השרירים.\n"
-    if rem_c > 300: msg += f"🔥 נשארו לך {rem_c:.0f} קלוריות! זמן לארוחה טובה.\n"
-    if not msg: msg = "🏆 עמדת בכל היעדים שלך להיום! עבודה מדהימה."
-    msg += f"\n💡 {MOTIVATIONS.get(goal, '')}"
-    return msg
-
-def send_real_sms_mock(phone_number, text_message):
-    """
-    זו הפונקציה שבעתיד תתחבר ל-API אמיתי כמו Twilio.
-    כרגע היא רק מדמה שליחה.
-    """
-    # example real code: requests.post("https://api.twilio.com/...", data={"to": phone_number, "body": text_message})
-    print(f"MOCK SMS SENT TO {phone_number}: {text_message}")
-    return True
+
+@st.cache_resource(show_spinner=False)
+def get_translator():
+    # Offline Hebrew->English table first; GoogleTranslator only for unknown words, and its answers are learned.
+    return TranslationTable(remote=google_translate)
+
+@st.cache_resource(show_spinner=False)
+def get_off_client():
+    # One pooled session, cache and local OFF table (if imported) shared by every session in the process.
+    return OFFClient.from_env()
+
+@st.cache_data(max_entries=2048, show_spinner=False)
+def weight_chart_series(email, weight_version, goal, resolution, _rows):
+    # weight_version changes on every weigh-in, so a cached series is never stale; _rows (store.weight_series) is not hashed.
+    metrics.count("weight_chart.miss")
+    return weight_series(_rows, goal, resolution)
+
+@st.cache_resource(show_spinner=False)
+def get_lookup_service():
+    # Translation + OFF calls run on a shared pool; workers get plain callables, not st.cache_* wrappers.
+    client = get_off_client()
+    return LookupService(get_translator().translate, client.search, client.product)
+
+@st.fragment(run_every=0.5)
+def await_lookup(lk):
+    # Polls the background lookup and triggers one full rerun once its results are in.
+    if lk.pending: st.caption("🌍 Searching the global database...")
+    else: st.rerun()
 
 # --- 3. Soft UI Config ---
 st.set_page_config(page_title="MyFitness Pro", page_icon="🍏", layout="centered")
@@ -142,7 +143,7 @@ if 'camera_active' not in st.session_state: st.session_state.camera_active = Fal
 
 if not st.session_state.logged_in and "user" in st.query_params:
     saved_user = st.query_params["user"]
-    if saved_user in db["users"]:
+    if store.user_exists(saved_user):
         st.session_state.logged_in = True
         st.session_state.current_user = saved_user
 
@@ -158,17 +159,19 @@ if not st.session_state.logged_in:
             if st.session_state.auth_mode == "Login":
                 st.markdown("### 👋 Welcome Back")
                 with st.form("login_form"):
-                    le = st.text_input("📧 Email").lower().strip()
+                    le = st.text_input("📧 Email or Username").strip()
                     lp = st.text_input("🔒 Password", type="password")
                     remember = st.checkbox("💾 Remember Me", value=True)
                     submit_btn = st.form_submit_button("Log In", type="primary", use_container_width=True)
                     if submit_btn:
-                        if le in db["users"] and db["users"][le]["password"] == lp:
+                        le = le.lower() if "@" in le else (store.email_for_username(le) or le.lower())
+                        with st.spinner("Signing in..."): ok = get_credentials().verify(le, lp).result()
+                        if ok:
                             st.session_state.logged_in = True
                             st.session_state.current_user = le
                             if remember: st.query_params["user"] = le 
                             st.rerun()
-                        else: st.error("Wrong email or password.")
+                        else: st.error("Wrong email/username or password.")
                 st.write("")
                 if st.button("New here? Create Account", use_container_width=True): 
                     st.session_state.auth_mode = "Register"; st.rerun()
@@ -180,9 +183,10 @@ if not st.session_state.logged_in:
                     rp = st.text_input("🔒 Password", type="password")
                     reg_btn = st.form_submit_button("Get Started", type="primary", use_container_width=True)
                     if reg_btn:
-                        if re in db["users"]: st.error("Account exists!")
+                        if store.user_exists(re): st.error("Account exists!")
                         elif re and len(rp) >= 4:
-                            st.session_state.temp_reg = {"e": re, "p": rp}; st.session_state.auth_mode = "Verify"; st.rerun()
+                            with st.spinner("Securing your password..."): st.session_state.temp_reg = {"e": re, "p": get_credentials().hash(rp).result()}
+                            st.session_state.auth_mode = "Verify"; st.rerun()
                         else: st.error("Enter valid email and password (min 4 chars)")
                 if st.button("⬅️ Back to Login"): st.session_state.auth_mode = "Login"; st.rerun()
                 
@@ -194,22 +198,17 @@ if not st.session_state.logged_in:
                     if v_btn:
                         if vc == "1234":
                             email = st.session_state.temp_reg["e"]
-                            db["users"][email] = {
-                                "password": st.session_state.temp_reg["p"], "username": email.split('@')[0], "profile_pic": "", "phone": "", "sms_alerts": False,
-                                "onboarding_done": False, "profile": {}, "daily_log": [], "exercise_log": [], "weight_log": [], "custom_foods": {}, "water_liters": 0.0
-                            }
-                            sync_db(); st.session_state.logged_in = True; st.session_state.current_user = email; st.query_params["user"] = email; st.rerun()
+                            store.create_user(email, st.session_state.temp_reg["p"], email.split('@')[0])
+                            st.session_state.logged_in = True; st.session_state.current_user = email; st.query_params["user"] = email; st.rerun()
 
 # ==========================================
 # MAIN APP
 # ==========================================
 else:
-    user_data = db["users"][st.session_state.current_user]
-    
-    if "username" not in user_data: user_data["username"] = st.session_state.current_user.split('@')[0]
-    if "profile_pic" not in user_data: user_data["profile_pic"] = ""
-    if "phone" not in user_data: user_data["phone"] = ""
-    if "sms_alerts" not in user_data: user_data["sms_alerts"] = False
+    email = st.session_state.current_user
+    user_data = store.get_user(email)
+    if user_data is None:
+        st.session_state.logged_in = False; st.query_params.clear(); st.rerun()
     
     if not user_data.get("onboarding_done", False):
         st.markdown("<h2 style='text-align: center;'>🎯 Let's build your plan</h2>", unsafe_allow_html=True)
@@ -223,27 +222,28 @@ else:
             goal = st.selectbox("🎯 Your Goal", ["Weight Loss (Cut)", "Maintenance", "Lean Muscle Gain", "Bodybuilding (Bulk)"])
             if st.button("🚀 Calculate My Plan", type="primary", use_container_width=True):
                 cals, prot, carb, fat, water = calculate_targets(gen, age, weight, height, act, goal)
-                user_data.update({"profile": {"gender": gen, "age": age, "height": height, "activity": act, "goal": goal, "targets": {"cals": cals, "prot": prot, "carb": carb, "fat": fat, "water": water}}, "weight_log": [{"Date": str(date.today()), "Weight": weight}], "onboarding_done": True})
-                sync_db(); st.rerun()
+                with store.transaction():
+                    store.update_user(email, profile={"gender": gen, "age": age, "height": height, "activity": act, "goal": goal, "targets": {"cals": cals, "prot": prot, "carb": carb, "fat": fat, "water": water}}, onboarding_done=True)
+                    store.upsert_weight(email, date.today(), weight)
+                st.rerun()
 
     else:
         profile = user_data["profile"]
         targets = profile["targets"]
-        w_log = user_data.get("weight_log", [])
-        try: current_weight = sorted(w_log, key=lambda x: x["Date"])[-1]["Weight"] if w_log else 75.0
-        except: current_weight = 75.0
-        recommended_water = calculate_targets(profile["gender"], profile["age"], current_weight, profile["height"], profile["activity"], profile["goal"])[4]
+        current_weight = user_data.get("weight") or DEFAULT_WEIGHT  # the latest weigh-in
+        rec_water = recommended_water(current_weight, profile["activity"])
 
         # --- SIDEBAR MENU ---
         with st.sidebar:
             c1, c2 = st.columns([1, 2.5])
-            pic_b64 = user_data.get("profile_pic", "")
+            pic = user_data.get("profile_pic", "")
             with c1:
-                if pic_b64: st.markdown(f'<img src="data:image/jpeg;base64,{pic_b64}" style="width:65px; height:65px; border-radius:50%; object-fit:cover; border:2px solid #3b82f6;">', unsafe_allow_html=True)
+                if is_digest(pic): st.markdown(f'<img src="{get_avatars().url(pic)}" style="width:65px; height:65px; border-radius:50%; object-fit:cover; border:2px solid #3b82f6;">', unsafe_allow_html=True)
                 else: st.markdown(f"<div style='font-size: 55px;'>👤</div>", unsafe_allow_html=True)
             with c2:
                 st.markdown(f"<h3 style='margin-bottom:0px; padding-top:10px;'>{user_data.get('username')}</h3>", unsafe_allow_html=True)
                 if st.button("🚪 Logout", use_container_width=True): 
+                    get_food_index().drop_owner(email)  # rebuilt from the profile if another session searches
                     st.session_state.logged_in = False; st.query_params.clear(); st.rerun()
             st.divider()
 
@@ -258,19 +258,14 @@ else:
                 new_pic = st.file_uploader("Upload Avatar", type=["jpg", "jpeg", "png"])
                 
                 if st.button("💾 Save Settings", use_container_width=True):
-                    taken = any(u.get("username") == new_username for k, u in db["users"].items() if k != st.session_state.current_user)
+                    taken = store.username_taken(new_username, exclude_email=email)
                     if taken: st.error("Username is taken!")
                     else:
-                        user_data["username"] = new_username
-                        user_data["phone"] = new_phone
-                        user_data["sms_alerts"] = sms_toggle
-                        if new_pic:
-                            img = Image.open(new_pic).convert("RGB")
-                            img.thumbnail((150, 150))
-                            buffered = io.BytesIO()
-                            img.save(buffered, format="JPEG")
-                            user_data["profile_pic"] = base64.b64encode(buffered.getvalue()).decode()
-                        sync_db()
+                        changes = {"username": new_username, "phone": new_phone, "sms_alerts": sms_toggle}
+                        if new_pic: changes["profile_pic"] = get_avatars().put(new_pic)
+                        try: store.update_user(email, **changes)
+                        except UsernameTaken: st.error("Username is taken!"); st.stop()
+                        user_data.update(changes)
                         
                         # --- SMS WELCOME LOGIC ---
                         # If user just enabled SMS or changed their phone number while SMS is enabled
@@ -293,7 +288,7 @@ else:
                 if st.button("🔄 Recalculate Targets", use_container_width=True):
                     c, p, cb, f, w = calculate_targets(new_gen, new_age, current_weight, new_height, new_act, new_goal)
                     user_data["profile"].update({"gender": new_gen, "age": new_age, "height": new_height, "activity": new_act, "goal": new_goal, "targets": {"cals": c, "prot": p, "carb": cb, "fat": f, "water": w}})
-                    sync_db(); st.success("Updated!"); st.rerun()
+                    store.update_user(email, profile=user_data["profile"]); st.success("Updated!"); st.rerun()
                 
             with st.expander("🎯 Edit Targets Manually"):
                 t_cals = st.number_input("🔥 Calories", value=targets["cals"], step=50)
@@ -301,37 +296,45 @@ else:
                 t_carb = st.number_input("🍞 Carbs (g)", value=targets["carb"], step=5)
                 t_fat = st.number_input("🥑 Fat (g)", value=targets["fat"], step=5)
                 if st.button("💾 Save Manual Targets", use_container_width=True):
-                    user_data["profile"]["targets"].update({"cals": t_cals, "prot": t_prot, "carb": t_carb, "fat": t_fat}); sync_db(); st.rerun()
+                    user_data["profile"]["targets"].update({"cals": t_cals, "prot": t_prot, "carb": t_carb, "fat": t_fat}); store.update_user(email, profile=user_data["profile"]); st.rerun()
+
+            with st.expander("📦 Export My Diary"):
+                exp_fmt = st.radio("Format", APP_FORMATS, horizontal=True, format_func=str.upper)
+                # A callable is only run when the button is clicked, on its own thread: reruns never build the archive.
+                st.download_button("⬇️ Download Food, Exercise, Weight & Water", data=lambda: user_archive(store, email, exp_fmt),
+                                   file_name=f"myfitness_{user_data.get('username')}_{date.today()}.zip", mime="application/zip", use_container_width=True)
 
             st.divider()
             st.markdown("### 💧 Hydration Station")
-            user_water_goal = st.number_input("🎯 Goal (L)", value=float(targets.get("water", recommended_water)), step=0.25)
-            if user_water_goal != targets.get("water"): user_data["profile"]["targets"]["water"] = user_water_goal; sync_db()
+            user_water_goal = st.number_input("🎯 Goal (L)", value=float(targets.get("water", rec_water)), step=0.25)
+            if user_water_goal != targets.get("water"): user_data["profile"]["targets"]["water"] = user_water_goal; store.update_user(email, profile=user_data["profile"])
             
             w_c1, w_c2, w_c3 = st.columns([1,1,1])
-            if w_c1.button("➖", use_container_width=True): user_data["water_liters"] = max(0.0, user_data.get("water_liters", 0.0) - 0.25); sync_db()
+            if w_c1.button("➖", use_container_width=True): user_data["water_liters"] = store.add_water(email, -0.25)
             w_c2.markdown(f"<h3 style='text-align:center; color:#3b82f6;'>{user_data.get('water_liters', 0.0):.2f}L</h3>", unsafe_allow_html=True)
-            if w_c3.button("➕", use_container_width=True): user_data["water_liters"] = user_data.get("water_liters", 0.0) + 0.25; sync_db()
+            if w_c3.button("➕", use_container_width=True): user_data["water_liters"] = store.add_water(email, 0.25)
             st.progress(min(user_data.get("water_liters", 0.0) / user_water_goal, 1.0) if user_water_goal > 0 else 0)
 
+            if email.lower() in metrics.METRICS_ADMINS:
+                mx = st.expander("📈 Metrics", key="exp_metrics", on_change="rerun")
+                with mx:
+                    if mx.open:
+                        spans, counters = metrics.REGISTRY.snapshot()
+                        st.dataframe(spans, hide_index=True, use_container_width=True)
+                        st.dataframe([{"event": k, "count": v} for k, v in sorted(counters.items())], hide_index=True, use_container_width=True)
+
         # --- MAIN TABS ---
         st.markdown("<h1 class='app-title'>⚡ MyFitness Pro</h1>", unsafe_allow_html=True)
         t_dash, t_add, t_ex, t_weight, t_custom = st.tabs(["📊 Summary", "🍏 Add Food", "👟 Exercise", "📈 Weight", "👨‍🍳 Recipes"])
 
         # TAB 1: DASHBOARD
         with t_dash:
-            df_f = pd.DataFrame(user_data.get("daily_log", []))
-            if df_f.empty: df_f = pd.DataFrame(columns=["Meal", "Food", "Grams", "Calories", "Protein", "Carbs", "Fat"])
-            df_e = pd.DataFrame(user_data.get("exercise_log", []))
-            if df_e.empty: df_e = pd.DataFrame(columns=["Exercise", "Burned"])
-
-            t_food, t_burn = df_f['Calories'].sum(), df_e['Burned'].sum()
-            rem_c = targets["cals"] - (t_food - t_burn)
+            totals = user_data["totals"]
+            t_food, t_burn = totals["Calories"], totals["Burned"]
+            rem_c, rem_p, rem_w = remaining(targets, t_food, t_burn, totals["Protein"], user_data.get("water_liters", 0.0))
             
             # --- NOTIFICATIONS HUB ---
             if user_data.get("sms_alerts") and user_data.get("phone"):
-                rem_p = max(0, targets["prot"] - df_f['Protein'].sum())
-                rem_w = max(0, targets["water"] - user_data.get("water_liters", 0.0))
                 sms_text = generate_sms_alert(user_data, rem_c, rem_p, rem_w, profile.get("goal"))
                 
                 st.info(f"📱 **SMS Alerts Active ({user_data['phone']})**")
@@ -354,30 +357,49 @@ else:
             col_ma, col_pi = st.columns([1.2, 1])
             with col_ma:
                 st.markdown("### 🥩 Macros")
-                for m, cur, goal, color, icon in [("Protein", df_f['Protein'].sum(), targets["prot"], "#ef4444", "🥩"), ("Carbs", df_f['Carbs'].sum(), targets["carb"], "#3b82f6", "🍞"), ("Fat", df_f['Fat'].sum(), targets["fat"], "#10b981", "🥑")]:
+                for m, cur, goal, color, icon in [("Protein", totals['Protein'], targets["prot"], "#ef4444", "🥩"), ("Carbs", totals['Carbs'], targets["carb"], "#3b82f6", "🍞"), ("Fat", totals['Fat'], targets["fat"], "#10b981", "🥑")]:
                     diff = goal - cur
                     status = f"{diff:.0f}g left" if diff >= 0 else f"⚠️ Over {abs(diff):.0f}g"
                     st.markdown(f"**{icon} {m}:** {cur:.0f}g / {goal}g | <span style='color:{color if diff >= 0 else '#dc2626'}; font-weight:600;'>{status}</span>", unsafe_allow_html=True)
                     st.progress(min(cur / goal, 1.0) if goal > 0 else 0)
             with col_pi:
-                fig = px.pie(pd.DataFrame({"M": ["Pro", "Carb", "Fat"], "G": [df_f['Protein'].sum(), df_f['Carbs'].sum(), df_f['Fat'].sum()]}), values='G', names='M', hole=0.5, color_discrete_sequence=['#ef4444', '#3b82f6', '#10b981'])
-                fig.update_layout(height=180, showlegend=False, margin=dict(t=0, b=0, l=0, r=0))
-                st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
+                with metrics.span("ui.macro_pie"):
+                    fig = px.pie(pd.DataFrame({"M": ["Pro", "Carb", "Fat"], "G": [totals['Protein'], totals['Carbs'], totals['Fat']]}), values='G', names='M', hole=0.5, color_discrete_sequence=['#ef4444', '#3b82f6', '#10b981'])
+                    fig.update_layout(height=180, showlegend=False, margin=dict(t=0, b=0, l=0, r=0))
+                    st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
 
             st.markdown("### 🍽️ Meals Diary")
             for meal, icon in [("Breakfast", "🍳"), ("Lunch", "🥗"), ("Dinner", "🍱"), ("Snacks", "🍎")]:
-                m_data = df_f[df_f["Meal"] == meal]
-                with st.expander(f"{icon} {meal} | {m_data['Calories'].sum():.0f} kcal"):
-                    if not m_data.empty:
-                        edited = st.data_editor(m_data.drop(columns=["Meal"]), hide_index=True, use_container_width=True, key=f"d_{meal}")
+                m_tot = totals["meals"].get(meal)
+                # on_change="rerun" makes .open available, so a closed meal never loads its rows.
+                exp = st.expander(f"{icon} {meal} | {m_tot['Calories'] if m_tot else 0:.0f} kcal", key=f"exp_{meal}", on_change="rerun")
+                with exp:
+                    if m_tot and exp.open:
+                        with metrics.span("ui.meal_editor"):
+                            m_data = pd.DataFrame(store.get_meal(email, meal))
+                            edited = st.data_editor(m_data.drop(columns=["Meal"]), hide_index=True, use_container_width=True, key=f"d_{meal}")
                         if not edited.equals(m_data.drop(columns=["Meal"])):
-                            edited["Meal"] = meal
-                            user_data["daily_log"] = pd.concat([df_f[df_f["Meal"] != meal], edited]).to_dict('records')
-                            sync_db(); st.rerun()
+                            store.replace_meal(email, meal, edited.to_dict('records'))
+                            st.rerun()
+
+            hist = st.expander("📅 History", key="exp_history", on_change="rerun")
+            with hist:
+                if hist.open:
+                    span = st.radio("Range", ["Week", "Month"], horizontal=True, key="hist_span")
+                    rows = store.get_history(email, *(week_range() if span == "Week" else month_range()))
+                    if rows:
+                        with metrics.span("ui.history"):
+                            df_h = pd.DataFrame(rows)
+                            fig = px.bar(df_h, x="Date", y=["Calories", "Burned"], barmode="group", color_discrete_sequence=['#3b82f6', '#f97316'])
+                            fig.add_hline(y=targets["cals"], line_dash="dot", line_color="#10b981")
+                            fig.update_layout(height=260, margin=dict(t=10, b=0, l=0, r=0), legend_title_text="", xaxis_title=None, yaxis_title="kcal")
+                            st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
+                            st.dataframe(df_h.round(1), hide_index=True, use_container_width=True)
+                    else: st.caption("Nothing logged in this period yet.")
 
             st.write("")
             if st.button("🗑️ Reset Entire Day", use_container_width=True): 
-                user_data.update({"daily_log": [], "exercise_log": [], "water_liters": 0.0}); sync_db(); st.rerun()
+                store.reset_day(email); st.rerun()
 
         # TAB 2: ADD FOOD
         with t_add:
@@ -391,34 +413,36 @@ else:
             if st.session_state.camera_active:
                 cam = st.camera_input("Point at barcode", label_visibility="collapsed")
                 if cam:
-                    dec = decode(Image.open(cam))
-                    if not dec: dec = decode(ImageEnhance.Contrast(Image.open(cam).convert('L')).enhance(3.0))
-                    if dec: 
-                        code = dec[0].data.decode("utf-8"); st.success("✅ Barcode Detected!"); st.session_state.camera_active = False 
+                    code = decode_barcode(cam) or ""
+                    if code: 
+                        st.success("✅ Barcode Detected!"); st.session_state.camera_active = False 
                     else: st.error("❌ Barcode not read. Try moving closer.")
 
             query = st.text_input("🔍 Search Database:", value=code, placeholder="Type food name or scan barcode")
             if query:
-                en = translate_query(query)
-                CDB = {**OFFLINE_DB, **user_data.get("custom_foods", {})}
-                matches = [k for k in CDB.keys() if en in k or query.lower() in k]
+                food_index = get_food_index()
+                food_index.ensure_owner(email, user_data.get("custom_foods", {}))
+                lk = replace_lookup(st.session_state, "food_lookup", get_lookup_service(), query, lambda *q: food_index.search(*q, owner=email))
+                CDB = dict(lk.local)
+                matches = list(CDB)
                 if matches:
                     sel = st.selectbox("📑 Best Matches:", matches)
                     w = st.number_input("⚖️ Grams eaten:", value=100.0)
                     if st.button("➕ Add to Diary", type="primary"):
                         d = CDB[sel]
-                        user_data["daily_log"].append({"Meal": meal, "Food": sel.title(), "Grams": w, "Calories": round(d["cals"]*w/100,1), "Protein": round(d["prot"]*w/100,1), "Carbs": round(d["carb"]*w/100,1), "Fat": round(d["fat"]*w/100,1)})
-                        sync_db(); st.rerun()
+                        store.add_food(email, {"Meal": meal, "Food": sel.title(), "Grams": w, "Calories": round(d["cals"]*w/100,1), "Protein": round(d["prot"]*w/100,1), "Carbs": round(d["carb"]*w/100,1), "Fat": round(d["fat"]*w/100,1)})
+                        st.rerun()
                 else:
-                    res = robust_global_search(en)
+                    res = lk.remote
                     if res:
                         opt = {f"{p.get('product_name','U')} ({p.get('brands','N/A')})": p for p in res[:10]}
                         sel_g = st.selectbox("🌍 Global Search Results:", list(opt.keys()))
                         w = st.number_input("⚖️ Grams eaten:", value=100.0)
                         if st.button("➕ Add to Diary", type="primary"):
                             n = opt[sel_g].get('nutriments', {})
-                            user_data["daily_log"].append({"Meal": meal, "Food": sel_g, "Grams": w, "Calories": round((n.get("energy-kcal_100g",0)*w)/100, 1), "Protein": round((n.get("proteins_100g",0)*w)/100, 1), "Carbs": round((n.get("carbohydrates_100g",0)*w)/100, 1), "Fat": round((n.get("fat_100g",0)*w)/100, 1)})
-                            sync_db(); st.rerun()
+                            store.add_food(email, {"Meal": meal, "Food": sel_g, "Grams": w, "Calories": round((n.get("energy-kcal_100g",0)*w)/100, 1), "Protein": round((n.get("proteins_100g",0)*w)/100, 1), "Carbs": round((n.get("carbohydrates_100g",0)*w)/100, 1), "Fat": round((n.get("fat_100g",0)*w)/100, 1)})
+                            st.rerun()
+                    elif lk.pending: await_lookup(lk)
 
         # TAB 3: WORKOUTS
         with t_ex:
@@ -428,7 +452,7 @@ else:
             burn = int((EXERCISE_METS[sel_e] * 3.5 * current_weight) / 200 * dur)
             st.info(f"💡 Approx Burned: **{burn} kcal** (Based on your {current_weight}kg weight)")
             if st.button("➕ Log Workout", type="primary"):
-                user_data["exercise_log"].append({"Exercise": sel_e, "Burned": burn}); sync_db(); st.rerun()
+                store.add_exercise(email, {"Exercise": sel_e, "Burned": burn}); st.rerun()
             if user_data["exercise_log"]: st.dataframe(pd.DataFrame(user_data["exercise_log"]), use_container_width=True, hide_index=True)
 
         # TAB 4: WEIGHT TRACKER
@@ -436,28 +460,22 @@ else:
             with st.container(border=True):
                 w_in = st.number_input("⚖️ Enter Today's Weight (kg)", value=float(current_weight), step=0.1)
                 if st.button("💾 Save Weight", use_container_width=True, type="primary"):
-                    ds = str(date.today())
-                    user_data["weight_log"] = [e for e in user_data["weight_log"] if e["Date"] != ds]
-                    user_data["weight_log"].append({"Date": ds, "Weight": w_in})
-                    user_data["weight_log"] = sorted(user_data["weight_log"], key=lambda x: x["Date"])
-                    sync_db(); st.rerun()
+                    store.upsert_weight(email, date.today(), w_in); st.rerun()
             
-            if len(user_data["weight_log"]) > 0:
-                df_w = pd.DataFrame(user_data["weight_log"])
-                df_w['Date'] = pd.to_datetime(df_w['Date'])
-                sd, sw, g = df_w['Date'].iloc[0], df_w['Weight'].iloc[0], profile.get("goal")
-                dr = -0.07 if "Weight Loss" in g else (0.035 if "Muscle" in g else (0.07 if "Bodybuilding" in g else 0))
-                df_w['Days'] = (df_w['Date'] - sd).dt.days
-                df_w['Ideal'] = sw + (df_w['Days'] * dr)
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=df_w['Date'], y=df_w['Weight'], mode='lines+markers', name='Actual', line=dict(color='#3b82f6', width=4)))
-                fig.add_trace(go.Scatter(x=df_w['Date'], y=df_w['Ideal'], mode='lines', name='Target', line=dict(color='#10b981', dash='dash')))
-                fig.update_layout(height=350, margin=dict(l=10, r=10, t=10, b=10), hovermode="x unified", legend=dict(orientation="h", y=-0.2))
-                st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
-                st.markdown("#### 📋 Weight History (Read Only)")
-                disp_df = df_w[['Date', 'Weight']].copy()
-                disp_df['Date'] = disp_df['Date'].dt.strftime('%Y-%m-%d')
-                st.dataframe(disp_df.sort_values(by='Date', ascending=False), use_container_width=True, hide_index=True)
+            w_version, w_rows = store.weight_series(email)
+            if w_rows:
+                with metrics.span("ui.weight_chart"):
+                    res = st.radio("View", RESOLUTIONS, horizontal=True, label_visibility="collapsed")
+                    ws = weight_chart_series(email, w_version, profile.get("goal", ""), res, w_rows)
+                    markers = 'lines+markers' if len(ws["Date"]) <= 90 else 'lines'
+                    fig = go.Figure()
+                    fig.add_trace(go.Scatter(x=ws['Date'], y=ws['Weight'], mode=markers, name='Actual', line=dict(color='#3b82f6', width=4 if markers == 'lines+markers' else 2)))
+                    fig.add_trace(go.Scatter(x=ws['Date'], y=ws['Trend'], mode='lines', name='Trend', line=dict(color='#f59e0b', width=3)))
+                    fig.add_trace(go.Scatter(x=ws['Date'], y=ws['Ideal'], mode='lines', name='Target', line=dict(color='#10b981', dash='dash')))
+                    fig.update_layout(height=350, margin=dict(l=10, r=10, t=10, b=10), hovermode="x unified", legend=dict(orientation="h", y=-0.2))
+                    st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
+                    st.markdown("#### 📋 Weight History (Read Only)")
+                    st.dataframe(ws["table"], use_container_width=True, hide_index=True)
 
         # TAB 5: CUSTOM FOODS
         with t_custom:
@@ -470,6 +488,7 @@ else:
             cf = c4.number_input("🥑 Fat (100g):")
             if st.button("💾 Save to My Library", type="primary", use_container_width=True):
                 if cn: 
-                    if "custom_foods" not in user_data: user_data["custom_foods"] = {}
                     user_data["custom_foods"][cn] = {"cals":cc, "prot":cp, "carb":cch, "fat":cf}
-                    sync_db(); st.success(f"✅ Saved '{cn}' to your personal database!")
\ No newline at end of file
+                    store.save_custom_food(email, cn, user_data["custom_foods"][cn]); get_food_index().add(cn, user_data["custom_foods"][cn], owner=email); st.session_state.pop("food_lookup", None); st.success(f"✅ Saved '{cn}' to your personal database!")
+
+metrics.end_rerun()
@@ -0,0 +1,105 @@
+"""Password hashing for the user store.
+
+    python credentials.py migrate --db myfitness.db   # hash passwords still stored in plaintext
+
+Rows imported from the legacy JSON store carry the password as typed. The app hashes them on a background
+thread after start-up (Credentials.migrate_in_background, a no-op once done), one at a time, so neither the
+first page load nor logins wait on it; a user who logs in first is rehashed by verify(). On a large store
+run the command above before deploying: it hashes on the whole pool.
+"""
+import os
+import sys
+import hmac
+import base64
+import hashlib
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from metrics import timed
+
+# --- Password hashing (scrypt, cost tunable per deployment) ---
+# N=2**14, r=8 is ~16 MB and ~40-60 ms per hash on a laptop core; raise N as hardware allows.
+# Stored hashes keep their own parameters, so changing these only re-hashes users as they log in.
+HASH_N = int(os.environ.get("PASSWORD_HASH_N", 2 ** 14))
+HASH_R = int(os.environ.get("PASSWORD_HASH_R", 8))
+HASH_P = int(os.environ.get("PASSWORD_HASH_P", 1))
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 4))   # caps CPU and memory during a login burst
+_PREFIX = "scrypt"
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=32)
+
+def hash_password(password, n=HASH_N, r=HASH_R, p=HASH_P):
+    salt = os.urandom(16)
+    b64 = lambda b: base64.b64encode(b).decode()
+    return f"{_PREFIX}${n}${r}${p}${b64(salt)}${b64(_scrypt(password, salt, n, r, p))}"
+
+def verify_password(password, stored):
+    """(ok, needs_rehash). Anything not in the scrypt format is a legacy plaintext password."""
+    if not stored: return False, False
+    if not stored.startswith(_PREFIX + "$"):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")), True
+    try:
+        _, n, r, p, salt, digest = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        ok = hmac.compare_digest(_scrypt(password, base64.b64decode(salt, validate=True), n, r, p), base64.b64decode(digest, validate=True))
+    except (ValueError, MemoryError):   # a corrupt hash (binascii.Error is a ValueError) is a failed login, not a crash
+        return False, False
+    return ok, ok and (n, r, p) != (HASH_N, HASH_R, HASH_P)
+
+class Credentials:
+    """Hashes and checks passwords on a small pool, off the Streamlit script thread.
+
+    hashlib.scrypt releases the GIL, so other sessions keep rendering while a login is checked, and the
+    pool size bounds how many ~16 MB hashes run at once. Methods return futures.
+    """
+
+    def __init__(self, store, max_workers=HASH_WORKERS):
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pwhash")
+        self._dummy = hash_password("not a real password")
+
+    def hash(self, password):
+        return self._pool.submit(hash_password, password)
+
+    def verify(self, email, password):
+        return self._pool.submit(self._verify, email, password)
+
+    @timed("auth.verify")
+    def _verify(self, email, password):
+        stored = self.store.get_password(email)
+        # Unknown accounts cost the same as a wrong password, so timing doesn't reveal which emails exist.
+        ok, rehash = verify_password(password, stored or self._dummy)
+        if not stored: return False
+        if ok and rehash: self.store.update_user(email, password=hash_password(password))
+        return ok
+
+    def migrate(self, batch=1000, mapper=None):
+        """Hashes every password still stored in plaintext, a page at a time on the pool (or with ``mapper``);
+        returns how many. A password changed meanwhile (a login rehash) is left as it is."""
+        if self.store.get_meta("passwords_hashed"): return 0
+        n, mapper = 0, mapper or self._pool.map
+        for page in self.store.plaintext_passwords(batch):
+            hashes = mapper(hash_password, (pw for _, pw in page))
+            self.store.set_passwords([(e, pw, h) for (e, pw), h in zip(page, hashes)]); n += len(page)
+        self.store.set_meta("passwords_hashed", "1")
+        return n
+
+    def migrate_in_background(self, batch=100):
+        """migrate() on a daemon thread, one hash at a time, leaving the pool to logins; returns the thread."""
+        t = threading.Thread(target=self.migrate, kwargs={"batch": batch, "mapper": map}, name="pwhash-migrate", daemon=True)
+        t.start()
+        return t
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("migrate", help="hash plaintext passwords left by the legacy JSON store")
+    p.add_argument("--db", default="myfitness.db")
+    args = parser.parse_args()
+    from store import FitnessStore
+    n = Credentials(FitnessStore(args.db, legacy_json=None)).migrate()
+    print(f"{n} plaintext passwords hashed", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
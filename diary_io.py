@@ -0,0 +1,223 @@
+"""Streaming export and import of users' diaries: the food, exercise, weight and water logs.
+
+    python diary_io.py export --db myfitness.db --out backup                       # backup/food.csv, exercise.csv, weight.csv, water.csv
+    python diary_io.py export --db myfitness.db --out backup.zip --format parquet   # one archive (Parquet needs pyarrow)
+    python diary_io.py export --db myfitness.db --out me.zip --user me@example.com
+    python diary_io.py import backup --db myfitness.db --rejects rejects.ndjson   # a directory, a .zip (e.g. from the app) or files
+
+Every log is one file, ``<log>.<format>``, with the columns email, Date and the log's own (see store.DIARY);
+rows come grouped by user and day. Both directions stream: export writes each keyset page of ``--chunk``
+rows (one Parquet row group) before reading the next, and import validates one page and upserts it in one
+short transaction. Memory is a page, whatever the size of the store or the file; the (user, day) keys an import
+has replaced are kept in a SQLite TEMP table, not in Python. See ``python bench.py io``.
+
+Import: weight and water rows overwrite their day; for food and exercise a (user, day) in the file replaces
+that day's stored entries, so importing an export twice leaves one copy, and a day's rows need not be
+together. Rows of unknown users, with unparseable dates, or with missing, non-numeric or negative
+amounts are skipped, counted and, with ``--rejects``, written out with the reason.
+"""
+import io
+import os
+import csv
+import sys
+import json
+import math
+import time
+import zipfile
+import argparse
+from datetime import date
+from itertools import islice
+from store import DIARY, FitnessStore
+from metrics import timed
+
+FORMATS = ("csv", "ndjson", "parquet")
+APP_FORMATS = ("csv", "ndjson")   # the in-app download works without pyarrow
+REQUIRED = {"Grams", "Calories", "Protein", "Carbs", "Fat", "Burned", "Weight", "liters"}   # numeric; the rest is free text
+
+def columns(kind):
+    return ("email", "Date", *DIARY[kind][2])
+
+# --- Writers: (binary file, columns, pages of tuples) ---
+def write_csv(fb, cols, pages):
+    f = io.TextIOWrapper(fb, encoding="utf-8", newline="")
+    w = csv.writer(f); w.writerow(cols)
+    for page in pages: w.writerows(page)
+    f.flush(); f.detach()
+
+def write_ndjson(fb, cols, pages):
+    for page in pages:
+        fb.write("".join(json.dumps(dict(zip(cols, r)), ensure_ascii=False) + "\n" for r in page).encode("utf-8"))
+
+def _pyarrow():
+    try:
+        import pyarrow as pa, pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet needs pyarrow (pip install pyarrow); use --format csv or ndjson") from None
+    return pa, pq
+
+def write_parquet(fb, cols, pages):
+    pa, pq = _pyarrow()
+    schema = pa.schema([(c, pa.float64() if c in REQUIRED else pa.string()) for c in cols])
+    with pq.ParquetWriter(fb, schema, compression="zstd") as w:
+        for page in pages: w.write_table(pa.Table.from_arrays([pa.array(c, type=t) for c, t in zip(zip(*page), schema.types)], schema=schema))
+
+# --- Readers: binary file -> pages of dicts ---
+def read_csv(fb, chunk):
+    rows = csv.DictReader(io.TextIOWrapper(fb, encoding="utf-8-sig", newline=""))
+    while page := list(islice(rows, chunk)): yield page
+
+def read_ndjson(fb, chunk):
+    page = []
+    for n, line in enumerate(io.TextIOWrapper(fb, encoding="utf-8-sig"), 1):
+        if not line.strip(): continue
+        try: page.append(json.loads(line))
+        except ValueError as e: page.append({"_error": f"line {n}: {e}", "line": line.rstrip("\n")})
+        if len(page) >= chunk: yield page; page = []
+    if page: yield page
+
+def read_parquet(fb, chunk):
+    _, pq = _pyarrow()
+    for batch in pq.ParquetFile(fb).iter_batches(batch_size=chunk): yield batch.to_pylist()
+
+WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "parquet": write_parquet}
+READERS = {"csv": read_csv, "ndjson": read_ndjson, "parquet": read_parquet}
+
+# --- Export ---
+def export(store, out, fmt="csv", email=None, chunk=5000, log=sys.stderr):
+    """Writes every log to ``out`` (a directory, or an archive if it ends in .zip); returns rows per log."""
+    stats, archive = {}, out.endswith(".zip")
+    if archive:
+        # Parquet is compressed already, and a stored member can be read back without inflating it.
+        zf = zipfile.ZipFile(out, "w", zipfile.ZIP_STORED if fmt == "parquet" else zipfile.ZIP_DEFLATED)
+    else: os.makedirs(out, exist_ok=True)
+    try:
+        for kind in DIARY:
+            name, t0 = f"{kind}.{fmt}", time.perf_counter()
+            with zf.open(name, "w", force_zip64=True) if archive else open(os.path.join(out, name), "wb") as fb:
+                stats[kind] = _export_log(store, kind, fb, fmt, email, chunk)
+            print(f"  {name}: {stats[kind]:,} rows in {time.perf_counter() - t0:.1f}s", file=log)
+    finally:
+        if archive: zf.close()
+    return stats
+
+def _export_log(store, kind, fb, fmt, email, chunk):
+    n = [0]
+    def pages():
+        for page in store.diary_pages(kind, email, chunk):
+            n[0] += len(page); yield page
+    WRITERS[fmt](fb, columns(kind), pages())
+    return n[0]
+
+@timed("export.user_archive")
+def user_archive(store, email, fmt="csv"):
+    """One user's diary as zip bytes for st.download_button(data=...), built when the button is clicked.
+
+    Rows are read and compressed a page at a time; what the server holds is that page and the compressed
+    archive, which download_button keeps in its media store anyway.
+    """
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as zf:
+        for kind in DIARY:
+            with zf.open(f"{kind}.{fmt}", "w") as fb: _export_log(store, kind, fb, fmt, email, 5000)
+    return f.getvalue()
+
+# --- Import ---
+def _number(v):
+    if v is None or v == "": raise ValueError("missing")
+    x = float(v)
+    if not math.isfinite(x) or x < 0: raise ValueError(f"{v!r} is not a non-negative number")
+    return x
+
+def validate(kind, rec):
+    """One input record -> the (email, Date, *columns) tuple store.import_diary takes; raises ValueError."""
+    if "_error" in rec: raise ValueError(rec["_error"])
+    email = (rec.get("email") or "").strip()
+    if not email: raise ValueError("missing email")
+    try: day = date.fromisoformat(str(rec.get("Date") or "")[:10]).isoformat()
+    except ValueError: raise ValueError(f"bad Date {rec.get('Date')!r}") from None
+    out = [email, day]
+    for c in DIARY[kind][2]:
+        if c not in REQUIRED: out.append(None if rec.get(c) in (None, "") else str(rec[c]))
+        else:
+            try: out.append(_number(rec.get(c)))
+            except (TypeError, ValueError) as e: raise ValueError(f"{c}: {e}") from None
+    if kind == "weight" and not out[2]: raise ValueError("Weight: must be positive")
+    return tuple(out)
+
+def import_log(store, kind, pages, rejects=None):
+    """Validates and upserts pages of records of one log; returns counters.
+
+    The food/exercise days replaced so far live in store.replaced_days(), so a day whose rows come back later
+    in the file adds to it instead of replacing what was just imported.
+    """
+    stats = {"rows": 0, "imported": 0, "rejected": 0}
+    with store.replaced_days() as replaced:
+        for page in pages:
+            stats["rows"] += len(page)
+            good, bad = [], []
+            for rec in page:
+                try: good.append(validate(kind, rec))
+                except ValueError as e: bad.append((rec, str(e)))
+            known = store.existing_users({r[0] for r in good})
+            bad += [(dict(zip(columns(kind), r)), "unknown user") for r in good if r[0] not in known]
+            good = [r for r in good if r[0] in known]
+            if good: store.import_diary(kind, good, replaced)
+            stats["imported"] += len(good); stats["rejected"] += len(bad)
+            if rejects:
+                for rec, why in bad: rejects.write(json.dumps({"log": kind, "error": why, "row": rec}, ensure_ascii=False, default=str) + "\n")
+    return stats
+
+def _member(path, name):
+    # The member holds its own reference to the archive's file, which closes when the member does.
+    with zipfile.ZipFile(path) as zf: return zf.open(name)
+
+def sources(paths):
+    """(log, format, opener) for every <log>.<format> in the given files, directories and zip archives."""
+    def parse(name):
+        kind, _, fmt = os.path.basename(name).rpartition(".")
+        return (kind, {"jsonl": "ndjson"}.get(fmt, fmt)) if kind in DIARY and fmt in (*FORMATS, "jsonl") else None
+    found = []
+    for path in paths:
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(path) as zf: names = zf.namelist()
+            found += [(*p, lambda n=n, path=path: _member(path, n)) for n in names if (p := parse(n))]
+        elif os.path.isdir(path):
+            found += [(*p, lambda f=os.path.join(path, n): open(f, "rb")) for n in sorted(os.listdir(path)) if (p := parse(n))]
+        elif (p := parse(path)): found.append((*p, lambda f=path: open(f, "rb")))
+        else: raise ValueError(f"{path}: expected a directory, a .zip or a <log>.<format> file with log in {list(DIARY)}")
+    return sorted(found, key=lambda s: list(DIARY).index(s[0]))
+
+def import_paths(store, paths, chunk=5000, rejects=None, log=sys.stderr):
+    stats = {}
+    for kind, fmt, opener in sources(paths):
+        t0 = time.perf_counter()
+        with opener() as fb: stats[f"{kind}.{fmt}"] = s = import_log(store, kind, READERS[fmt](fb, chunk), rejects)
+        print(f"  {kind}.{fmt}: {s['imported']:,} imported, {s['rejected']:,} rejected in {time.perf_counter() - t0:.1f}s", file=log)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("export", help="write every log (or one user's) as CSV/NDJSON/Parquet")
+    p.add_argument("--db", default="myfitness.db")
+    p.add_argument("--out", required=True, help="directory, or an archive path ending in .zip")
+    p.add_argument("--format", choices=FORMATS, default="csv")
+    p.add_argument("--user", help="only this user's logs")
+    p.add_argument("--chunk", type=int, default=5000, help="rows per read page / write batch")
+    p = sub.add_parser("import", help="validate and upsert logs from an export")
+    p.add_argument("paths", nargs="+", help="export directories, .zip archives or <log>.<format> files")
+    p.add_argument("--db", default="myfitness.db")
+    p.add_argument("--chunk", type=int, default=5000, help="rows per validated batch / transaction")
+    p.add_argument("--rejects", help="write skipped rows here as NDJSON, with the reason")
+    args = parser.parse_args()
+    store = FitnessStore(args.db, legacy_json=None)
+    try:
+        if args.cmd == "export": stats = export(store, args.out, args.format, args.user, args.chunk)
+        else:
+            with open(args.rejects, "w", encoding="utf-8") if args.rejects else open(os.devnull, "w") as rejects:
+                stats = import_paths(store, args.paths, args.chunk, rejects if args.rejects else None)
+    except (RuntimeError, ValueError, OSError) as e: sys.exit(str(e))
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import json
+import os
+import re
+import bisect
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from metrics import timed
+
+# --- Food search index ---
+FITNESS_DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fitness_db.json")
+MIN_SCORE = 0.4
+PREFIX_SIM, PREFIX_LIMIT = 0.85, 8     # "chick" -> chicken, chickpeas...
+RERANK = 64                            # multi-token candidate sets up to this size are scored exhaustively
+FUZZY_SIM, FUZZY_LIMIT = 0.4, 4        # Dice threshold on token trigrams for typos ("chikcen", "humus")
+USER_INDEXES = 1024                    # per-user custom-food indexes kept; an evicted one is rebuilt on the next search
+
+_HEB_FINALS = str.maketrans("ךםןףץ", "כמנפצ")
+_NIQQUD = re.compile("[\u0591-\u05c7]")
+_TOKEN = re.compile("[0-9a-z\u05d0-\u05ea%]+")
+
+def normalize(text):
+    """Lowercases, strips Hebrew niqqud and folds final letters so 'שניצל' / 'שְׁנִיצֶל' index the same."""
+    text = _NIQQUD.sub("", unicodedata.normalize("NFKC", str(text)).lower()).translate(_HEB_FINALS)
+    return " ".join(_TOKEN.findall(text))
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class FoodIndex:
+    """Two-level inverted index: trigrams -> vocabulary tokens (typo tolerance), tokens -> foods.
+
+    Token postings are kept ordered by name length, so ranking walks the rarest query token's list
+    and stops after ``limit`` hits instead of scoring every match. One index holds one library: the
+    shared catalog, or a user's custom foods (see FoodSearch).
+    """
+
+    def __init__(self):
+        self.names, self.keys, self.foods = [], [], []
+        self._lengths = array("H")
+        self._ids = {}
+        self._postings = {}      # token -> array of item ids, ordered by name length
+        self._vocab = []         # sorted tokens, for prefix expansion
+        self._gram_tokens = {}   # trigram -> set of tokens
+        self._sets = {}          # token -> set of item ids, built on first multi-token query
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, food):
+        with self._lock: self._add(name, food, bulk=False)
+
+    def add_many(self, foods):
+        with self._lock:
+            for name, food in foods.items(): self._add(name, food, bulk=True)
+            self._sets.clear()
+            for plist in self._postings.values():
+                plist[:] = array("I", sorted(plist, key=self._lengths.__getitem__))
+            self._vocab = sorted(self._postings)
+
+    def _add(self, name, food, bulk):
+        i = self._ids.get(name)
+        if i is not None: self.foods[i] = food; return
+        key = normalize(name)
+        i = len(self.names)
+        self._ids[name] = i
+        self.names.append(name); self.keys.append(key); self.foods.append(food)
+        self._lengths.append(min(len(key), 0xFFFF))
+        for tok in set(key.split()):
+            plist = self._postings.get(tok)
+            if plist is None:
+                plist = self._postings[tok] = array("I")
+                for g in trigrams(tok): self._gram_tokens.setdefault(g, set()).add(tok)
+                if not bulk: bisect.insort(self._vocab, tok)
+            if bulk: plist.append(i)
+            else:
+                bisect.insort(plist, i, key=self._lengths.__getitem__)
+                if tok in self._sets: self._sets[tok].add(i)
+
+    def items(self):
+        return dict(zip(self.names, self.foods))
+
+    def _variants(self, tok):
+        """Vocabulary tokens a query token may stand for, with a similarity in (0, 1]."""
+        out = {tok: 1.0} if tok in self._postings else {}
+        if len(tok) >= 2:
+            lo = bisect.bisect_left(self._vocab, tok)
+            for v in self._vocab[lo:lo + PREFIX_LIMIT + 1]:
+                if not v.startswith(tok): break
+                out.setdefault(v, PREFIX_SIM)
+        if not out and len(tok) >= 3:
+            qgrams, counts = trigrams(tok), {}
+            for g in qgrams:
+                for v in self._gram_tokens.get(g, ()): counts[v] = counts.get(v, 0) + 1
+            scored = sorted(((2 * c / (len(qgrams) + len(v) + 2), v) for v, c in counts.items()), reverse=True)
+            for dice, v in scored[:FUZZY_LIMIT]:
+                if dice >= FUZZY_SIM: out[v] = min(dice, PREFIX_SIM)
+        return out
+
+    def _token_sets(self, variants):
+        for w in variants:
+            if w not in self._sets: self._sets[w] = set(self._postings[w])
+            yield self._sets[w]
+
+    @staticmethod
+    def _union(sets):
+        sets = list(sets)
+        return sets[0] if len(sets) == 1 else set().union(*sets)
+
+    @timed("food_search")
+    def search(self, *queries, limit=20, min_score=MIN_SCORE):
+        """Ranks entries against every query variant (e.g. the raw and translated text); returns [(name, food)]."""
+        return _top(self.ranked(queries, limit, min_score), limit)
+
+    def ranked(self, queries, limit=20, min_score=MIN_SCORE):
+        """{name: (score, key length, food)} for the best matches over every query variant."""
+        best = {}
+        for q in {normalize(q) for q in queries if q}:
+            for i, score in self._search_one(q.split(), limit):
+                if score >= min_score and score > best.get(self.names[i], (0.0,))[0]: best[self.names[i]] = (score, self._lengths[i], self.foods[i])
+        return best
+
+    def _search_one(self, qtoks, limit):
+        qtoks = list(dict.fromkeys(qtoks))
+        matched = [v for v in map(self._variants, qtoks) if v]
+        if not matched: return
+        # Query tokens that match nothing lower the score instead of vetoing every result.
+        matched.sort(key=lambda v: sum(len(self._postings[w]) for w in v))
+        driver, others = matched[0], matched[1:]
+        cand = None
+        if others:
+            # Intersect in C first; only the surviving ids are touched from Python.
+            cand = self._union(self._token_sets(driver))
+            for variants in others:
+                cand = self._union(cand & s for s in self._token_sets(variants))
+                if not cand: return
+            if len(cand) <= RERANK:
+                for i in cand:
+                    score = self._score(i, qtoks, matched)
+                    if score: yield i, score
+                return
+        # Exact token first, then prefixes/typos; postings are length-ordered, so the first hits are the tightest names.
+        hits = 0
+        for tok, sim in sorted(driver.items(), key=lambda kv: -kv[1]):
+            if hits >= limit: break
+            for i in self._postings[tok]:
+                if cand is not None and i not in cand: continue
+                score = self._score(i, qtoks, matched)
+                if score:
+                    yield i, score
+                    hits += 1
+                    if hits >= limit: break
+
+    def _score(self, i, qtoks, matched):
+        itoks, total = self.keys[i].split(), 0.0
+        for variants in matched:
+            s = max((variants[t] for t in itoks if t in variants), default=0.0)
+            if not s: return 0.0
+            total += s
+        return total / len(qtoks) + (0.1 if len(itoks) == len(qtoks) else 0.0)
+
+def _top(best, limit):
+    ranked = sorted(best.items(), key=lambda kv: (-kv[1][0], kv[1][1]))
+    return [(name, food) for name, (_, _, food) in ranked[:limit]]
+
+class FoodSearch:
+    """The shared catalog index plus a small FoodIndex per user for custom foods, most recently used kept.
+
+    Users' foods never enter the catalog's postings, so a catalog search walks catalog entries only and
+    a user's library costs memory only while it is in use.
+    """
+
+    def __init__(self, catalog, max_users=USER_INDEXES):
+        self.catalog, self.max_users = catalog, max_users
+        self._users, self._lock = OrderedDict(), threading.Lock()
+
+    def _user(self, owner):
+        with self._lock:
+            index = self._users.get(owner)
+            if index is not None: self._users.move_to_end(owner)
+            return index
+
+    def _put(self, owner, index):
+        with self._lock:
+            self._users[owner] = index; self._users.move_to_end(owner)
+            while len(self._users) > self.max_users: self._users.popitem(last=False)
+
+    def add(self, name, food, owner=None):
+        if owner is None: self.catalog.add(name, food); return
+        index = self._user(owner)
+        if index is None: self._put(owner, index := FoodIndex())
+        index.add(name, food)
+
+    def ensure_owner(self, owner, foods):
+        """Builds or refreshes an owner's index; O(len(foods)) dict checks when nothing changed. Rebuilt
+        whole on any change, so deleted foods leave with it."""
+        index = self._user(owner)
+        if index is not None and index.items() == foods: return
+        index = FoodIndex(); index.add_many(foods)
+        self._put(owner, index)
+
+    def drop_owner(self, owner):
+        with self._lock: self._users.pop(owner, None)
+
+    @timed("food_search")
+    def search(self, *queries, owner=None, limit=20, min_score=MIN_SCORE):
+        best = self.catalog.ranked(queries, limit, min_score)
+        index = self._user(owner) if owner is not None else None
+        if index is not None:
+            for name, hit in index.ranked(queries, limit, min_score).items():
+                # Same name in the catalog and the user's library: the user's own entry wins.
+                if name not in best or hit[0] >= best[name][0]: best[name] = hit
+        return _top(best, limit)
+
+def load_fitness_db(path=FITNESS_DB_FILE):
+    """fitness_db.json only lists calories/protein per 100g; carbs and fat default to 0."""
+    try:
+        with open(path, "r", encoding="utf-8") as f: raw = json.load(f)
+    except (OSError, ValueError): return {}
+    return {name: {"cals": v.get("calories", 0.0), "prot": v.get("protein", 0.0), "carb": v.get("carbs", 0.0), "fat": v.get("fat", 0.0)} for name, v in raw.items()}
+
+def build_default_index(offline_db, fitness_db_path=FITNESS_DB_FILE):
+    index = FoodIndex()
+    index.add_many(load_fitness_db(fitness_db_path))
+    index.add_many(offline_db)
+    return FoodSearch(index)
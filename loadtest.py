@@ -0,0 +1,297 @@
+"""Concurrent-session load test: simulated users driving cal.py through Streamlit's AppTest.
+
+    python loadtest.py --sessions 1 10 25 --users 10000 --days 90
+    python loadtest.py --sessions 10 --save baseline.json
+    python loadtest.py --sessions 10 --baseline baseline.json --tolerance 1.3    # exit 1 on regression
+    python loadtest.py --sessions 10 --shared 10 25    # plus levels where every session is the same user
+
+Each session is one AppTest (its own session_state, query params and script runs) on its own thread, so
+sessions share the process's st.cache_resource singletons (store, food index, lookup pool) the way they
+do in a Streamlit server. A session logs in through ``?user=`` and then runs ``--iterations`` flows picked
+by FLOWS: water ➕, food search + add, weight save, or a plain rerun. Open Food Facts is a local fake
+HTTP server and GoogleTranslator.translate a stub, both with ``--net-ms`` latency, so nothing leaves the
+machine. AppTest was written for one app at a time; share_app_test_globals() makes it safe on threads.
+
+Per session count it reports p50/p95/p99 rerun latency (overall and per flow), reruns/s, RSS, script
+exceptions, searches that ended with nothing to add (every query has results here), and lost or duplicated
+writes: afterwards each user's water, food entries and weight for today are checked against what its
+sessions clicked. A ``--shared`` level logs all of its sessions in as one user, as tabs and devices of one
+account do, so water clicks and food adds race on the same rows: the totals must equal the sum over the
+sessions, and the weight be one of their last saves. With ``--baseline`` the run fails when p95 grows or
+throughput drops by more than ``--tolerance``, or on any error, search without results, lost or duplicated write.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cal.py")
+FLOWS = {"water": 0.35, "food": 0.30, "weight": 0.15, "browse": 0.20}
+# Local hits, typos, offline-translated Hebrew, and misses that go to the (fake) translator and OFF.
+QUERIES = ["chicken breast", "chiken", "egg", "cottage", "oats", "tahini", "חזה עוף", "גבינה לבנה", "אורז", "kombucha ginger", "פיצה משפחתית"]
+PROFILE = {"gender": "Male", "age": 30, "height": 178, "activity": "Moderately active", "goal": "Maintenance",
+           "targets": {"cals": 2600, "prot": 195, "carb": 260, "fat": 86, "water": 3.4}}
+
+# --- Synthetic database and stubbed network ---
+def build_db(path, n_users, days, seed=0):
+    from store import FitnessStore
+    rng, today = random.Random(seed), date.today()
+    store = FitnessStore(path, legacy_json=None)
+    with store.transaction() as conn:
+        conn.executemany("INSERT INTO users (email, password, username, onboarding_done, profile) VALUES (?, 'x', ?, 1, ?)",
+                         ((f"load{i}@example.com", f"load{i}", json.dumps(PROFILE)) for i in range(n_users)))
+        for i in range(n_users):
+            email, w = f"load{i}@example.com", rng.uniform(60, 110)
+            conn.executemany('INSERT INTO weight_log (email, "Date", "Weight", "Trend") VALUES (?, ?, ?, ?)',
+                             ((email, str(today - timedelta(days=d)), w, w) for d in range(days, 0, -1)))
+            conn.executemany('INSERT INTO food_log (email, "Date", "Meal", "Food", "Grams", "Calories", "Protein", "Carbs", "Fat") VALUES (?, ?, ?, ?, 100, 155, 13, 1.1, 11)',
+                             ((email, str(today - timedelta(days=d)), rng.choice(["Breakfast", "Lunch", "Dinner"]), "Egg") for d in range(days, 0, -1) for _ in range(3)))
+    return store
+
+def fake_off(net_ms):
+    """A local Open Food Facts: every search finds two products, every barcode one."""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def log_message(self, *args): pass
+        def do_GET(self):
+            time.sleep(net_ms / 1000)
+            product = {"product_name": "Load Test Bar", "brands": "Fake", "nutriments": {"energy-kcal_100g": 400, "proteins_100g": 20, "carbohydrates_100g": 50, "fat_100g": 12}}
+            data = {"status": 1, "product": product} if "/api/" in self.path else {"products": [product, {**product, "product_name": "Load Test Drink"}]}
+            body = json.dumps(data).encode()
+            self.send_response(200); self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body))); self.end_headers(); self.wfile.write(body)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler); server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def stub_translator(net_ms):
+    from deep_translator import GoogleTranslator
+    def translate(self, text, **kwargs):
+        time.sleep(net_ms / 1000)
+        return {"פיצה משפחתית": "family pizza"}.get(text, text)
+    GoogleTranslator.translate = translate
+
+def share_app_test_globals():
+    """AppTest installs a mock Runtime and the appTest config flag for each run and clears them when the run
+    ends, which on concurrent threads pulls them out from under other sessions' runs: pin one of each for
+    the whole process. It also compiles the script afresh on every run, and ast.parse is not thread-safe
+    on CPython 3.11; one shared ScriptCache compiles it once, as a Streamlit server does."""
+    from unittest.mock import MagicMock
+    from streamlit import config
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance or runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+    config.set_option("global.appTest", True)
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+# --- Sessions ---
+class Session:
+    def __init__(self, email, iterations, think_ms, timeout, seed):
+        self.email, self.iterations, self.think_ms, self.timeout = email, iterations, think_ms, timeout
+        self.rng = random.Random(seed)
+        self.latency = {}          # flow -> [ms per rerun]
+        self.errors, self.water, self.food, self.weight = [], 0.0, 0, None
+        self.misses = []           # searches that ended with nothing to add
+
+    def run(self, at):
+        t0 = time.perf_counter(); at.run(timeout=self.timeout)
+        return (time.perf_counter() - t0) * 1000
+
+    def step(self, at, flow):
+        ms = self.run(at)
+        self.latency.setdefault(flow, []).append(ms)
+        if at.exception: self.errors.append(f"{flow}: {at.exception[0].message}")
+        return not at.exception
+
+    def button(self, at, label):
+        return next((b for b in at.button if b.label == label), None)
+
+    def click(self, at, label):
+        b = self.button(at, label)
+        if b is None: raise LookupError(f"no {label!r} button")
+        b.click()
+
+    def main(self):
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(APP, default_timeout=self.timeout)
+        at.query_params["user"] = self.email
+        if not self.step(at, "login"): return
+        flows, weights = list(FLOWS), list(FLOWS.values())
+        for _ in range(self.iterations):
+            if self.think_ms: time.sleep(self.rng.uniform(0.5, 1.5) * self.think_ms / 1000)
+            flow = self.rng.choices(flows, weights)[0]
+            try: getattr(self, f"do_{flow}")(at)
+            except Exception as e: self.errors.append(f"{flow}: {type(e).__name__}: {e}")
+
+    def do_browse(self, at):
+        self.step(at, "browse")
+
+    def do_water(self, at):
+        self.click(at, "➕")
+        if self.step(at, "water"): self.water += 0.25
+
+    def do_weight(self, at):
+        w = round(self.rng.uniform(60, 110), 1)
+        next(n for n in at.number_input if "Today's Weight" in n.label).set_value(w)
+        self.click(at, "💾 Save Weight")
+        if self.step(at, "weight"): self.weight = w
+
+    def do_food(self, at):
+        # A trailing space makes every search a new query, as typing does; the index ignores it.
+        query = self.rng.choice(QUERIES) + " " * self.rng.randint(0, 3)
+        next(t for t in at.text_input if "Search" in t.label).input(query)
+        if not self.step(at, "search"): return
+        lk = at.session_state["food_lookup"] if "food_lookup" in at.session_state else None
+        if lk is not None and not self.button(at, "➕ Add to Diary"):
+            # In the browser the await_lookup fragment polls and reruns once the remote results land; they may
+            # have landed between this run and now, so rerun whether or not it is still pending.
+            lk.wait(self.timeout)
+            if not self.step(at, "search_remote"): return
+        add = self.button(at, "➕ Add to Diary")
+        # Every query finds something (a local hit or the fake OFF's two products): no button is a lost result.
+        if add is None: self.misses.append(query.strip()); return
+        add.click()
+        if self.step(at, "food"): self.food += 1
+
+def percentile(values, q):
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q / 100 * len(s)))] if s else 0.0
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError: return 0.0
+
+def run_level(store, n_sessions, offset, args, shared=False):
+    today = str(date.today())
+    sessions = [Session(f"load{offset if shared else offset + i}@example.com", args.iterations, args.think_ms, args.timeout, seed=offset + i) for i in range(n_sessions)]
+    users = {}
+    for s in sessions: users.setdefault(s.email, []).append(s)
+    def food_today(email): return store._conn().execute('SELECT COUNT(*) FROM food_log WHERE email=? AND "Date"=?', (email, today)).fetchone()[0]
+    before = {email: food_today(email) for email in users}
+    rss0, peak = rss_mb(), [rss_mb()]
+    done = threading.Event()
+    def sample():
+        while not done.wait(0.2): peak[0] = max(peak[0], rss_mb())
+    threading.Thread(target=sample, daemon=True).start()
+    threads = [threading.Thread(target=s.main, name=f"session-{i}") for i, s in enumerate(sessions)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - t0
+    done.set(); peak[0] = max(peak[0], rss_mb())
+    # Per user: the store holding less than its sessions saw succeed is a lost write, more is a duplicated one.
+    # Weight is last-write-wins, so today's (the latest) must be the final save of one of the user's sessions.
+    lost, extra = {"water": 0, "food": 0, "weight": 0}, {"water": 0, "food": 0}
+    for email, group in users.items():
+        u = store.get_user(email)
+        water, food = sum(s.water for s in group), sum(s.food for s in group)
+        for key, stored, clicked in (("water", u["water_liters"], water), ("food", food_today(email) - before[email], food)):
+            if stored < clicked - 1e-9: lost[key] += 1
+            elif stored > clicked + 1e-9: extra[key] += 1
+        saved = [s.weight for s in group if s.weight is not None]
+        if saved and not (u["weight"] is not None and any(abs(u["weight"] - w) < 1e-9 for w in saved)): lost["weight"] += 1
+    by_flow = {}
+    for s in sessions:
+        for flow, ms in s.latency.items(): by_flow.setdefault(flow, []).extend(ms)
+    steady = [ms for flow, ms in by_flow.items() if flow != "login" for ms in ms]
+    return {
+        "sessions": n_sessions, "shared": shared, "reruns": sum(len(v) for v in by_flow.values()), "seconds": round(wall, 2),
+        "throughput": round(sum(len(v) for v in by_flow.values()) / wall, 2),
+        **{f"p{q}_ms": round(percentile(steady, q), 1) for q in (50, 95, 99)},
+        "flows": {f: {"n": len(v), "p50_ms": round(percentile(v, 50), 1), "p95_ms": round(percentile(v, 95), 1)} for f, v in sorted(by_flow.items())},
+        "rss_mb": {"start": round(rss0, 1), "peak": round(peak[0], 1), "per_session": round((peak[0] - rss0) / n_sessions, 2)},
+        "errors": sum(len(s.errors) for s in sessions), "error_samples": sorted({e for s in sessions for e in s.errors})[:5],
+        "search_misses": sum(len(s.misses) for s in sessions), "miss_samples": sorted({q for s in sessions for q in s.misses})[:5],
+        "lost_writes": lost, "extra_writes": extra,
+    }
+
+def report(r):
+    print(f"sessions={r['sessions']:>3}{' shared' if r.get('shared') else ''}  reruns={r['reruns']:>5}  {r['throughput']:7.1f} reruns/s  "
+          f"p50 {r['p50_ms']:7.1f}  p95 {r['p95_ms']:7.1f}  p99 {r['p99_ms']:7.1f} ms  "
+          f"RSS {r['rss_mb']['peak']:.0f} MB (+{r['rss_mb']['per_session']:.1f}/session)  errors={r['errors']}  misses={r['search_misses']}  "
+          f"lost={sum(r['lost_writes'].values())} extra={sum(r['extra_writes'].values())}")
+    print("    " + "  ".join(f"{f} {v['p50_ms']:.0f}/{v['p95_ms']:.0f}" for f, v in r["flows"].items()) + "  (p50/p95 ms)")
+    for e in r["error_samples"]: print(f"    ! {e}")
+    if r["miss_samples"]: print(f"    ! no results for {', '.join(map(repr, r['miss_samples']))}")
+
+def gate(results, baseline, tolerance):
+    """Regression failures against a saved run (matched by session count and sharing), plus any error, search
+    without results, or lost write."""
+    base = {(b["sessions"], b.get("shared", False)): b for b in baseline}
+    failures = []
+    for r in results:
+        n = f"{r['sessions']}{' shared' if r['shared'] else ''}"
+        if r["errors"]: failures.append(f"{n} sessions: {r['errors']} script errors")
+        if r["search_misses"]: failures.append(f"{n} sessions: {r['search_misses']} searches without results")
+        if sum(r["lost_writes"].values()): failures.append(f"{n} sessions: lost writes {r['lost_writes']}")
+        if sum(r["extra_writes"].values()): failures.append(f"{n} sessions: duplicated writes {r['extra_writes']}")
+        b = base.get((r["sessions"], r["shared"]))
+        if b is None: continue
+        if r["p95_ms"] > b["p95_ms"] * tolerance: failures.append(f"{n} sessions: p95 {r['p95_ms']} ms > {b['p95_ms']} x {tolerance}")
+        if r["throughput"] < b["throughput"] / tolerance: failures.append(f"{n} sessions: throughput {r['throughput']}/s < {b['throughput']} / {tolerance}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10], help="concurrent sessions per level")
+    parser.add_argument("--shared", type=int, nargs="*", default=[5], help="concurrent sessions of one user per level")
+    parser.add_argument("--users", type=int, default=1000, help="synthetic users in the database")
+    parser.add_argument("--days", type=int, default=30, help="days of weight and food history per user")
+    parser.add_argument("--iterations", type=int, default=20, help="flows per session after login")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's actions")
+    parser.add_argument("--net-ms", type=float, default=150, help="latency of the fake OFF server and translator")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds one script run may take")
+    parser.add_argument("--workdir", help="where the database and caches go; default a temporary directory")
+    parser.add_argument("--save", help="write results as JSON (a baseline for --baseline)")
+    parser.add_argument("--baseline", help="JSON from --save; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args()
+    if sum(args.sessions) + len(args.shared) > args.users: parser.error("--users must cover every session of every level (one user per session, one per shared level)")
+
+    args.save, args.baseline = (os.path.abspath(p) if p else p for p in (args.save, args.baseline))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="loadtest-")
+    os.makedirs(workdir, exist_ok=True); os.chdir(workdir)   # cal.py keeps its database and caches in the cwd
+    off = fake_off(args.net_ms)
+    os.environ["OFF_BASE_URL"] = f"http://127.0.0.1:{off.server_port}"
+    stub_translator(args.net_ms)
+    share_app_test_globals()
+    from streamlit import config, logger
+    config.set_option("logger.level", "error"); logger.set_log_level("error")   # no deprecation warning per rerun
+
+    t0 = time.perf_counter()
+    store = build_db("myfitness.db", args.users, args.days)
+    print(f"db: {args.users:,} users x {args.days} days in {workdir} ({time.perf_counter() - t0:.1f}s); net {args.net_ms:.0f} ms; {args.iterations} flows/session", file=sys.stderr)
+    # One login first, so imports, the food index and other process-wide caches are not charged to the first level.
+    t0 = time.perf_counter(); Session("load0@example.com", 0, 0, args.timeout, seed=0).main()
+    print(f"warm-up {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    results, offset = [], 0
+    for n in args.sessions:
+        r = run_level(store, n, offset, args); offset += n
+        report(r); results.append(r)
+    for n in args.shared:
+        r = run_level(store, n, offset, args, shared=True); offset += 1
+        report(r); results.append(r)
+    if args.save:
+        with open(args.save, "w") as f: json.dump(results, f, indent=2)
+    failures = gate(results, json.load(open(args.baseline)) if args.baseline else [], args.tolerance)
+    for f in failures: print(f"FAIL {f}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Background food lookups (translation + remote search) ---
+MAX_WORKERS = 8
+TRANSLATION_CACHE_SIZE = 4096
+
+class Lookup:
+    """One query in flight. `local` is filled synchronously; `en` and `remote` arrive from the pool."""
+
+    def __init__(self, query):
+        self.query = query
+        self.local, self.en, self.remote = [], None, None
+        self.started = time.perf_counter()
+        self.cancelled = False
+        self._futures, self._hits, self._left, self._lock = [], {}, 0, threading.Lock()
+
+    @property
+    def pending(self):
+        # Local hits from the translated query end the wait; a remote search still in flight is ignored.
+        return not self.cancelled and not self.local and any(not f.done() for f in self._futures)
+
+    def _land(self, slot, hits):
+        """Each background task reports once, in its own slot ("typed" or "en"); the last to land picks
+        English results over those for the query as typed."""
+        with self._lock:
+            self._hits[slot] = hits
+            self._left -= 1
+            if not self._left and not self.cancelled: self.remote = self._hits.get("en") or self._hits.get("typed") or []
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for f in list(self._futures):
+            try: f.result(None if deadline is None else max(0.0, deadline - time.perf_counter()))
+            except Exception: pass
+        return self
+
+    def cancel(self):
+        # Queued work is dropped; a request already on the wire finishes but its result is ignored.
+        self.cancelled = True
+        for f in self._futures: f.cancel()
+
+class LookupService:
+    """Runs translation and remote search off the script thread so a rerun never blocks on the network.
+
+    Local index results come back from `start()` immediately; translation and the Open Food Facts call on the
+    query as typed run side by side on a shared pool and land on the returned Lookup when ready.
+    """
+
+    def __init__(self, translate, remote_search, barcode_lookup, max_workers=MAX_WORKERS):
+        self._translate, self._remote_search, self._barcode_lookup = translate, remote_search, barcode_lookup
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lookup")
+        self._translations, self._lock = OrderedDict(), threading.Lock()
+
+    def translate(self, query):
+        with self._lock:
+            if query in self._translations:
+                self._translations.move_to_end(query); return self._translations[query]
+        en = self._translate(query)
+        with self._lock:
+            self._translations[query] = en
+            while len(self._translations) > TRANSLATION_CACHE_SIZE: self._translations.popitem(last=False)
+        return en
+
+    def start(self, query, local_search):
+        """`local_search(*queries)` ranks the user's local catalog; it is re-run once the translation lands."""
+        lk = Lookup(query)
+        lk.local = local_search(query)
+        # A direct local hit needs no translation or network; the options shown never change under the user.
+        if lk.local: return lk
+        if query.strip().isdigit():
+            lk._futures.append(self._pool.submit(self._run_barcode, lk, local_search))
+            return lk
+        # Translation and the OFF search on the query as typed go out together, so an English query costs one
+        # round trip rather than translate-then-search; the English search follows only if the translation differs.
+        lk._left = 2
+        lk._futures += [self._pool.submit(self._run_remote, lk), self._pool.submit(self._run_text, lk, local_search)]
+        return lk
+
+    def _run_barcode(self, lk, local_search):
+        product = self._barcode_lookup(lk.query.strip())
+        if not lk.cancelled: lk.remote = [product] if product else []
+
+    def _run_remote(self, lk):
+        hits = None
+        try:
+            if not lk.cancelled: hits = self._remote_search(lk.query)
+        finally: lk._land("typed", hits)
+
+    def _run_text(self, lk, local_search):
+        en = hits = None
+        try:
+            if lk.cancelled: return
+            en = self.translate(lk.query)
+            if lk.cancelled or en == lk.query.lower(): return
+            local = local_search(lk.query, en)
+            if lk.cancelled: return
+            if local: lk.local = local; return
+            # Same rule as before: only go global when nothing local matches.
+            hits = self._remote_search(en)
+        finally:
+            lk.en = en
+            lk._land("en", hits)
+
+def replace_lookup(state, key, service, query, local_search):
+    """Returns the session's lookup for `query`, cancelling a stale one for a previous query."""
+    lk = state.get(key)
+    if lk is not None and lk.query == query: return lk
+    if lk is not None: lk.cancel()
+    state[key] = lk = service.start(query, local_search)
+    return lk
@@ -0,0 +1,172 @@
+"""Per-rerun timing spans and counters.
+
+    METRICS_LOG=metrics.jsonl streamlit run cal.py       # one JSON line per rerun (rotated at 20 MB)
+    METRICS_PORT=9108 streamlit run cal.py               # Prometheus text at http://127.0.0.1:9108/metrics
+    METRICS_ADMINS=ops@example.com streamlit run cal.py  # "📈 Metrics" panel in the sidebar for these accounts
+
+Everything is off unless one of these is set, and it is decided at import. Disabled, @timed returns the
+function itself, span() returns one shared no-op context manager (~0.5 us) and count() returns on its first
+line (~50 ns); see ``python bench.py metrics``.
+
+/metrics has no authentication, so it binds to loopback. Set METRICS_HOST=0.0.0.0 (or one interface's
+address) only where the port is firewalled to the scraper.
+
+Spans and counters always feed the process-wide histograms. On the script thread they are also
+attributed to the current rerun (begin_rerun/end_rerun). A rerun cut short by st.rerun()/st.stop() never
+reaches end_rerun(); it is logged when that session's next rerun begins, timed up to its last span.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from contextlib import nullcontext
+from logging.handlers import RotatingFileHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_LOG = os.environ.get("METRICS_LOG", "")
+METRICS_PORT = int(os.environ.get("METRICS_PORT") or 0)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_ADMINS = {e.strip().lower() for e in os.environ.get("METRICS_ADMINS", "").split(",") if e.strip()}
+ENABLED = bool(METRICS_LOG or METRICS_PORT or METRICS_ADMINS)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)   # seconds
+STALE_RUN = 60          # an unfinished rerun idle this long is logged by the next begin_rerun() of any session
+_NOOP = nullcontext()
+
+class Registry:
+    """Process-wide span histograms and event counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans, self.counters = {}, {}   # name -> [count, sum, max, *bucket counts]; name -> n
+
+    def observe(self, name, seconds):
+        with self._lock:
+            s = self.spans.get(name)
+            if s is None: s = self.spans[name] = [0, 0.0, 0.0] + [0] * len(BUCKETS)
+            s[0] += 1; s[1] += seconds; s[2] = max(s[2], seconds)
+            for i, le in enumerate(BUCKETS):
+                if seconds <= le: s[3 + i] += 1; break
+
+    def inc(self, name, n=1):
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def prometheus(self):
+        with self._lock: spans, counters = {k: list(v) for k, v in self.spans.items()}, dict(self.counters)
+        out = ["# HELP myfitness_span_seconds Time spent in instrumented code paths.", "# TYPE myfitness_span_seconds histogram"]
+        for name, s in sorted(spans.items()):
+            cum = 0
+            for le, n in zip(BUCKETS, s[3:]):
+                cum += n; out.append(f'myfitness_span_seconds_bucket{{span="{name}",le="{le}"}} {cum}')
+            out += [f'myfitness_span_seconds_bucket{{span="{name}",le="+Inf"}} {s[0]}',
+                    f'myfitness_span_seconds_sum{{span="{name}"}} {s[1]:.6f}', f'myfitness_span_seconds_count{{span="{name}"}} {s[0]}']
+        out += ["# HELP myfitness_events_total Cache hits/misses, network calls and other events.", "# TYPE myfitness_events_total counter"]
+        out += [f'myfitness_events_total{{event="{name}"}} {n}' for name, n in sorted(counters.items())]
+        return "\n".join(out) + "\n"
+
+    def snapshot(self):
+        """Rows for the admin panel: per span count, mean, p95 (bucket upper bound) and max in ms; then counters."""
+        with self._lock: spans, counters = {k: list(v) for k, v in self.spans.items()}, dict(self.counters)
+        rows = []
+        for name, s in sorted(spans.items(), key=lambda kv: -kv[1][1]):
+            cum, p95 = 0, s[2]
+            for le, n in zip(BUCKETS, s[3:]):
+                cum += n
+                if cum >= 0.95 * s[0]: p95 = min(le, s[2]); break
+            rows.append({"span": name, "count": s[0], "total s": round(s[1], 3), "mean ms": round(1000 * s[1] / s[0], 2), "p95 ms": round(1000 * p95, 2), "max ms": round(1000 * s[2], 2)})
+        return rows, counters
+
+REGISTRY = Registry()
+_local = threading.local()
+_open, _open_lock = {}, threading.Lock()   # session -> unfinished rerun
+_log = None
+if METRICS_LOG:
+    _log = logging.getLogger("myfitness.metrics"); _log.propagate = False; _log.setLevel(logging.INFO)
+    _log.addHandler(RotatingFileHandler(METRICS_LOG, maxBytes=20 * 2 ** 20, backupCount=3, encoding="utf-8"))
+
+def _record(name, seconds):
+    REGISTRY.observe(name, seconds)
+    run = getattr(_local, "run", None)
+    if run is not None:
+        s = run["spans"].setdefault(name, [0, 0.0]); s[0] += 1; s[1] += seconds
+        run["last"] = time.perf_counter()
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name): self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter(); return self
+
+    def __exit__(self, *exc):
+        _record(self.name, time.perf_counter() - self.t0)
+
+def span(name):
+    """`with span("ui.summary"): ...` times a block."""
+    return _Span(name) if ENABLED else _NOOP
+
+def timed(name):
+    """Decorator form of span(); the undecorated function when metrics are off."""
+    def wrap(fn):
+        if not ENABLED: return fn
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: _record(name, time.perf_counter() - t0)
+        return inner
+    return wrap
+
+def count(name, n=1):
+    if not ENABLED: return
+    REGISTRY.inc(name, n)
+    run = getattr(_local, "run", None)
+    if run is not None: run["counters"][name] = run["counters"].get(name, 0) + n
+
+def _finish(run, end, complete):
+    seconds = end - run["t0"]
+    # A cut-short rerun's real end is unknown, so it is counted but kept out of the rerun histogram.
+    if complete: REGISTRY.observe("rerun", seconds)
+    else: REGISTRY.inc("rerun.cut_short")
+    if _log is None: return
+    _log.info(json.dumps({"ts": round(run["ts"], 3), "session": run["session"], "ms": round(1000 * seconds, 2), "complete": complete,
+                          "spans": {k: [n, round(1000 * s, 2)] for k, (n, s) in run["spans"].items()}, "counters": run["counters"]}))
+
+def begin_rerun(session):
+    """Called at the top of the script; finishes this session's previous rerun if st.rerun()/st.stop() cut it short."""
+    if not ENABLED: return
+    now = time.perf_counter()
+    run = {"session": session, "ts": time.time(), "t0": now, "last": now, "spans": {}, "counters": {}}
+    with _open_lock:
+        stale = [s for s, r in _open.items() if s == session or now - r["last"] > STALE_RUN]
+        cut = [_open.pop(s) for s in stale]
+        _open[session] = run
+    for r in cut: _finish(r, r["last"], False)
+    _local.run = run
+
+def end_rerun():
+    """Called at the bottom of the script."""
+    run = getattr(_local, "run", None)
+    if run is None: return
+    _local.run = None
+    with _open_lock:
+        if _open.get(run["session"]) is run: del _open[run["session"]]
+    _finish(run, time.perf_counter(), True)
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Serves REGISTRY.prometheus() at /metrics on a daemon thread; returns the server, or None if the port is taken."""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+        def do_GET(self):
+            body = REGISTRY.prometheus().encode() if self.path.split("?")[0] == "/metrics" else b""
+            self.send_response(200 if body else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body))); self.end_headers()
+            self.wfile.write(body)
+    try: server = ThreadingHTTPServer((host, port), Handler)
+    except OSError: return None   # another app process already serves this port
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from off_local import open_table
+from metrics import span, count
+
+# --- Open Food Facts client with a two-tier cache ---
+OFF_BASE_URL = os.environ.get("OFF_BASE_URL", "https://world.openfoodfacts.org")
+OFF_LOCAL_TABLE = os.environ.get("OFF_LOCAL_TABLE", "off_table")        # built by `python off_local.py import ...`
+OFF_NETWORK_FALLBACK = os.environ.get("OFF_NETWORK_FALLBACK", "")       # "1"/"0"; unset = only when there is no local table
+CACHE_FILE = "off_cache.db"
+TTL = 7 * 24 * 3600           # found products / non-empty searches
+NEGATIVE_TTL = 24 * 3600      # unknown barcode, empty search
+ERROR_TTL = 60                # timeouts / 5xx: don't hammer OFF on every rerun, retry soon
+MAX_DISK_ENTRIES = 50000
+MAX_MEMORY_ENTRIES = 512
+SEARCH_FIELDS = "product_name,nutriments,brands,code"
+
+def normalize_query(q):
+    return " ".join(str(q).lower().split())
+
+class OFFCache:
+    """In-memory LRU in front of an SQLite table; both tiers honour per-entry expiry."""
+
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_DISK_ENTRIES, memory_entries=MAX_MEMORY_ENTRIES):
+        self.path, self.max_entries, self.memory_entries = path, max_entries, memory_entries
+        self._mem, self._lock, self._local = OrderedDict(), threading.Lock(), threading.local()
+        self._puts = 0
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL NOT NULL, accessed REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key, default=None):
+        """Returns the cached value (which may be a cached miss, i.e. None) or `default` when absent/expired."""
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and hit[0] > now:
+                self._mem.move_to_end(key); return hit[1]
+        row = self._conn().execute("SELECT value, expires FROM cache WHERE key=?", (key,)).fetchone()
+        if not row or row[1] <= now: return default
+        self._conn().execute("UPDATE cache SET accessed=? WHERE key=?", (now, key))
+        value = json.loads(row[0])
+        self._remember(key, row[1], value)
+        return value
+
+    def put(self, key, value, ttl):
+        now = time.time()
+        self._remember(key, now + ttl, value)
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)", (key, json.dumps(value, ensure_ascii=False), now + ttl, now))
+        self._puts += 1
+        if self._puts % 100 == 0: self.evict()
+
+    def evict(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        over = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if over > 0: conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (over,))
+
+    def _remember(self, key, expires, value):
+        with self._lock:
+            self._mem[key] = (expires, value); self._mem.move_to_end(key)
+            while len(self._mem) > self.memory_entries: self._mem.popitem(last=False)
+
+_MISSING = object()
+
+class OFFClient:
+    """Barcode and text lookups: the local OFF table first, then Open Food Facts over one pooled keep-alive session."""
+
+    def __init__(self, base_url=OFF_BASE_URL, cache=None, timeout=5, local=None, network=None):
+        self.base_url, self.timeout = base_url.rstrip("/"), timeout
+        self.local = local
+        self.network = network if network is not None else (OFF_NETWORK_FALLBACK == "1" if OFF_NETWORK_FALLBACK else local is None)
+        self.cache = cache if cache is not None else OFFCache()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter); self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = "MyFitnessPro/1.0"
+
+    def _cached(self, key, fetch):
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING: count("off.cache.hit"); return value
+        count("off.cache.miss"); count("net.off")
+        try:
+            with span("off.request"): value = fetch()
+        except (requests.RequestException, ValueError):
+            self.cache.put(key, None, ERROR_TTL); return None
+        self.cache.put(key, value, TTL if value else NEGATIVE_TTL)
+        return value
+
+    @classmethod
+    def from_env(cls):
+        return cls(local=open_table(OFF_LOCAL_TABLE))
+
+    def product(self, barcode):
+        barcode = str(barcode).strip()
+        if self.local is not None:
+            with span("off.local"): hit = self.local.product(barcode)
+            if hit or not self.network: return hit
+        def fetch():
+            res = self.session.get(f"{self.base_url}/api/v0/product/{barcode}.json", timeout=self.timeout)
+            if res.status_code == 404: return None
+            res.raise_for_status()
+            data = res.json()
+            if not isinstance(data, dict): raise ValueError("unexpected OFF response")
+            return data.get("product") if data.get("status") == 1 else None
+        return self._cached(f"barcode:{barcode}", fetch)
+
+    def search(self, en_query):
+        q = normalize_query(en_query)
+        if self.local is not None:
+            with span("off.local"): hits = self.local.search(q)
+            if hits or not self.network: return hits
+        def fetch():
+            res = self.session.get(f"{self.base_url}/cgi/search.pl", params={"action": "process", "search_terms": q, "json": "True", "fields": SEARCH_FIELDS}, timeout=self.timeout)
+            res.raise_for_status()
+            data = res.json()
+            if not isinstance(data, dict): raise ValueError("unexpected OFF response")
+            products = data.get("products")
+            seen, unique = set(), []
+            for p in products if isinstance(products, list) else []:
+                name = p.get('product_name') if isinstance(p, dict) else None
+                if name and name not in seen: seen.add(name); unique.append(p)
+            return unique
+        return self._cached(f"search:{q}", fetch) or []
@@ -0,0 +1,229 @@
+"""Compact local copy of the Open Food Facts catalog.
+
+    python off_local.py import en.openfoodfacts.org.products.csv.gz --out off_table
+    python off_local.py lookup 7290000066318 --table off_table
+    python off_local.py search "greek yogurt" --table off_table
+
+The export (CSV/TSV or JSONL, optionally gzipped) is stream-parsed one product at a time. Only
+code, name, brand and the four ``*_100g`` nutriments the app uses are kept, in flat files that
+are memory-mapped at read time:
+
+    nutrients.f32          4 x float32 per row (NaN = missing)
+    text.off / text.bin    u64 offsets into "code\\x1fname\\x1fbrand" UTF-8 records
+    index.key / index.row  open-addressing hash table: barcode (u64) -> row (u32)
+    vocab.off / vocab.bin  sorted name tokens
+    postings.off / .u32    rows per token, ordered by name length
+"""
+import os
+import sys
+import csv
+import gzip
+import json
+import math
+import mmap
+import bisect
+import argparse
+from array import array
+from food_search import normalize
+
+NUTRIENTS = ("energy-kcal_100g", "proteins_100g", "carbohydrates_100g", "fat_100g")
+TABLE_VERSION = 1
+_SEP = "\x1f"
+VERIFY_LIMIT = 256
+_HASH_MUL = 0x9E3779B97F4A7C15
+_U64 = (1 << 64) - 1
+
+def barcode_key(code):
+    """Numeric barcodes as u64 (leading zeros fold, so UPC-A and its EAN-13 form match); None otherwise."""
+    code = str(code).strip()
+    if not code.isdigit() or len(code) > 19: return None
+    return int(code) or None
+
+def _slot(key, bits):
+    return ((key * _HASH_MUL) & _U64) >> (64 - bits)
+
+def _num(v):
+    try:
+        f = float(v)
+        return f if math.isfinite(f) else math.nan
+    except (TypeError, ValueError): return math.nan
+
+# --- Streaming parsers ---
+def _open_text(path):
+    return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="") if path.endswith(".gz") else open(path, "r", encoding="utf-8", errors="replace", newline="")
+
+def iter_products(path):
+    """Yields (code, name, brand, [kcal, prot, carb, fat]) from an OFF CSV/TSV or JSONL export."""
+    base = path[:-3] if path.endswith(".gz") else path
+    with _open_text(path) as f:
+        if base.endswith((".jsonl", ".json", ".ndjson")):
+            for line in f:
+                try: p = json.loads(line)
+                except ValueError: continue
+                n = p.get("nutriments") or {}
+                yield p.get("code", ""), p.get("product_name") or "", p.get("brands") or "", [_num(n.get(k)) for k in NUTRIENTS]
+        else:
+            csv.field_size_limit(sys.maxsize)
+            # The OFF CSV export is tab separated and unquoted despite its extension.
+            delim = "," if base.endswith(".csv") and "\t" not in f.readline() else "\t"
+            f.seek(0)
+            for row in csv.DictReader(f, delimiter=delim, quoting=csv.QUOTE_NONE if delim == "\t" else csv.QUOTE_MINIMAL):
+                yield row.get("code", ""), row.get("product_name") or "", row.get("brands") or "", [_num(row.get(k)) for k in NUTRIENTS]
+
+# --- Builder ---
+def build_table(products, out_dir, progress_every=500000):
+    """Writes the table from an iterable of products; memory is O(rows) for the index only, never the dump."""
+    os.makedirs(out_dir, exist_ok=True)
+    keys, lengths, postings = array("Q"), array("H"), {}
+    offset, n = 0, 0
+    with open(os.path.join(out_dir, "nutrients.f32"), "wb") as fn, open(os.path.join(out_dir, "text.bin"), "wb") as ft, open(os.path.join(out_dir, "text.off"), "wb") as fo:
+        array("Q", [0]).tofile(fo)
+        for code, name, brand, nutr in products:
+            name = " ".join(name.split())
+            if not name or all(math.isnan(v) for v in nutr): continue
+            rec = _SEP.join((str(code).strip(), name, " ".join(brand.split(",")[0].split()))).encode("utf-8")
+            ft.write(rec); offset += len(rec)
+            array("Q", [offset]).tofile(fo)
+            array("f", nutr).tofile(fn)
+            keys.append(barcode_key(code) or 0)
+            key = normalize(name)
+            lengths.append(min(len(key), 0xFFFF))
+            for tok in set(key.split()): postings.setdefault(tok, array("I")).append(n)
+            n += 1
+            if progress_every and n % progress_every == 0: print(f"  {n:,} products", file=sys.stderr)
+    # Barcode hash index, load factor <= 0.5; later duplicates of a barcode win.
+    bits = max(4, (2 * n).bit_length())
+    slots_key, slots_row = array("Q", bytes(8 << bits)), array("I", bytes(4 << bits))
+    for row, key in enumerate(keys):
+        if not key: continue
+        s = _slot(key, bits)
+        while slots_key[s] and slots_key[s] != key: s = (s + 1) & ((1 << bits) - 1)
+        slots_key[s], slots_row[s] = key, row
+    with open(os.path.join(out_dir, "index.key"), "wb") as f: slots_key.tofile(f)
+    with open(os.path.join(out_dir, "index.row"), "wb") as f: slots_row.tofile(f)
+    del keys, slots_key, slots_row
+    vocab = sorted(postings)
+    with open(os.path.join(out_dir, "vocab.bin"), "wb") as fv, open(os.path.join(out_dir, "vocab.off"), "wb") as fvo, \
+         open(os.path.join(out_dir, "postings.u32"), "wb") as fp, open(os.path.join(out_dir, "postings.off"), "wb") as fpo:
+        voff, poff = array("Q", [0]), array("Q", [0])
+        for tok in vocab:
+            b = tok.encode("utf-8"); fv.write(b); voff.append(voff[-1] + len(b))
+            plist = postings.pop(tok)
+            array("I", sorted(plist, key=lengths.__getitem__)).tofile(fp); poff.append(poff[-1] + len(plist))
+        voff.tofile(fvo); poff.tofile(fpo)
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": TABLE_VERSION, "rows": n, "index_bits": bits, "tokens": len(vocab)}, f)
+    return n
+
+# --- Reader ---
+def _map(path, fmt):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: return memoryview(b"").cast(fmt)
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast(fmt)
+
+class _Vocab:
+    """Sorted token list over mmapped bytes, indexable for bisect."""
+    def __init__(self, data, offsets): self.data, self.off = data, offsets
+    def __len__(self): return len(self.off) - 1
+    def __getitem__(self, i): return bytes(self.data[self.off[i]:self.off[i + 1]]).decode("utf-8")
+
+class OFFTable:
+    """Read-only, memory-mapped view of a table written by build_table()."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f: meta = json.load(f)
+        if meta.get("version") != TABLE_VERSION: raise ValueError(f"{path}: unsupported table version {meta.get('version')}")
+        self.rows, self.bits = meta["rows"], meta["index_bits"]
+        j = lambda name: os.path.join(path, name)
+        self._nutr, self._text, self._toff = _map(j("nutrients.f32"), "f"), _map(j("text.bin"), "B"), _map(j("text.off"), "Q")
+        self._ikey, self._irow = _map(j("index.key"), "Q"), _map(j("index.row"), "I")
+        self._vocab = _Vocab(_map(j("vocab.bin"), "B"), _map(j("vocab.off"), "Q"))
+        self._post, self._poff = _map(j("postings.u32"), "I"), _map(j("postings.off"), "Q")
+
+    def __len__(self):
+        return self.rows
+
+    def _fields(self, row):
+        return bytes(self._text[self._toff[row]:self._toff[row + 1]]).decode("utf-8").split(_SEP)
+
+    def row(self, row):
+        """The product in the shape the OFF API returns (product_name, brands, code, nutriments)."""
+        code, name, brand = self._fields(row)
+        vals = self._nutr[4 * row:4 * row + 4]
+        return {"code": code, "product_name": name, "brands": brand, "nutriments": {k: round(v, 3) for k, v in zip(NUTRIENTS, vals) if not math.isnan(v)}}
+
+    def product(self, barcode):
+        key = barcode_key(barcode)
+        if not key: return None
+        mask, s = (1 << self.bits) - 1, _slot(key, self.bits)
+        while self._ikey[s]:
+            if self._ikey[s] == key: return self.row(self._irow[s])
+            s = (s + 1) & mask
+        return None
+
+    def _token_rows(self, tok, prefix):
+        lo = bisect.bisect_left(self._vocab, tok)
+        hi = bisect.bisect_right(self._vocab, tok + "\uffff", lo, min(lo + 8, len(self._vocab))) if prefix else lo + (lo < len(self._vocab) and self._vocab[lo] == tok)
+        return [self._post[self._poff[t]:self._poff[t + 1]] for t in range(lo, hi)]
+
+    def _matches(self, row, terms):
+        ntoks = normalize(self._fields(row)[1]).split()
+        return all(any(n == t or (pre and n.startswith(t)) for n in ntoks) for t, pre, _ in terms)
+
+    def search(self, query, limit=10):
+        """Products whose name has every query token (the last one as a prefix), shortest names first."""
+        toks = list(dict.fromkeys(normalize(query).split()))
+        terms = [(t, i == len(toks) - 1, self._token_rows(t, prefix=i == len(toks) - 1)) for i, t in enumerate(toks)]
+        if not terms or not all(ls for _, _, ls in terms): return []
+        terms.sort(key=lambda term: sum(len(p) for p in term[2]))
+        if len(terms) == 1:
+            out = set()
+            for plist in terms[0][2]: out.update(plist[:limit])
+        else:
+            cand = set().union(*terms[0][2])
+            for k, (_, _, ls) in enumerate(terms[1:], 1):
+                if len(cand) <= VERIFY_LIMIT:
+                    # Few candidates left: check the remaining tokens against the names instead of building id sets.
+                    out = {r for r in cand if self._matches(r, terms[k:])}; break
+                if k == len(terms) - 1:
+                    # Most common token: walk its length-ordered rows and stop after `limit` hits per list.
+                    out = set()
+                    for plist in ls:
+                        hits = 0
+                        for row in plist:
+                            if row in cand:
+                                out.add(row); hits += 1
+                                if hits >= limit: break
+                    break
+                cand &= set().union(*ls)
+        return [self.row(r) for r in sorted(out, key=lambda r: self._toff[r + 1] - self._toff[r])[:limit]]
+
+def open_table(path):
+    return OFFTable(path) if os.path.exists(os.path.join(path, "meta.json")) else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("import", help="build a table from an OFF CSV/JSONL export")
+    p.add_argument("dump"); p.add_argument("--out", default="off_table")
+    p = sub.add_parser("lookup", help="look up one barcode"); p.add_argument("barcode"); p.add_argument("--table", default="off_table")
+    p = sub.add_parser("search", help="search names"); p.add_argument("query"); p.add_argument("--table", default="off_table"); p.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    if args.cmd == "import":
+        tmp = args.out + ".tmp"
+        n = build_table(iter_products(args.dump), tmp)
+        # Swap in the finished table so a running app never maps a half-written one.
+        if os.path.isdir(args.out):
+            old = args.out + ".old"; os.replace(args.out, old)
+            for f in os.listdir(old): os.remove(os.path.join(old, f))
+            os.rmdir(old)
+        os.replace(tmp, args.out)
+        print(f"{n:,} products -> {args.out}")
+    else:
+        table = open_table(args.table)
+        if table is None: sys.exit(f"no table at {args.table}")
+        res = [table.product(args.barcode)] if args.cmd == "lookup" else table.search(args.query, args.limit)
+        for r in res: print(json.dumps(r, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Daily SMS alerts for every opted-in user, outside the Streamlit app.
+
+    python sms_scheduler.py                                   # today, mock sender (prints)
+    python sms_scheduler.py --gateway-url http://sms.local/send --rate 500 --workers 64
+    python sms_scheduler.py --every 3600                      # keep running, one pass per hour
+
+Each pass pages through users with sms_alerts on, builds the same text the Summary tab shows from the
+day's totals, claims the user/day in ``sms_sent`` (so a user gets one alert per day even with several
+schedulers running) and sends through a thread pool behind a token-bucket rate limit. Transient gateway
+errors (timeouts, 429, 5xx) are retried with jittered exponential backoff; whatever is still failing, or
+not reached before ``--budget`` runs out, is picked up again by the next pass. A permanent rejection (any
+other 4xx, e.g. an invalid number) is recorded as 'rejected' and not retried that day.
+
+Budget: at the default 500 msg/s, 100k opted-in users take ~200 s of sending, inside the default
+300 s budget (see ``python bench.py sms``).
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from store import FitnessStore, STORE_FILE
+from alerts import generate_sms_alert, send_real_sms_mock, remaining
+
+SMS_GATEWAY_URL = os.environ.get("SMS_GATEWAY_URL", "")
+SMS_GATEWAY_TOKEN = os.environ.get("SMS_GATEWAY_TOKEN", "")
+RATE = 500             # messages per second, across all workers
+WORKERS = 64
+BUDGET = 300           # seconds per pass
+MAX_ATTEMPTS = 4
+BACKOFF, BACKOFF_CAP = 0.5, 8.0
+
+# --- Senders ---
+class SendError(Exception):
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable, self.retry_after = retryable, retry_after
+
+class MockSender:
+    """The app's existing mock: prints instead of sending."""
+    def send(self, phone, text):
+        send_real_sms_mock(phone, text)
+
+class HTTPSender:
+    """POSTs {"to", "body"} as JSON to a gateway over pooled keep-alive connections."""
+
+    def __init__(self, url, token=SMS_GATEWAY_TOKEN, timeout=10, pool_size=WORKERS):
+        self.url, self.timeout = url, timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter); self.session.mount("http://", adapter)
+        if token: self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def send(self, phone, text):
+        try: res = self.session.post(self.url, json={"to": phone, "body": text}, timeout=self.timeout)
+        except requests.RequestException as e: raise SendError(str(e))
+        if res.status_code < 300: return
+        retry_after = res.headers.get("Retry-After")
+        retry_after = float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None
+        raise SendError(f"HTTP {res.status_code}", retryable=res.status_code == 429 or res.status_code >= 500, retry_after=retry_after)
+
+# --- Dispatch ---
+class RateLimiter:
+    """Token bucket shared by all workers: `rate` per second, up to `burst` back to back."""
+
+    def __init__(self, rate, burst=None):
+        self.interval = 1.0 / rate
+        self.window = (burst or max(1, int(rate // 10))) * self.interval
+        self._next, self._lock = time.monotonic(), threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Blocks for the next slot; False (without waiting) if that slot is past `deadline`."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now - self.window)
+            if deadline is not None and slot > deadline: return False
+            self._next = slot + self.interval
+        if slot > now: time.sleep(slot - now)
+        return True
+
+def deliver(sender, limiter, phone, text, deadline, max_attempts=MAX_ATTEMPTS):
+    """Returns (status, attempts): 'sent', 'failed' (retryable), 'rejected' (permanent) or 'deferred' (budget ran out first)."""
+    for attempt in range(1, max_attempts + 1):
+        if not limiter.acquire(deadline): return "deferred", attempt - 1
+        try:
+            sender.send(phone, text); return "sent", attempt
+        except SendError as e:
+            if not e.retryable: return "rejected", attempt
+            if attempt == max_attempts: return "failed", attempt
+            delay = e.retry_after if e.retry_after is not None else min(BACKOFF_CAP, BACKOFF * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            if time.monotonic() + delay > deadline: return "deferred", attempt
+            time.sleep(delay)
+        except Exception:
+            return "failed", attempt
+    return "failed", max_attempts
+
+def alert_text(row):
+    """The Summary tab's alert for one sms_candidates() row; None if the user has no targets yet."""
+    profile = json.loads(row["profile"] or "{}")
+    targets = profile.get("targets")
+    if not targets: return None
+    rem_c, rem_p, rem_w = remaining(targets, row["food"], row["burned"], row["protein"], row["water"])
+    return generate_sms_alert(None, rem_c, rem_p, rem_w, profile.get("goal"))
+
+def run_pass(store, sender, day=None, rate=RATE, workers=WORKERS, budget=BUDGET, batch=5000, log=sys.stderr):
+    """One scheduler pass over all opted-in users; returns counters."""
+    day, run_id = str(day or date.today()), uuid.uuid4().hex
+    started = time.monotonic(); deadline = started + budget
+    limiter = RateLimiter(rate)
+    stats = {"candidates": 0, "claimed": 0, "sent": 0, "failed": 0, "rejected": 0, "deferred": 0, "skipped": 0}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sms") as pool:
+        for rows in store.sms_candidates(day, batch):
+            if time.monotonic() >= deadline: break
+            stats["candidates"] += len(rows)
+            texts = {r["email"]: (r["phone"], alert_text(r)) for r in rows}
+            skipped = [e for e, (_, text) in texts.items() if text is None]
+            stats["skipped"] += len(skipped)
+            owned = store.claim_sms(day, [e for e in texts if e not in skipped], run_id)
+            stats["claimed"] += len(owned)
+            futures = {e: pool.submit(deliver, sender, limiter, *texts[e], deadline) for e in owned}
+            results = [(e, *f.result()) for e, f in futures.items()]
+            store.finish_sms(day, results)
+            for _, status, _ in results: stats[status] += 1
+            print(f"  {stats['sent']:,} sent, {stats['failed']:,} failed, {stats['rejected']:,} rejected, {stats['deferred']:,} deferred ({time.monotonic() - started:.0f}s)", file=log)
+    stats["seconds"] = round(time.monotonic() - started, 2)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=STORE_FILE)
+    parser.add_argument("--day", help="YYYY-MM-DD; default today")
+    parser.add_argument("--gateway-url", default=SMS_GATEWAY_URL, help="HTTP gateway; default: mock sender (or $SMS_GATEWAY_URL)")
+    parser.add_argument("--rate", type=float, default=RATE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--budget", type=float, default=BUDGET, help="seconds per pass")
+    parser.add_argument("--every", type=float, default=0, help="repeat every N seconds (0 = one pass)")
+    args = parser.parse_args()
+    store = FitnessStore(args.db, legacy_json=None)
+    sender = HTTPSender(args.gateway_url, pool_size=args.workers) if args.gateway_url else MockSender()
+    while True:
+        print(json.dumps(run_pass(store, sender, args.day, args.rate, args.workers, args.budget)))
+        if not args.every: break
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    main()
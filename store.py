@@ -0,0 +1,702 @@
+import sqlite3
+import threading
+import json
+import os
+import sys
+import time
+import random
+import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, timedelta
+from metrics import timed, span, count
+
+# --- SQLite user store (WAL, per-record writes) ---
+STORE_FILE = "myfitness.db"
+LEGACY_JSON = "myfitness_users_db.json"
+SCHEMA_VERSION = 7
+SMS_STALE_AFTER = 15 * 60   # a 'queued' claim older than this belongs to a crashed run and may be retaken
+USER_CACHE_SIZE = 2048
+WEIGHT_CACHE_SIZE = 256     # full weigh-in logs kept for the chart; only users on the Weight tab need one
+TREND_ALPHA = 0.1           # weight trend: share of each day's weigh-in in the exponentially smoothed trend
+
+FOOD_COLS = ("Meal", "Food", "Grams", "Calories", "Protein", "Carbs", "Fat")
+MACROS = ("Calories", "Protein", "Carbs", "Fat")
+USER_COLS = ("password", "username", "profile_pic", "phone", "sms_alerts", "onboarding_done", "profile")
+
+_ADD = ", ".join(f'"{m}"="{m}"+excluded."{m}"' for m in MACROS)
+_SUB = ", ".join(f'"{m}"="{m}"-OLD."{m}"' for m in MACROS)
+_NEW = ", ".join(f'NEW."{m}"' for m in MACROS)
+_MACRO_COLS = ", ".join(f'"{m}"' for m in MACROS)
+_MACRO_SUMS = ", ".join(f'TOTAL("{m}") AS "{m}"' for m in MACROS)
+
+# Per-day tables. Every log is keyed (email, "Date", ...), so a day or a date range of one user is a
+# single contiguous index range however long the history is.
+# Running totals are maintained by triggers so every write path (app, migration, imports) keeps them exact.
+# A row disappears when its last entry is deleted, which also drops accumulated float error.
+DAY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meal_totals (
+    email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE, "Date" TEXT NOT NULL, "Meal" TEXT NOT NULL, entries INTEGER NOT NULL,
+    {", ".join(f'"{m}" REAL NOT NULL' for m in MACROS)}, PRIMARY KEY (email, "Date", "Meal")
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS exercise_totals (
+    email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE, "Date" TEXT NOT NULL, entries INTEGER NOT NULL, "Burned" REAL NOT NULL,
+    PRIMARY KEY (email, "Date")
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS water_log (
+    email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE, "Date" TEXT NOT NULL, liters REAL NOT NULL,
+    PRIMARY KEY (email, "Date")
+) WITHOUT ROWID;
+"""
+
+_FOOD_KEY = """email=OLD.email AND "Date"=OLD."Date" AND "Meal"=COALESCE(OLD."Meal", '')"""
+_FOOD_IN = f"""INSERT INTO meal_totals (email, "Date", "Meal", entries, {_MACRO_COLS}) VALUES (NEW.email, NEW."Date", COALESCE(NEW."Meal", ''), 1, {_NEW})
+        ON CONFLICT(email, "Date", "Meal") DO UPDATE SET entries=entries+1, {_ADD};"""
+_FOOD_OUT = f"""UPDATE meal_totals SET entries=entries-1, {_SUB} WHERE {_FOOD_KEY};
+        DELETE FROM meal_totals WHERE {_FOOD_KEY} AND entries<=0;"""
+_EX_IN = """INSERT INTO exercise_totals (email, "Date", entries, "Burned") VALUES (NEW.email, NEW."Date", 1, NEW."Burned")
+        ON CONFLICT(email, "Date") DO UPDATE SET entries=entries+1, "Burned"="Burned"+excluded."Burned";"""
+_EX_OUT = """UPDATE exercise_totals SET entries=entries-1, "Burned"="Burned"-OLD."Burned" WHERE email=OLD.email AND "Date"=OLD."Date";
+        DELETE FROM exercise_totals WHERE email=OLD.email AND "Date"=OLD."Date" AND entries<=0;"""
+TRIGGERS = {
+    "food_log_ai": f"AFTER INSERT ON food_log BEGIN {_FOOD_IN} END",
+    "food_log_ad": f"AFTER DELETE ON food_log BEGIN {_FOOD_OUT} END",
+    "food_log_au": f"AFTER UPDATE ON food_log BEGIN {_FOOD_OUT} {_FOOD_IN} END",
+    "exercise_log_ai": f"AFTER INSERT ON exercise_log BEGIN {_EX_IN} END",
+    "exercise_log_ad": f"AFTER DELETE ON exercise_log BEGIN {_EX_OUT} END",
+    "exercise_log_au": f"AFTER UPDATE ON exercise_log BEGIN {_EX_OUT} {_EX_IN} END",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY, password TEXT NOT NULL, username TEXT, profile_pic TEXT NOT NULL DEFAULT '',
+    phone TEXT NOT NULL DEFAULT '', sms_alerts INTEGER NOT NULL DEFAULT 0, onboarding_done INTEGER NOT NULL DEFAULT 0,
+    profile TEXT NOT NULL DEFAULT '{}', version INTEGER NOT NULL DEFAULT 0, weight_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS food_log (
+    id INTEGER PRIMARY KEY, email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE, "Date" TEXT NOT NULL,
+    "Meal" TEXT, "Food" TEXT, "Grams" REAL, "Calories" REAL, "Protein" REAL, "Carbs" REAL, "Fat" REAL
+);
+CREATE INDEX IF NOT EXISTS food_log_day ON food_log(email, "Date", "Meal");
+CREATE TABLE IF NOT EXISTS exercise_log (
+    id INTEGER PRIMARY KEY, email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE, "Date" TEXT NOT NULL, "Exercise" TEXT, "Burned" REAL
+);
+CREATE INDEX IF NOT EXISTS exercise_log_day ON exercise_log(email, "Date");
+CREATE TABLE IF NOT EXISTS weight_log (
+    email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE, "Date" TEXT NOT NULL, "Weight" REAL, "Trend" REAL,
+    PRIMARY KEY (email, "Date")
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS custom_foods (
+    email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE, name TEXT NOT NULL,
+    cals REAL, prot REAL, carb REAL, fat REAL, PRIMARY KEY (email, name)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users(username);
+CREATE INDEX IF NOT EXISTS users_sms ON users(email) WHERE sms_alerts=1 AND phone<>'';
+CREATE TABLE IF NOT EXISTS sms_sent (
+    email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE, "Date" TEXT NOT NULL, status TEXT NOT NULL,
+    run_id TEXT, attempts INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL, PRIMARY KEY (email, "Date")
+) WITHOUT ROWID;
+"""
+
+# Applied in order to files created by older versions, before SCHEMA runs.
+MIGRATIONS = {
+    2: ["ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0"],
+    3: [],  # per-user totals; rebuilt per day by 4
+    # Undated rows were "today" (the app had no history), so they land on the migration date.
+    # users.water_liters stays behind unused; water lives in water_log.
+    4: [*(f"DROP TRIGGER IF EXISTS {name}" for name in TRIGGERS),
+        "DROP TABLE IF EXISTS meal_totals", "DROP TABLE IF EXISTS exercise_totals", "DROP INDEX IF EXISTS food_log_email", "DROP INDEX IF EXISTS exercise_log_email",
+        """ALTER TABLE food_log ADD COLUMN "Date" TEXT NOT NULL DEFAULT ''""", """UPDATE food_log SET "Date"=date('now', 'localtime')""",
+        """ALTER TABLE exercise_log ADD COLUMN "Date" TEXT NOT NULL DEFAULT ''""", """UPDATE exercise_log SET "Date"=date('now', 'localtime')""",
+        *(stmt for stmt in DAY_SCHEMA.split(";") if stmt.strip()),
+        f"""INSERT INTO meal_totals (email, "Date", "Meal", entries, {_MACRO_COLS}) SELECT email, "Date", COALESCE("Meal", ''), COUNT(*), {_MACRO_SUMS} FROM food_log GROUP BY 1, 2, 3""",
+        """INSERT INTO exercise_totals (email, "Date", entries, "Burned") SELECT email, "Date", COUNT(*), TOTAL("Burned") FROM exercise_log GROUP BY 1, 2""",
+        """INSERT INTO water_log (email, "Date", liters) SELECT email, date('now', 'localtime'), water_liters FROM users WHERE water_liters > 0"""],
+    # Usernames become unique: older files could hold duplicates (registration used the email prefix as is).
+    6: ["""UPDATE users SET username=username || '_' || rowid WHERE username IS NOT NULL
+           AND rowid NOT IN (SELECT MIN(rowid) FROM users WHERE username IS NOT NULL GROUP BY username)"""],
+    # Trend stays NULL on existing rows until get_weights() first reads them.
+    7: ["ALTER TABLE users ADD COLUMN weight_version INTEGER NOT NULL DEFAULT 0", '''ALTER TABLE weight_log ADD COLUMN "Trend" REAL'''],
+}
+
+FOOD_SELECT = ", ".join(f'"{c}"' for c in FOOD_COLS)
+FOOD_INSERT = f"""INSERT INTO food_log (email, "Date", {FOOD_SELECT}) VALUES (?, ?{', ?' * len(FOOD_COLS)})"""
+EXERCISE_INSERT = 'INSERT INTO exercise_log (email, "Date", "Exercise", "Burned") VALUES (?, ?, ?, ?)'
+WEIGHT_UPSERT = 'INSERT INTO weight_log (email, "Date", "Weight") VALUES (?, ?, ?) ON CONFLICT(email, "Date") DO UPDATE SET "Weight"=excluded."Weight"'
+WATER_UPSERT = 'INSERT INTO water_log (email, "Date", liters) VALUES (?, ?, ?) ON CONFLICT(email, "Date") DO UPDATE SET liters=excluded.liters'
+# Diary logs as diary_io exports and imports them: table, keyset order, data columns after (email, Date).
+DIARY = {
+    "food": ("food_log", ("email", "Date", "id"), FOOD_COLS),
+    "exercise": ("exercise_log", ("email", "Date", "id"), ("Exercise", "Burned")),
+    "weight": ("weight_log", ("email", "Date"), ("Weight",)),
+    "water": ("water_log", ("email", "Date"), ("liters",)),
+}
+
+def _day(day=None):
+    """ISO date key; None means today, so the dashboard rolls over at midnight without a reset."""
+    return str(day or date.today())
+
+def week_range(day=None):
+    d = date.fromisoformat(_day(day))
+    return d - timedelta(days=d.weekday()), d + timedelta(days=6 - d.weekday())
+
+def month_range(day=None):
+    d = date.fromisoformat(_day(day))
+    nxt = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return d.replace(day=1), nxt - timedelta(days=1)
+
+def _trend(prev_day, prev_trend, day, weight):
+    """One step of the time-aware EMA: a gap of n days decays the old trend as n daily steps would."""
+    if prev_trend is None: return weight
+    try: days = max((date.fromisoformat(day[:10]) - date.fromisoformat(prev_day[:10])).days, 1)
+    except ValueError: days = 1  # legacy rows with unparseable dates count as consecutive days
+    return weight + (prev_trend - weight) * (1 - TREND_ALPHA) ** days
+
+def _num(v):
+    try: return float(v)
+    except (TypeError, ValueError): return 0.0
+
+def _food_row(email, day, e):
+    return (email, day, e.get("Meal"), e.get("Food"), *(_num(e.get(c)) for c in FOOD_COLS[2:]))
+
+# A legacy entry of the wrong shape fails in .get() or in binding its values; SQLite rolls back just that statement.
+LEGACY_ERRORS = (AttributeError, TypeError, ValueError, sqlite3.InterfaceError, sqlite3.ProgrammingError)
+
+class UsernameTaken(ValueError):
+    pass
+
+_import_ids = itertools.count()
+
+class FitnessStore:
+    """Repository over the SQLite file. Every write touches only the rows it changes, inside one transaction.
+
+    Loaded users are kept in a process-wide LRU keyed by the per-user ``version`` counter that every
+    write bumps, so a rerun costs one primary-key lookup while the user is unchanged.
+    """
+
+    def __init__(self, path=STORE_FILE, legacy_json=LEGACY_JSON, cache_size=USER_CACHE_SIZE):
+        self.path = path
+        self._local = threading.local()
+        self._cache, self._cache_size, self._cache_lock = OrderedDict(), cache_size, threading.Lock()
+        self._weights = OrderedDict()   # email -> (weight_version, get_weights rows)
+        with self.transaction() as conn: self._create_schema(conn)
+        if legacy_json and os.path.exists(legacy_json): self.migrate_json(legacy_json)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # One connection per thread: Streamlit runs every session on its own script thread.
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn; return
+        with span("store.write"):
+            conn.execute("BEGIN IMMEDIATE")
+            try: yield conn
+            except BaseException:
+                conn.execute("ROLLBACK"); raise
+            conn.execute("COMMIT")
+
+    def _create_schema(self, conn):
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for v in range(current + 1, SCHEMA_VERSION + 1) if current else ():
+            for stmt in MIGRATIONS.get(v, []): conn.execute(stmt)
+        for stmt in (SCHEMA + DAY_SCHEMA).split(";"):
+            if stmt.strip(): conn.execute(stmt)
+        for name, body in TRIGGERS.items(): conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _touch(self, conn, email):
+        # Drop the cached copy first: callers may have mutated it in place before writing.
+        with self._cache_lock: self._cache.pop(email, None)
+        conn.execute("UPDATE users SET version=version+1 WHERE email=?", (email,))
+
+    # --- Reads ---
+    def user_exists(self, email):
+        return self._conn().execute("SELECT 1 FROM users WHERE email=?", (email,)).fetchone() is not None
+
+    def get_password(self, email):
+        row = self._conn().execute("SELECT password FROM users WHERE email=?", (email,)).fetchone()
+        return row["password"] if row else None
+
+    def username_taken(self, username, exclude_email=None):
+        return self._conn().execute("SELECT 1 FROM users WHERE username=? AND email IS NOT ?", (username, exclude_email)).fetchone() is not None
+
+    def email_for_username(self, username):
+        row = self._conn().execute("SELECT email FROM users WHERE username=?", (username,)).fetchone()
+        return row["email"] if row else None
+
+    def free_username(self, base):
+        """`base` if free, else `base2`..`base4`, then random suffixes of growing length (one index probe each)."""
+        base = base or "user"
+        for name in (base, f"{base}2", f"{base}3", f"{base}4"):
+            if not self.username_taken(name): return name
+        digits = 3
+        while True:
+            name = f"{base}{random.randrange(10 ** digits)}"
+            if not self.username_taken(name): return name
+            digits += 1
+
+    @timed("store.get_user")
+    def get_user(self, email, day=None):
+        """Returns one user in the legacy JSON shape (exercise_log, custom_foods...) for one day.
+
+        ``day`` defaults to today: ``totals``, ``exercise_log`` and ``water_liters`` only cover that
+        partition, so a user with years of history loads like a new one. Food entries are not loaded;
+        ``get_meal`` fetches one meal's rows when they are actually displayed. ``weight`` is the latest
+        weigh-in (None before the first); ``get_weights`` returns the whole log.
+
+        The dict is shared through the cache: treat it as read-only unless a store write for the same user follows.
+        """
+        conn, day = self._conn(), _day(day)
+        row = conn.execute("SELECT version FROM users WHERE email=?", (email,)).fetchone()
+        if row is None: return None
+        with self._cache_lock:
+            hit = self._cache.get(email)
+            if hit and hit[0] == (row["version"], day):
+                self._cache.move_to_end(email); count("store.user_cache.hit"); return hit[1]
+        count("store.user_cache.miss")
+        version, user = self._load_user(conn, email, day)
+        if user is None: return None
+        with self._cache_lock:
+            self._cache[email] = ((version, day), user)
+            while len(self._cache) > self._cache_size: self._cache.popitem(last=False)
+        return user
+
+    def _load_user(self, conn, email, day):
+        snapshot = not conn.in_transaction
+        if snapshot: conn.execute("BEGIN")
+        try: return self._read_user(conn, email, day)
+        finally:
+            if snapshot: conn.execute("COMMIT")
+
+    def _read_user(self, conn, email, day):
+        row = conn.execute("SELECT * FROM users WHERE email=?", (email,)).fetchone()
+        if row is None: return None, None
+        user = {k: row[k] for k in USER_COLS}
+        user["sms_alerts"], user["onboarding_done"] = bool(user["sms_alerts"]), bool(user["onboarding_done"])
+        user["profile"] = json.loads(user["profile"] or "{}")
+        user["day"], user["totals"] = day, self._read_totals(conn, email, day)
+        user["water_liters"] = self._read_water(conn, email, day)
+        user["exercise_log"] = [dict(r) for r in conn.execute('SELECT "Exercise", "Burned" FROM exercise_log WHERE email=? AND "Date"=? ORDER BY id', (email, day))]
+        # The latest weigh-in only (a primary-key seek); the chart reads the full log through get_weights.
+        w = conn.execute('SELECT "Weight" FROM weight_log WHERE email=? ORDER BY "Date" DESC LIMIT 1', (email,)).fetchone()
+        user["weight"] = w["Weight"] if w else None
+        user["custom_foods"] = {r["name"]: {"cals": r["cals"], "prot": r["prot"], "carb": r["carb"], "fat": r["fat"]} for r in conn.execute("SELECT * FROM custom_foods WHERE email=?", (email,))}
+        return row["version"], user
+
+    def _read_totals(self, conn, email, day):
+        meals = {r["Meal"]: dict(r) for r in conn.execute(f'SELECT "Meal", entries, {_MACRO_COLS} FROM meal_totals WHERE email=? AND "Date"=?', (email, day))}
+        totals = {m: sum(t[m] for t in meals.values()) for m in MACROS}
+        row = conn.execute('SELECT "Burned" FROM exercise_totals WHERE email=? AND "Date"=?', (email, day)).fetchone()
+        totals.update(meals=meals, Burned=row["Burned"] if row else 0.0)
+        return totals
+
+    def _read_water(self, conn, email, day):
+        row = conn.execute('SELECT liters FROM water_log WHERE email=? AND "Date"=?', (email, day)).fetchone()
+        return row["liters"] if row else 0.0
+
+    def get_totals(self, email, day=None):
+        """{"Calories", "Protein", "Carbs", "Fat", "Burned", "meals": {meal: {entries, Calories, ...}}}"""
+        return self._read_totals(self._conn(), email, _day(day))
+
+    @timed("store.get_meal")
+    def get_meal(self, email, meal, day=None):
+        return [dict(r) for r in self._conn().execute(f'SELECT {FOOD_SELECT} FROM food_log WHERE email=? AND "Date"=? AND "Meal"=? ORDER BY id', (email, _day(day), meal))]
+
+    @timed("store.get_history")
+    def get_history(self, email, start, end):
+        """Per-day totals for start..end (inclusive), oldest first; days with nothing logged are omitted.
+
+        Reads only the totals/water partitions in the range, never the individual log rows.
+        """
+        conn, bounds = self._conn(), (email, _day(start), _day(end))
+        days = {}
+        blank = lambda d: days.setdefault(d, {"Date": d, **dict.fromkeys(MACROS, 0.0), "Burned": 0.0, "Water": 0.0})
+        for r in conn.execute(f'SELECT "Date", {_MACRO_SUMS} FROM meal_totals WHERE email=? AND "Date" BETWEEN ? AND ? GROUP BY "Date"', bounds):
+            blank(r["Date"]).update({m: r[m] for m in MACROS})
+        for r in conn.execute('SELECT "Date", "Burned" FROM exercise_totals WHERE email=? AND "Date" BETWEEN ? AND ?', bounds): blank(r["Date"])["Burned"] = r["Burned"]
+        for r in conn.execute('SELECT "Date", liters FROM water_log WHERE email=? AND "Date" BETWEEN ? AND ?', bounds): blank(r["Date"])["Water"] = r["liters"]
+        return [days[d] for d in sorted(days)]
+
+    @timed("store.get_weights")
+    def get_weights(self, email):
+        """All weigh-ins, oldest first, as (Date, Weight, Trend) rows; trends missing since the v7 upgrade are filled in."""
+        rows = [dict(r) for r in self._conn().execute('SELECT "Date", "Weight", "Trend" FROM weight_log WHERE email=? ORDER BY "Date"', (email,))]
+        first = next((i for i, r in enumerate(rows) if r["Trend"] is None), None)
+        if first is not None:
+            with self.transaction() as conn: self._update_trend(conn, email, rows[first]["Date"])
+            return self.get_weights(email)
+        return rows
+
+    def weight_series(self, email):
+        """(weight_version, get_weights rows) for the weight chart, from an LRU keyed on weight_version.
+
+        Independent of get_user: a rerun costs one primary-key lookup, and the log is only re-read after a weigh-in.
+        """
+        row = self._conn().execute("SELECT weight_version FROM users WHERE email=?", (email,)).fetchone()
+        if row is None: return None, []
+        with self._cache_lock:
+            hit = self._weights.get(email)
+            if hit and hit[0] == row["weight_version"]:
+                self._weights.move_to_end(email); count("store.weight_cache.hit"); return hit
+        count("store.weight_cache.miss")
+        # Read after the version: a weigh-in in between only makes the cached rows newer than their key.
+        hit = (row["weight_version"], self.get_weights(email))
+        with self._cache_lock:
+            self._weights[email] = hit
+            while len(self._weights) > WEIGHT_CACHE_SIZE: self._weights.popitem(last=False)
+        return hit
+
+    def get_meta(self, key):
+        row = self._conn().execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def inline_avatars(self, batch=100):
+        """Yields pages of (email, base64) for avatars still stored in the row rather than as a content hash.
+
+        Keyset pages by email, so only ``batch`` blobs are in memory at a time.
+        """
+        after = ""
+        while True:
+            rows = self._conn().execute("SELECT email, profile_pic FROM users WHERE length(profile_pic) > 64 AND email > ? ORDER BY email LIMIT ?", (after, batch)).fetchall()
+            if not rows: return
+            after = rows[-1]["email"]
+            yield [(r["email"], r["profile_pic"]) for r in rows]
+
+    def plaintext_passwords(self, batch=1000):
+        """Yields pages of (email, password) for passwords still stored as given (legacy rows) rather than hashed."""
+        after = ""
+        while True:
+            rows = self._conn().execute("SELECT email, password FROM users WHERE substr(password, 1, 7)<>'scrypt$' AND password<>'' AND email>? ORDER BY email LIMIT ?", (after, batch)).fetchall()
+            if not rows: return
+            after = rows[-1]["email"]
+            yield [(r["email"], r["password"]) for r in rows]
+
+    def sms_candidates(self, day=None, batch=5000):
+        """Yields lists of opted-in, onboarded users not yet alerted for ``day``, with that day's totals.
+
+        Each row: email, phone, profile (JSON), food, protein, burned, water. Totals come from the
+        per-day totals tables by primary key, so the scan costs one probe per user whatever the history.
+        """
+        day, stale, after = _day(day), time.time() - SMS_STALE_AFTER, ""
+        while True:
+            # Keyset pages: no cursor stays open across the caller's claim/finish writes.
+            rows = self._conn().execute('''
+                SELECT u.email, u.phone, u.profile,
+                    (SELECT TOTAL("Calories") FROM meal_totals m WHERE m.email=u.email AND m."Date"=:day) AS food,
+                    (SELECT TOTAL("Protein") FROM meal_totals m WHERE m.email=u.email AND m."Date"=:day) AS protein,
+                    COALESCE((SELECT "Burned" FROM exercise_totals x WHERE x.email=u.email AND x."Date"=:day), 0) AS burned,
+                    COALESCE((SELECT liters FROM water_log w WHERE w.email=u.email AND w."Date"=:day), 0) AS water
+                FROM users u INDEXED BY users_sms
+                WHERE u.sms_alerts=1 AND u.phone<>'' AND u.email>:after AND u.onboarding_done=1
+                  AND NOT EXISTS (SELECT 1 FROM sms_sent s WHERE s.email=u.email AND s."Date"=:day
+                                  AND (s.status IN ('sent', 'rejected') OR (s.status='queued' AND s.updated>:stale)))
+                ORDER BY u.email LIMIT :batch''', {"day": day, "stale": stale, "after": after, "batch": batch}).fetchall()
+            if not rows: return
+            after = rows[-1]["email"]
+            yield [dict(r) for r in rows]
+
+    def target_inputs(self, batch=5000):
+        """Yields lists of onboarded users with the calculate_targets inputs and current targets as columns.
+
+        Each row: email, gender, age, height, activity, goal, weight (latest entry, or None) and the stored
+        cals/prot/carb/fat/water. Profile fields are pulled out by SQLite's json_extract, not parsed in Python.
+        """
+        after = ""
+        while True:
+            rows = self._conn().execute(f'''
+                SELECT u.email, {", ".join(f"json_extract(u.profile, '$.{k}') AS {k}" for k in ("gender", "age", "height", "activity", "goal"))},
+                    {", ".join(f"json_extract(u.profile, '$.targets.{k}') AS {k}" for k in ("cals", "prot", "carb", "fat", "water"))},
+                    (SELECT "Weight" FROM weight_log w WHERE w.email=u.email ORDER BY "Date" DESC LIMIT 1) AS weight
+                FROM users u WHERE u.onboarding_done=1 AND u.email>? ORDER BY u.email LIMIT ?''', (after, batch)).fetchall()
+            if not rows: return
+            after = rows[-1]["email"]
+            yield [dict(r) for r in rows]
+
+    def diary_pages(self, kind, email=None, batch=5000):
+        """Yields pages of one DIARY log as (email, Date, *columns) tuples: by user, then day, then entry order.
+
+        Keyset pages like sms_candidates(): each page is its own statement, so an export of any size never
+        keeps a read snapshot (and with it the WAL) pinned for longer than one page.
+        """
+        table, key, cols = DIARY[kind]
+        keys, names = (", ".join(f'"{c}"' for c in cs) for cs in (key, (*key, *cols)))
+        n, after = len(key), None
+        while True:
+            cond = (["email=?"] if email is not None else []) + ([f"({keys}) > ({', '.join('?' * n)})"] if after else [])
+            params = ([email] if email is not None else []) + list(after or ()) + [batch]
+            rows = self._conn().execute(f"SELECT {names} FROM {table} {'WHERE ' + ' AND '.join(cond) if cond else ''} ORDER BY {keys} LIMIT ?", params).fetchall()
+            if not rows: return
+            after = tuple(rows[-1])[:n]
+            yield [(r[0], r[1], *tuple(r)[n:]) for r in rows]
+
+    def existing_users(self, emails):
+        """The registered subset of ``emails``, in one query."""
+        return {r["email"] for r in self._conn().execute("SELECT email FROM users WHERE email IN (SELECT value FROM json_each(?))", (json.dumps(list(emails)),))}
+
+    # --- Writes ---
+    def claim_sms(self, day, emails, run_id):
+        """Marks ``emails`` as queued for ``day`` by this run; returns the subset this run now owns.
+
+        Another run's fresh claim or a sent or rejected row is left alone, so concurrent schedulers never double-send.
+        """
+        day, now = _day(day), time.time()
+        owned = []
+        with self.transaction() as conn:
+            for e in emails:
+                # rowcount is 0 when the row exists and the WHERE kept it (sent, or freshly claimed elsewhere).
+                cur = conn.execute('''INSERT INTO sms_sent (email, "Date", status, run_id, updated) VALUES (?, ?, 'queued', ?, ?)
+                    ON CONFLICT(email, "Date") DO UPDATE SET status='queued', run_id=excluded.run_id, updated=excluded.updated
+                    WHERE sms_sent.status IN ('failed', 'deferred') OR (sms_sent.status='queued' AND sms_sent.updated<=?)''',
+                    (e, day, run_id, now, now - SMS_STALE_AFTER))
+                if cur.rowcount: owned.append(e)
+        return owned
+
+    def finish_sms(self, day, results):
+        """results: (email, status, attempts); status is 'sent', 'rejected' (final), 'failed' (retried next run) or 'deferred'."""
+        day, now = _day(day), time.time()
+        with self.transaction() as conn:
+            conn.executemany('UPDATE sms_sent SET status=?, attempts=attempts+?, updated=? WHERE email=? AND "Date"=?',
+                             ((status, attempts, now, email, day) for email, status, attempts in results))
+
+    def set_meta(self, key, value):
+        self._conn().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def vacuum(self):
+        """Returns freed pages to the filesystem (after bulk deletes, e.g. extracting avatars)."""
+        conn = self._conn()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # in WAL mode the file only shrinks at checkpoint
+
+    def create_user(self, email, password, username=None, **fields):
+        """`password` is stored as given (see credentials.hash_password); `username` is a preferred name, suffixed if taken."""
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO users (email, password, username) VALUES (?, ?, ?)", (email, password, self.free_username(username or email.split('@')[0])))
+            self._touch(conn, email)
+            if fields: self.update_user(email, **fields)
+
+    def update_user(self, email, **fields):
+        bad = set(fields) - set(USER_COLS)
+        if bad: raise KeyError(f"Unknown user fields: {sorted(bad)}")
+        if "profile" in fields: fields["profile"] = json.dumps(fields["profile"], ensure_ascii=False)
+        for k in ("sms_alerts", "onboarding_done"):
+            if k in fields: fields[k] = int(bool(fields[k]))
+        if not fields: return
+        try:
+            with self.transaction() as conn:
+                conn.execute(f"UPDATE users SET {', '.join(f'{k}=?' for k in fields)} WHERE email=?", (*fields.values(), email))
+                self._touch(conn, email)
+        except sqlite3.IntegrityError:
+            if "username" in fields: raise UsernameTaken(fields["username"])
+            raise
+
+    def set_targets(self, changes):
+        """Bulk rewrite of profile.targets: changes is (email, targets dict) pairs, applied in one transaction."""
+        with self.transaction() as conn:
+            with self._cache_lock:
+                for email, _ in changes: self._cache.pop(email, None)
+            conn.executemany("UPDATE users SET profile=json_set(profile, '$.targets', json(?)), version=version+1 WHERE email=?",
+                             ((json.dumps(t), e) for e, t in changes))
+
+    def set_avatars(self, changes):
+        """Bulk rewrite of profile_pic: changes is (email, digest) pairs, applied in one transaction."""
+        with self.transaction() as conn:
+            with self._cache_lock:
+                for email, _ in changes: self._cache.pop(email, None)
+            conn.executemany("UPDATE users SET profile_pic=?, version=version+1 WHERE email=?", ((d, e) for e, d in changes))
+
+    def set_passwords(self, changes):
+        """Bulk rewrite of passwords: (email, old, new) triples in one transaction; a password changed meanwhile is kept."""
+        with self.transaction() as conn:
+            with self._cache_lock:
+                for email, _, _ in changes: self._cache.pop(email, None)
+            conn.executemany("UPDATE users SET password=?, version=version+1 WHERE email=? AND password=?", ((new, e, old) for e, old, new in changes))
+
+    def set_water(self, email, liters, day=None):
+        with self.transaction() as conn:
+            conn.execute(WATER_UPSERT, (email, _day(day), _num(liters)))
+            self._touch(conn, email)
+
+    def add_water(self, email, delta, day=None):
+        """Adds ``delta`` liters (negative to undo, floored at 0) in SQL, so concurrent sessions of one user
+        never overwrite each other's clicks; returns the day's new total."""
+        day, delta = _day(day), _num(delta)
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO water_log (email, "Date", liters) VALUES (?, ?, max(0, ?)) ON CONFLICT(email, "Date") DO UPDATE SET liters=max(0, liters+?)',
+                         (email, day, delta, delta))
+            self._touch(conn, email)
+            return self._read_water(conn, email, day)
+
+    def add_food(self, email, entry, day=None):
+        with self.transaction() as conn:
+            conn.execute(FOOD_INSERT, _food_row(email, _day(day), entry))
+            self._touch(conn, email)
+
+    def replace_meal(self, email, meal, entries, day=None):
+        day = _day(day)
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM food_log WHERE email=? AND "Date"=? AND "Meal"=?', (email, day, meal))
+            self._touch(conn, email)
+            for e in entries: self.add_food(email, {**e, "Meal": meal}, day)
+
+    def add_exercise(self, email, entry, day=None):
+        with self.transaction() as conn:
+            conn.execute(EXERCISE_INSERT, (email, _day(day), entry.get("Exercise"), _num(entry.get("Burned"))))
+            self._touch(conn, email)
+
+    def upsert_weight(self, email, day, weight):
+        with self.transaction() as conn:
+            conn.execute(WEIGHT_UPSERT, (email, str(day), _num(weight)))
+            self._update_trend(conn, email, str(day))
+            conn.execute("UPDATE users SET weight_version=weight_version+1 WHERE email=?", (email,))
+            self._touch(conn, email)
+
+    def _update_trend(self, conn, email, day):
+        """Recomputes the trend from ``day`` on: one row for the usual append, the tail for a back-dated entry."""
+        prev = conn.execute('SELECT "Date", "Trend" FROM weight_log WHERE email=? AND "Date"<? ORDER BY "Date" DESC LIMIT 1', (email, day)).fetchone()
+        prev_day, trend = (prev["Date"], prev["Trend"]) if prev else (day, None)
+        updates = []
+        for r in conn.execute('SELECT "Date", "Weight" FROM weight_log WHERE email=? AND "Date">=? ORDER BY "Date"', (email, day)).fetchall():
+            trend = _trend(prev_day, trend, r["Date"], r["Weight"]); prev_day = r["Date"]
+            updates.append((trend, email, r["Date"]))
+        conn.executemany('UPDATE weight_log SET "Trend"=? WHERE email=? AND "Date"=?', updates)
+
+    def save_custom_food(self, email, name, food):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO custom_foods (email, name, cals, prot, carb, fat) VALUES (?, ?, ?, ?, ?, ?)", (email, name, *(_num(food.get(k)) for k in ("cals", "prot", "carb", "fat"))))
+            self._touch(conn, email)
+
+    def reset_day(self, email, day=None):
+        """Clears one day's food, exercise and water; other days are untouched."""
+        key = (email, _day(day))
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM food_log WHERE email=? AND "Date"=?', key)
+            conn.execute('DELETE FROM exercise_log WHERE email=? AND "Date"=?', key)
+            conn.execute('DELETE FROM water_log WHERE email=? AND "Date"=?', key)
+            self._touch(conn, email)
+
+    @contextmanager
+    def replaced_days(self):
+        """One import's set of replaced (user, day) keys for import_diary(): a TEMP table on this thread's
+        connection, so it lives in SQLite's temp file rather than in Python however big the import; dropped on exit."""
+        conn, name = self._conn(), f"temp.replaced_{next(_import_ids)}"
+        conn.execute(f'CREATE TABLE {name} (email TEXT NOT NULL, "Date" TEXT NOT NULL, PRIMARY KEY (email, "Date")) WITHOUT ROWID')
+        try: yield name
+        finally: conn.execute(f"DROP TABLE IF EXISTS {name}")
+
+    def import_diary(self, kind, rows, replaced):
+        """Upserts one page of (email, Date, *columns) rows of a DIARY log in one transaction.
+
+        Weight and water overwrite their day. Food and exercise entries have no key of their own, so the
+        first time a (user, day) comes up (recorded in ``replaced``, a table from replaced_days() that the caller
+        keeps across pages) that day's stored entries are deleted first: importing the same export twice leaves
+        one copy, and a day whose rows come back later adds to it.
+        """
+        emails = list(dict.fromkeys(r[0] for r in rows))
+        with self.transaction() as conn:
+            if kind in ("food", "exercise"):
+                # Recorded in the same transaction: a page that rolls back forgets its days too.
+                fresh = [k for k in dict.fromkeys((r[0], r[1]) for r in rows) if conn.execute(f"INSERT OR IGNORE INTO {replaced} VALUES (?, ?)", k).rowcount]
+                conn.executemany(f'DELETE FROM {DIARY[kind][0]} WHERE email=? AND "Date"=?', fresh)
+            conn.executemany({"food": FOOD_INSERT, "exercise": EXERCISE_INSERT, "weight": WEIGHT_UPSERT, "water": WATER_UPSERT}[kind], rows)
+            if kind == "weight":
+                for e in emails: self._update_trend(conn, e, min(r[1] for r in rows if r[0] == e))
+                conn.executemany("UPDATE users SET weight_version=weight_version+1 WHERE email=?", ((e,) for e in emails))
+            for e in emails: self._touch(conn, e)
+
+    # --- One-time migration from myfitness_users_db.json ---
+    def migrate_json(self, json_path, log=sys.stderr):
+        """Imports the legacy JSON users once. A malformed user or log entry is skipped and reported to ``log``
+        (counted as store.legacy.skipped); an unreadable or unparseable file imports nothing."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key='legacy_json_migrated'").fetchone(): return 0
+        n = 0
+        def skip(email, what, error):
+            count("store.legacy.skipped")
+            if log: print(f"{json_path}: {email}: skipped {what}: {error}", file=log)
+        with self.transaction() as conn:
+            conn.execute("SAVEPOINT legacy")
+            try:
+                for email, u in iter_legacy_users(json_path):
+                    n += 1
+                    if not isinstance(u, dict): skip(email, "user", "not an object"); continue
+                    if self.user_exists(email): continue
+                    try:
+                        conn.execute("INSERT INTO users (email, password, username, profile_pic, phone, sms_alerts, onboarding_done, profile) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (email, u.get("password", ""), self.free_username(u.get("username") or email.split('@')[0]), u.get("profile_pic", ""), u.get("phone", ""), int(bool(u.get("sms_alerts"))),
+                                      int(bool(u.get("onboarding_done"))), json.dumps(u.get("profile", {}), ensure_ascii=False)))
+                    except LEGACY_ERRORS as e: skip(email, "user", e); continue
+                    if _num(u.get("water_liters")) > 0: self.set_water(email, u["water_liters"])
+                    for key, kind, add in (("daily_log", list, lambda e: self.add_food(email, e)),
+                                           ("exercise_log", list, lambda e: self.add_exercise(email, e)),
+                                           ("weight_log", list, lambda e: self.upsert_weight(email, e.get("Date"), e.get("Weight"))),
+                                           ("custom_foods", dict, lambda item: self.save_custom_food(email, *item))):
+                        entries = u.get(key) or kind()
+                        if not isinstance(entries, kind): skip(email, key, f"not a {kind.__name__}"); continue
+                        for e in entries.items() if kind is dict else entries:
+                            try: add(e)
+                            except LEGACY_ERRORS as err: skip(email, f"{key} entry {e!r:.80}", err)
+            except (OSError, ValueError):
+                conn.execute("ROLLBACK TO legacy"); n = 0   # unreadable or corrupt: nothing is imported, as before
+            conn.execute("RELEASE legacy")
+            conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_json_migrated', ?)", (json_path,))
+        return n
+
+def iter_legacy_users(path, chunk=1 << 20):
+    """Yields (email, user) from a {"users": {email: {...}}} file one user at a time.
+
+    json.load would hold the whole document (several times its size as Python objects); this keeps one
+    user and one read chunk. Raises ValueError on malformed JSON, like json.load.
+    """
+    decode = json.JSONDecoder().raw_decode
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+        def fill():
+            nonlocal buf, pos, eof
+            more = f.read(chunk)
+            buf, pos, eof = buf[pos:] + more, 0, not more
+        def peek():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n": pos += 1
+                if pos < len(buf) or eof: return buf[pos:pos + 1]
+                fill()
+        def expect(ch):
+            nonlocal pos
+            if peek() != ch: raise ValueError(f"{path}: expected {ch!r}, found {peek()[:1] or 'end of file'!r}")
+            pos += 1
+        def value():
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    v, end = decode(buf, pos)
+                    if end < len(buf) or eof: pos = end; return v   # a value ending exactly at the chunk edge may continue
+                except ValueError:
+                    if eof: raise
+                fill()
+        def members():
+            """Yields the keys of the object at pos; the caller reads each value before asking for the next key."""
+            nonlocal pos
+            expect("{")
+            if peek() == "}": pos += 1; return
+            while True:
+                key = value(); expect(":")
+                yield key
+                if peek() != ",": break
+                pos += 1
+            expect("}")
+        for key in members():
+            if key != "users": value(); continue
+            for email in members(): yield email, value()
@@ -0,0 +1,106 @@
+"""Daily calorie/macro/water targets, per user and for the whole store.
+
+    python targets.py recalc --db myfitness.db             # rewrite everyone's targets from their profile
+    python targets.py recalc --db myfitness.db --dry-run   # only count what would change
+
+Run ``recalc`` after changing MULTIPLIERS or GOAL_SPLITS. Users are read in keyset pages of ``--chunk``,
+computed with calculate_targets_batch (the same numbers calculate_targets gives one user at a time) and
+only rows whose targets actually changed are written, one short transaction per page.
+"""
+import sys
+import json
+import argparse
+from functools import lru_cache
+import numpy as np
+
+MULTIPLIERS = {"Sedentary": 1.2, "Lightly active": 1.375, "Moderately active": 1.55, "Very active": 1.725, "Super active": 1.9}
+# (substring of the goal label, kcal offset from TDEE, protein/carb/fat share of kcal); first match wins.
+GOAL_SPLITS = [
+    ("Weight Loss", -500, (0.40, 0.35, 0.25)),
+    ("Maintenance", 0, (0.30, 0.40, 0.30)),
+    ("Muscle", 300, (0.25, 0.50, 0.25)),
+]
+DEFAULT_SPLIT = (500, (0.30, 0.50, 0.20))
+DEFAULT_WEIGHT = 75.0   # kg, when a user has no weight entries
+TARGET_KEYS = ("cals", "prot", "carb", "fat", "water")
+
+def goal_split(goal):
+    return next(((off, pct) for key, off, pct in GOAL_SPLITS if key in goal), DEFAULT_SPLIT)
+
+def water_target(weight, activity):
+    return round((weight * 35) / 1000 + (0.75 if "active" in activity.lower() else 0), 1)
+
+@lru_cache(maxsize=4096)
+def recommended_water(weight, activity):
+    """water_target() for the Summary rerun, memoized on the latest weight entry and activity level."""
+    return water_target(weight, activity)
+
+def calculate_targets(gender, age, weight, height, activity, goal):
+    bmr = (10 * weight) + (6.25 * height) - (5 * age) + (5 if gender == "Male" else -161)
+    tdee = bmr * MULTIPLIERS[activity]
+    offset, (p_pct, c_pct, f_pct) = goal_split(goal)
+    cals = int(tdee + offset)
+    prot, carb, fat = int((cals*p_pct)/4), int((cals*c_pct)/4), int((cals*f_pct)/9)
+    return cals, prot, carb, fat, water_target(weight, activity)
+
+def _round1(x):
+    """round(x, 1) elementwise. np.round scales by 10 in binary, which only disagrees with Python's
+    correctly rounded round() within float error of a .x5 tie; those few are redone in Python."""
+    r = np.round(x, 1)
+    tie = np.flatnonzero(np.abs(x * 10 % 1 - 0.5) < 1e-6)
+    r[tie] = [round(float(v), 1) for v in x[tie]]
+    return r
+
+def _lookup(labels, fn):
+    """Applies fn once per distinct label; returns per-element results as a tuple of arrays."""
+    codes = {}  # a dict pass is ~6x faster than np.unique, which sorts the strings
+    inv = np.fromiter((codes.setdefault(l, len(codes)) for l in labels), np.intp, count=len(labels))
+    return tuple(np.asarray(col, dtype=np.float64)[inv] for col in zip(*(fn(l) for l in codes)))
+
+def calculate_targets_batch(gender, age, weight, height, activity, goal):
+    """calculate_targets over equal-length arrays; returns (cals, prot, carb, fat) int64 arrays and a water float array.
+
+    Same operations in the same order on float64, so every element equals the scalar result exactly.
+    Raises KeyError for an unknown activity level, like the scalar version.
+    """
+    age, weight, height = (np.asarray(a, dtype=np.float64) for a in (age, weight, height))
+    if not len(weight): return tuple(np.empty(0, dtype=np.int64) for _ in range(4)) + (np.empty(0),)
+    (gender_c,) = _lookup(gender, lambda g: (5.0 if g == "Male" else -161.0,))
+    mult, active = _lookup(activity, lambda a: (MULTIPLIERS[a], 0.75 if "active" in a.lower() else 0.0))
+    offset, p_pct, c_pct, f_pct = _lookup(goal, lambda g: (float(goal_split(g)[0]), *goal_split(g)[1]))
+    bmr = (10 * weight) + (6.25 * height) - (5 * age) + gender_c
+    tdee = bmr * mult
+    cals = np.trunc(tdee + offset).astype(np.int64)
+    prot, carb, fat = (np.trunc((cals * pct) / d).astype(np.int64) for pct, d in ((p_pct, 4), (c_pct, 4), (f_pct, 9)))
+    return cals, prot, carb, fat, _round1((weight * 35) / 1000 + active)
+
+def recalc(store, chunk=5000, dry_run=False, log=sys.stderr):
+    """Recomputes targets for every onboarded user; returns counters. Only changed rows are written."""
+    stats = {"users": 0, "changed": 0, "skipped": 0}
+    for rows in store.target_inputs(chunk):
+        stats["users"] += len(rows)
+        ok = [r for r in rows if r["activity"] in MULTIPLIERS and None not in (r["gender"], r["age"], r["height"], r["goal"])]
+        stats["skipped"] += len(rows) - len(ok)
+        if not ok: continue
+        new = calculate_targets_batch(*zip(*((r["gender"], r["age"], r["weight"] or DEFAULT_WEIGHT, r["height"], r["activity"], r["goal"]) for r in ok)))
+        old = [np.array([np.nan if r[k] is None else r[k] for r in ok], dtype=np.float64) for k in TARGET_KEYS]
+        changed = np.flatnonzero(np.any([n != o for n, o in zip(new, old)], axis=0))
+        changes = [(ok[i]["email"], {k: col[i].item() for k, col in zip(TARGET_KEYS, new)}) for i in changed]
+        stats["changed"] += len(changes)
+        if changes and not dry_run: store.set_targets(changes)
+        print(f"  {stats['users']:,} users, {stats['changed']:,} changed", file=log)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("recalc", help="recompute every onboarded user's targets from their profile and latest weight")
+    p.add_argument("--db", default="myfitness.db")
+    p.add_argument("--chunk", type=int, default=5000, help="users per read page / write transaction")
+    p.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    from store import FitnessStore
+    print(json.dumps(recalc(FitnessStore(args.db, legacy_json=None), args.chunk, args.dry_run)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class StubServer:
+    """A local HTTP server answering from ``routes``: path (without query) -> (status, JSON body or raw bytes) or a callable
+    taking the handler. Records every request path and the client port of every connection."""
+
+    def __init__(self):
+        self.routes, self.requests, self.connections = {}, [], set()
+        stub = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive, so pooled connections are visible
+            def log_message(self, *args): pass
+            def _answer(self):
+                stub.requests.append(self.path); stub.connections.add(self.client_address[1])
+                route = stub.routes.get(self.path.split("?")[0], (404, {}))
+                status, body = route(self) if callable(route) else route
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status); self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data))); self.end_headers(); self.wfile.write(data)
+            def do_GET(self): self._answer()
+            def do_POST(self):
+                self.body = self.rfile.read(int(self.headers.get("Content-Length") or 0)); self._answer()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def hits(self, prefix):
+        return sum(p.startswith(prefix) for p in self.requests)
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.server.shutdown(); server.server.server_close()
+
+class Clock:
+    """Stands in for the ``time`` module of the code under test: time() only moves when advanced."""
+
+    def __init__(self, now=1_700_000_000.0): self.now = now
+    def time(self): return self.now
+    def monotonic(self): return self.now
+    def sleep(self, seconds): self.now += seconds
+    def advance(self, seconds): self.now += seconds
+
+@pytest.fixture
+def clock():
+    return Clock()
@@ -0,0 +1,16 @@
+import io
+import random
+import pytest
+
+pytest.importorskip("pyzbar.pyzbar", reason="needs the zbar shared library", exc_type=ImportError)
+from bench import ean13, synthetic_photo
+from barcode import decode_barcode
+
+def corpus(condition, n, seed=0):
+    rng = random.Random(seed)
+    return [(code, synthetic_photo(code, condition, rng)) for code in (ean13(f"729{rng.randrange(10 ** 9):09d}") for _ in range(n))]
+
+@pytest.mark.parametrize("condition, at_least", [("clean", 10), ("blur", 9)])
+def test_decode_rate(condition, at_least):
+    # The legacy full-frame decode + contrast pass read 19/20 blurred frames; the variants must not fall behind.
+    assert sum(decode_barcode(io.BytesIO(data)) == code for code, data in corpus(condition, 10)) >= at_least
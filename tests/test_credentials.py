@@ -0,0 +1,48 @@
+import pytest
+from credentials import Credentials, hash_password, verify_password
+from store import FitnessStore
+
+@pytest.fixture
+def store(tmp_path):
+    return FitnessStore(str(tmp_path / "auth.db"), legacy_json=None)
+
+def test_round_trip():
+    stored = hash_password("correct horse", n=2 ** 10)
+    assert verify_password("correct horse", stored) == (True, True)   # cheaper than HASH_N: rehash on login
+    assert verify_password("wrong", stored) == (False, False)
+
+@pytest.mark.parametrize("stored", [
+    "scrypt$", "scrypt$16384$8$1$c2FsdA==", "scrypt$abc$8$1$c2FsdA==$ZGlnZXN0", "scrypt$16384$8$1$not base64!$ZGlnZXN0",
+    "scrypt$16384$8$1$c2FsdA==$ZGln$extra", "scrypt$3$8$1$c2FsdA==$ZGlnZXN0", "scrypt$0$0$0$$",
+])
+def test_malformed_hash_is_a_failed_login(stored):
+    assert verify_password("anything", stored) == (False, False)
+
+def test_migrate_hashes_plaintext_rows(store):
+    store.create_user("old@example.com", "hunter2")
+    store.create_user("new@example.com", hash_password("s3cret"))
+    credentials = Credentials(store)
+    assert credentials.migrate() == 1
+    stored = store.get_password("old@example.com")
+    assert stored.startswith("scrypt$") and "hunter2" not in stored
+    assert credentials.verify("old@example.com", "hunter2").result()
+    assert not credentials.verify("old@example.com", "wrong").result()
+    assert credentials.verify("new@example.com", "s3cret").result()
+    assert credentials.migrate() == 0
+    assert list(store.plaintext_passwords()) == []
+
+def test_migrate_keeps_a_password_changed_meanwhile(store):
+    store.create_user("a@example.com", "old-plain")
+    [page] = store.plaintext_passwords()
+    store.update_user("a@example.com", password=hash_password("changed"))
+    store.set_passwords([(e, pw, hash_password(pw)) for e, pw in page])
+    assert verify_password("changed", store.get_password("a@example.com"))[0]
+
+def test_background_migration_leaves_logins_working(store):
+    for i in range(20): store.create_user(f"u{i}@example.com", f"pw{i}")
+    credentials = Credentials(store)
+    thread = credentials.migrate_in_background(batch=5)
+    assert credentials.verify("u19@example.com", "pw19").result()
+    thread.join(30)
+    assert not thread.is_alive() and list(store.plaintext_passwords()) == []
+    assert all(credentials.verify(f"u{i}@example.com", f"pw{i}").result() for i in range(20))
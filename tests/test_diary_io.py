@@ -0,0 +1,85 @@
+import io
+import os
+import zipfile
+import tracemalloc
+import pytest
+from diary_io import export, import_log, import_paths, sources, user_archive
+from store import FitnessStore
+
+USERS = [f"user{i:02d}@example.com" for i in range(20)]
+FOOD = ("email", "Date", "Meal", "Food", "Grams", "Calories", "Protein", "Carbs", "Fat")
+
+def new_store(path):
+    store = FitnessStore(str(path), legacy_json=None)
+    with store.transaction() as conn:
+        conn.executemany("INSERT INTO users (email, password, username) VALUES (?, 'x', ?)", ((e, e.split("@")[0]) for e in USERS))
+    return store
+
+@pytest.fixture
+def store(tmp_path):
+    return new_store(tmp_path / "diary.db")
+
+def fill(store, n):
+    """n food rows, ten per user and day."""
+    with store.transaction() as conn:
+        conn.executemany('INSERT INTO food_log (email, "Date", "Meal", "Food", "Grams", "Calories", "Protein", "Carbs", "Fat") VALUES (?, ?, \'Lunch\', ?, 100, 155, 13, 1.1, 11)',
+                         ((USERS[i % 20], f"2025-{1 + i // 200 % 12:02d}-{1 + i // 2400 % 28:02d}", f"food number {i}") for i in range(n)))
+
+def food(store, email):
+    return [tuple(r) for r in store._conn().execute('SELECT "Date", "Food" FROM food_log WHERE email=? ORDER BY "Date", "Food"', (email,))]
+
+def peak(fn):
+    tracemalloc.start()
+    try: fn(); return tracemalloc.get_traced_memory()[1]
+    finally: tracemalloc.stop()
+
+def test_export_and_import_memory_stays_a_page(store, tmp_path):
+    fill(store, 30000)
+    whole = peak(lambda: list(store.diary_pages("food", batch=10 ** 9)))
+    out, target = str(tmp_path / "out.zip"), new_store(tmp_path / "target.db")
+    with open(os.devnull, "w") as log:
+        exported = peak(lambda: export(store, out, chunk=500, log=log))
+        imported = peak(lambda: import_paths(target, [out], chunk=500, log=log))
+    assert target._conn().execute("SELECT COUNT(*) FROM food_log").fetchone()[0] == 30000
+    assert exported < whole / 4 and imported < whole / 4, (exported, imported, whole)
+
+def test_import_memory_does_not_grow_with_the_days_replaced(tmp_path):
+    peaks = []
+    for n in (10000, 40000):
+        source, target, out = new_store(tmp_path / f"{n}.db"), new_store(tmp_path / f"{n}-target.db"), str(tmp_path / f"{n}.zip")
+        fill(source, n)
+        with open(os.devnull, "w") as log:
+            export(source, out, chunk=500, log=log)
+            peaks.append(peak(lambda: import_paths(target, [out], chunk=500, log=log)))
+    assert peaks[1] < peaks[0] + 256 * 1024, peaks
+
+def test_a_day_that_comes_back_later_is_added_to(store):
+    day = [("2025-01-01", "Egg"), ("2025-01-02", "Oats"), ("2025-01-01", "Toast")]
+    pages = [[dict(zip(FOOD, (USERS[0], d, "Lunch", f, 100, 1, 1, 1, 1))), dict(zip(FOOD, (USERS[1], d, "Lunch", f, 100, 1, 1, 1, 1)))] for d, f in day]
+    for _ in range(2):   # and importing it again still leaves one copy
+        stats = import_log(store, "food", iter(pages))
+        assert stats["imported"] == 6
+        assert food(store, USERS[0]) == food(store, USERS[1]) == [("2025-01-01", "Egg"), ("2025-01-01", "Toast"), ("2025-01-02", "Oats")]
+
+def test_user_archive_is_bytes_of_that_users_logs(store):
+    fill(store, 400)
+    data = user_archive(store, USERS[3])
+    assert isinstance(data, bytes)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert sorted(zf.namelist()) == ["exercise.csv", "food.csv", "water.csv", "weight.csv"]
+        rows = zf.read("food.csv").decode().splitlines()
+    assert len(rows) == 1 + 20 and all(r.startswith(USERS[3]) for r in rows[1:])
+
+def open_files():
+    fds = f"/proc/{os.getpid()}/fd"
+    return {os.path.realpath(os.path.join(fds, f)) for f in os.listdir(fds)}
+
+def test_archive_is_open_only_while_a_member_is_read(store, tmp_path):
+    fill(store, 100)
+    out = str(tmp_path / "out.zip")
+    with open(os.devnull, "w") as log: export(store, out, log=log)
+    found = sources([out])
+    assert len(found) == 4 and out not in open_files()
+    with found[0][2]() as fb:
+        assert out in open_files() and fb.read()
+    assert out not in open_files()
@@ -0,0 +1,49 @@
+from food_search import FoodIndex, FoodSearch
+
+CATALOG = {"Chicken Breast": {"cals": 165}, "Chickpeas": {"cals": 364}, "Egg": {"cals": 155}, "Greek Yogurt": {"cals": 59}}
+
+def search_over(catalog=CATALOG, **kw):
+    index = FoodIndex(); index.add_many(catalog)
+    return FoodSearch(index, **kw)
+
+def names(hits):
+    return [name for name, _ in hits]
+
+def test_custom_foods_stay_out_of_the_catalog_and_other_users():
+    fs = search_over()
+    fs.ensure_owner("a@example.com", {"Chicken Wrap": {"cals": 250}})
+    fs.ensure_owner("b@example.com", {"Chicken Soup": {"cals": 80}})
+    assert len(fs.catalog) == len(CATALOG)
+    assert "Chicken Wrap" in names(fs.search("chicken", owner="a@example.com"))
+    assert "Chicken Soup" not in names(fs.search("chicken", owner="a@example.com"))
+    assert not {"Chicken Wrap", "Chicken Soup"} & set(names(fs.search("chicken")))
+
+def test_users_own_entry_wins_over_the_catalogs():
+    fs = search_over()
+    fs.ensure_owner("a@example.com", {"Egg": {"cals": 70}})
+    assert fs.search("egg", owner="a@example.com")[0] == ("Egg", {"cals": 70})
+    assert fs.search("egg")[0] == ("Egg", {"cals": 155})
+
+def test_ensure_owner_refreshes_changes_and_deletions():
+    fs = search_over()
+    fs.ensure_owner("a@example.com", {"Protein Bar": {"cals": 200}, "Oat Bar": {"cals": 380}})
+    index = fs._users["a@example.com"]
+    fs.ensure_owner("a@example.com", {"Protein Bar": {"cals": 200}, "Oat Bar": {"cals": 380}})
+    assert fs._users["a@example.com"] is index
+    fs.ensure_owner("a@example.com", {"Protein Bar": {"cals": 210}})
+    assert fs.search("bar", owner="a@example.com") == [("Protein Bar", {"cals": 210})]
+
+def test_least_recently_used_user_indexes_are_evicted():
+    fs = search_over(max_users=2)
+    for user in ("a", "b", "c"): fs.ensure_owner(user, {f"{user} bar": {}})
+    assert list(fs._users) == ["b", "c"]
+    assert fs.search("a bar", owner="a") == []
+    fs.ensure_owner("a", {"a bar": {}})
+    assert names(fs.search("a bar", owner="a")) == ["a bar"]
+
+def test_add_and_drop_owner():
+    fs = search_over()
+    fs.add("Date Balls", {"cals": 400}, owner="a@example.com")
+    assert names(fs.search("date balls", owner="a@example.com")) == ["Date Balls"]
+    fs.drop_owner("a@example.com")
+    assert fs.search("date balls", owner="a@example.com") == []
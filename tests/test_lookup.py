@@ -0,0 +1,45 @@
+import threading
+from lookup import LookupService, replace_lookup
+
+def service(translate, remote_search):
+    return LookupService(translate, remote_search, barcode_lookup=lambda code: None, max_workers=4)
+
+def test_lowercase_query_keeps_remote_hits_that_land_first():
+    # The translation passes English through unchanged, so both tasks concern one string; the search lands first.
+    searched = threading.Event()
+    def translate(q):
+        searched.wait(5); return q
+    def remote_search(q):
+        searched.set(); return [{"name": f"{q} remote"}]
+    svc = service(translate, remote_search)
+    for _ in range(50):
+        searched.clear()
+        lk = svc.start("banana", lambda *q: []).wait(5)
+        assert lk.remote == [{"name": "banana remote"}] and not lk.pending
+
+def test_translated_results_win_over_the_typed_query():
+    svc = service(lambda q: "chicken breast", lambda q: [{"name": q}])
+    lk = svc.start("חזה עוף", lambda *q: []).wait(5)
+    assert lk.en == "chicken breast" and lk.remote == [{"name": "chicken breast"}]
+
+def test_typed_query_hits_stand_when_the_translation_finds_nothing():
+    svc = service(lambda q: "xyz", lambda q: [{"name": q}] if q == "קוטג" else [])
+    assert svc.start("קוטג", lambda *q: []).wait(5).remote == [{"name": "קוטג"}]
+
+def test_local_hit_after_translation_ends_the_wait():
+    release = threading.Event()
+    def remote_search(q):
+        release.wait(5); return []
+    svc = service(lambda q: "egg", remote_search)
+    lk = svc.start("ביצה", lambda *q: [{"name": "Egg"}] if "egg" in q else [])
+    lk._futures[1].result(5)   # the translate-then-local task; the remote search is still held
+    assert lk.local == [{"name": "Egg"}] and not lk.pending
+    release.set()
+
+def test_replace_lookup_cancels_the_previous_query():
+    svc = service(lambda q: q, lambda q: [])
+    state = {}
+    first = replace_lookup(state, "lk", svc, "egg", lambda *q: [])
+    assert replace_lookup(state, "lk", svc, "egg", lambda *q: []) is first
+    second = replace_lookup(state, "lk", svc, "eggs", lambda *q: [])
+    assert second is not first and first.cancelled and state["lk"] is second
@@ -0,0 +1,152 @@
+import pytest
+import off_client
+from off_client import OFFCache, OFFClient, TTL, NEGATIVE_TTL, ERROR_TTL
+
+PRODUCT = {"code": "737628064502", "product_name": "Rice Noodles", "nutriments": {"energy-kcal_100g": 385}}
+
+class LocalTable:
+    def __init__(self, products=(), searches=None):
+        self.products, self.searches, self.calls = {p["code"]: p for p in products}, searches or {}, []
+    def product(self, code):
+        self.calls.append(("product", code)); return self.products.get(code)
+    def search(self, q):
+        self.calls.append(("search", q)); return self.searches.get(q, [])
+
+@pytest.fixture
+def client(stub_server, clock, tmp_path, monkeypatch):
+    monkeypatch.setattr(off_client, "time", clock)
+    def make(**kw):
+        return OFFClient(stub_server.url, OFFCache(str(tmp_path / "cache.db")), timeout=2, **kw)
+    return make
+
+def product_route(stub, code, status=200, body=None):
+    stub.routes[f"/api/v0/product/{code}.json"] = (status, body if body is not None else {"status": 1, "product": PRODUCT})
+
+# --- Expiry of each TTL class ---
+def test_found_product_is_cached_for_ttl(stub_server, client, clock):
+    product_route(stub_server, "737628064502")
+    c = client()
+    assert c.product("737628064502") == PRODUCT
+    clock.advance(TTL - 1)
+    assert c.product(" 737628064502 ") == PRODUCT
+    assert stub_server.hits("/api/v0/product/") == 1
+    clock.advance(2)
+    assert c.product("737628064502") == PRODUCT
+    assert stub_server.hits("/api/v0/product/") == 2
+
+@pytest.mark.parametrize("status, body", [(404, {}), (200, {"status": 0})])
+def test_unknown_barcode_is_cached_for_negative_ttl(stub_server, client, clock, status, body):
+    product_route(stub_server, "1", status, body)
+    c = client()
+    assert c.product("1") is None
+    clock.advance(NEGATIVE_TTL - 1)
+    assert c.product("1") is None
+    assert stub_server.hits("/api/v0/product/") == 1
+    clock.advance(2)
+    product_route(stub_server, "1")
+    assert c.product("1") == PRODUCT
+    assert stub_server.hits("/api/v0/product/") == 2
+
+def test_empty_search_is_cached_for_negative_ttl(stub_server, client, clock):
+    stub_server.routes["/cgi/search.pl"] = (200, {"products": []})
+    c = client()
+    assert c.search("Nothing  Here") == []
+    clock.advance(NEGATIVE_TTL - 1)
+    assert c.search("nothing here") == []
+    assert stub_server.hits("/cgi/search.pl") == 1
+    clock.advance(2)
+    assert c.search("nothing here") == []
+    assert stub_server.hits("/cgi/search.pl") == 2
+
+@pytest.mark.parametrize("status, body", [(500, {}), (200, b"<html>maintenance</html>"), (200, ["not", "an", "object"])])
+def test_server_errors_are_cached_for_error_ttl(stub_server, client, clock, status, body):
+    product_route(stub_server, "2", status, body)
+    c = client()
+    assert c.product("2") is None
+    clock.advance(ERROR_TTL - 1)
+    assert c.product("2") is None
+    assert stub_server.hits("/api/v0/product/") == 1
+    clock.advance(2)
+    product_route(stub_server, "2")
+    assert c.product("2") == PRODUCT
+    assert stub_server.hits("/api/v0/product/") == 2
+
+def test_unreachable_server_is_cached_for_error_ttl(clock, tmp_path, monkeypatch):
+    monkeypatch.setattr(off_client, "time", clock)
+    c = OFFClient("http://127.0.0.1:9", OFFCache(str(tmp_path / "cache.db")), timeout=1)
+    assert c.product("3") is None
+    assert c.cache.get("barcode:3", "absent") is None
+    clock.advance(ERROR_TTL + 1)
+    assert c.cache.get("barcode:3", "absent") == "absent"
+
+def test_disk_tier_outlives_the_memory_tier(stub_server, client, clock, tmp_path):
+    product_route(stub_server, "737628064502")
+    assert client().product("737628064502") == PRODUCT
+    fresh = OFFClient(stub_server.url, OFFCache(str(tmp_path / "cache.db"), memory_entries=1))
+    assert fresh.product("737628064502") == PRODUCT
+    assert stub_server.hits("/api/v0/product/") == 1
+    clock.advance(TTL + 1)
+    assert fresh.cache.get("barcode:737628064502", "absent") == "absent"
+
+def test_search_dedupes_by_name(stub_server, client):
+    stub_server.routes["/cgi/search.pl"] = (200, {"products": [
+        {"product_name": "Oat Milk", "code": "1"}, {"product_name": "Oat Milk", "code": "2"},
+        {"product_name": "", "code": "3"}, {"product_name": "Oat Drink", "code": "4"}]})
+    assert [p["code"] for p in client().search("oat")] == ["1", "4"]
+    assert "search_terms=oat" in stub_server.requests[0]
+
+@pytest.mark.parametrize("body", [["not", "an", "object"], None, "text", b"<html>maintenance</html>"])
+def test_non_object_search_response_is_cached_for_error_ttl(stub_server, client, clock, body):
+    stub_server.routes["/cgi/search.pl"] = (200, body)
+    c = client()
+    assert c.search("oat") == []
+    assert c.cache.get("search:oat", "absent") is None
+    clock.advance(ERROR_TTL + 1)
+    assert c.cache.get("search:oat", "absent") == "absent"
+
+@pytest.mark.parametrize("products", [None, "oat", {"product_name": "Oat Milk"}, [None, "oat", {"product_name": "Oat Milk"}]])
+def test_malformed_products_are_skipped(stub_server, client, products):
+    stub_server.routes["/cgi/search.pl"] = (200, {"products": products})
+    assert client().search("oat") == ([{"product_name": "Oat Milk"}] if isinstance(products, list) else [])
+
+# --- Pooled session ---
+def test_requests_reuse_one_keep_alive_connection(stub_server, client):
+    for code in range(10): product_route(stub_server, str(code))
+    stub_server.routes["/cgi/search.pl"] = (200, {"products": [PRODUCT]})
+    c = client()
+    for code in range(10): assert c.product(str(code)) == PRODUCT
+    assert c.search("rice noodles") == [PRODUCT]
+    assert len(stub_server.requests) == 11
+    assert len(stub_server.connections) == 1
+
+# --- Local table first, network fallback ---
+def test_local_hit_never_touches_the_network(stub_server, client):
+    local = LocalTable([PRODUCT], {"rice": [PRODUCT]})
+    c = client(local=local, network=True)
+    assert c.product("737628064502") == PRODUCT
+    assert c.search("Rice") == [PRODUCT]
+    assert stub_server.requests == []
+
+def test_local_miss_falls_back_to_the_network(stub_server, client):
+    product_route(stub_server, "5")
+    stub_server.routes["/cgi/search.pl"] = (200, {"products": [PRODUCT]})
+    local = LocalTable()
+    c = client(local=local, network=True)
+    assert c.product("5") == PRODUCT
+    assert c.search("noodles") == [PRODUCT]
+    assert local.calls == [("product", "5"), ("search", "noodles")]
+    assert stub_server.hits("/api/v0/product/") == 1 and stub_server.hits("/cgi/search.pl") == 1
+
+def test_local_miss_without_fallback_stays_offline(stub_server, client):
+    product_route(stub_server, "5")
+    c = client(local=LocalTable(), network=False)
+    assert c.product("5") is None
+    assert c.search("noodles") == []
+    assert stub_server.requests == []
+
+def test_network_defaults_to_only_without_a_local_table(client, monkeypatch):
+    monkeypatch.setattr(off_client, "OFF_NETWORK_FALLBACK", "")
+    assert client().network is True
+    assert client(local=LocalTable()).network is False
+    monkeypatch.setattr(off_client, "OFF_NETWORK_FALLBACK", "1")
+    assert client(local=LocalTable()).network is True
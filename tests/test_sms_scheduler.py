@@ -0,0 +1,144 @@
+import json
+import time
+import random
+import threading
+import pytest
+from types import SimpleNamespace
+import sms_scheduler
+from sms_scheduler import HTTPSender, RateLimiter, SendError, deliver, run_pass, BACKOFF, BACKOFF_CAP
+from store import FitnessStore
+
+DAY = "2026-03-01"
+PROFILE = {"goal": "Weight Loss", "targets": {"cals": 2000, "prot": 120, "carb": 200, "fat": 60, "water": 3.0}}
+
+@pytest.fixture
+def store(tmp_path):
+    store = FitnessStore(str(tmp_path / "sms.db"), legacy_json=None)
+    for i in range(30):
+        store.create_user(f"user{i:02d}@example.com", "pw", phone=f"05{i:08d}", sms_alerts=True, onboarding_done=True, profile=PROFILE)
+    return store
+
+class Recorder:
+    """Sender that records every phone it is asked to send to; `fail` maps phone -> SendError to raise."""
+    def __init__(self, fail=None, delay=0.0):
+        self.sent, self.fail, self.delay, self._lock = [], fail or {}, delay, threading.Lock()
+    def send(self, phone, text):
+        time.sleep(self.delay)
+        if phone in self.fail: raise self.fail[phone]
+        with self._lock: self.sent.append(phone)
+
+class Unlimited:
+    def acquire(self, deadline=None): return True
+
+def statuses(store):
+    return dict(store._conn().execute('SELECT email, status FROM sms_sent WHERE "Date"=?', (DAY,)).fetchall())
+
+# --- Dedupe ---
+def test_second_pass_sends_nothing(store):
+    sender = Recorder()
+    first = run_pass(store, sender, DAY, rate=10000, workers=4, log=None)
+    second = run_pass(store, sender, DAY, rate=10000, workers=4, log=None)
+    assert first["sent"] == 30 and second["candidates"] == 0 and second["sent"] == 0
+    assert sorted(sender.sent) == sorted(set(sender.sent)) and len(sender.sent) == 30
+
+def test_concurrent_passes_send_each_user_once(store, tmp_path):
+    sender = Recorder(delay=0.005)
+    # Each scheduler has its own connection to the same file, as separate processes would.
+    stores = [store] + [FitnessStore(str(tmp_path / "sms.db"), legacy_json=None) for _ in range(2)]
+    threads = [threading.Thread(target=run_pass, args=(s, sender, DAY), kwargs={"rate": 10000, "workers": 4, "batch": 7, "log": None}) for s in stores]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(sender.sent) == 30 and len(set(sender.sent)) == 30
+    assert set(statuses(store).values()) == {"sent"}
+
+def test_claim_skips_fresh_claims_and_retakes_failures(store):
+    emails = ["user00@example.com", "user01@example.com"]
+    assert store.claim_sms(DAY, emails, "run-a") == emails
+    assert store.claim_sms(DAY, emails, "run-b") == []
+    store.finish_sms(DAY, [(emails[0], "failed", 1), (emails[1], "rejected", 1)])
+    assert store.claim_sms(DAY, emails, "run-c") == [emails[0]]
+
+# --- Permanent failures ---
+def test_4xx_is_rejected_once_and_never_retried(store, stub_server):
+    bad = "0500000003"
+    def gateway(handler):
+        return (400, {"error": "invalid number"}) if json.loads(handler.body)["to"] == bad else (200, {})
+    stub_server.routes["/send"] = gateway
+    sender = HTTPSender(stub_server.url + "/send", pool_size=4)
+    first = run_pass(store, sender, DAY, rate=10000, workers=4, log=None)
+    assert (first["sent"], first["rejected"], first["failed"]) == (29, 1, 0)
+    assert statuses(store)["user03@example.com"] == "rejected"
+    second = run_pass(store, sender, DAY, rate=10000, workers=4, log=None)
+    assert second["candidates"] == 0
+    assert stub_server.hits("/send") == 30
+
+def test_retryable_failure_is_retried_next_pass(store):
+    flaky = Recorder(fail={"0500000005": SendError("HTTP 503")})
+    first = run_pass(store, flaky, DAY, rate=10000, workers=4, log=None)
+    assert first["failed"] == 1 and statuses(store)["user05@example.com"] == "failed"
+    second = run_pass(store, Recorder(), DAY, rate=10000, workers=4, log=None)
+    assert (second["candidates"], second["sent"]) == (1, 1)
+
+# --- Backoff ---
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(sms_scheduler, "time", SimpleNamespace(sleep=slept.append, monotonic=time.monotonic))
+    monkeypatch.setattr(sms_scheduler, "random", random.Random(0))
+    return slept
+
+class Flaky:
+    def __init__(self, errors): self.errors, self.calls = list(errors), 0
+    def send(self, phone, text):
+        self.calls += 1
+        if self.errors: raise self.errors.pop(0)
+
+def test_backoff_is_exponential_jittered_and_capped(sleeps):
+    sender = Flaky([SendError("HTTP 503")] * 6)
+    assert deliver(sender, Unlimited(), "05", "hi", time.monotonic() + 3600, max_attempts=7) == ("sent", 7)
+    for attempt, delay in enumerate(sleeps, 1):
+        full = min(BACKOFF_CAP, BACKOFF * 2 ** (attempt - 1))
+        assert full / 2 <= delay <= full
+    assert max(sleeps) <= BACKOFF_CAP and sleeps[-1] > BACKOFF_CAP / 2
+
+def test_retry_after_overrides_backoff(sleeps):
+    sender = Flaky([SendError("HTTP 429", retry_after=2.5)])
+    assert deliver(sender, Unlimited(), "05", "hi", time.monotonic() + 60) == ("sent", 2)
+    assert sleeps == [2.5]
+
+def test_gives_up_after_max_attempts(sleeps):
+    sender = Flaky([SendError("timeout")] * 10)
+    assert deliver(sender, Unlimited(), "05", "hi", time.monotonic() + 3600, max_attempts=3) == ("failed", 3)
+    assert sender.calls == 3 and len(sleeps) == 2
+
+def test_non_retryable_error_is_not_retried(sleeps):
+    sender = Flaky([SendError("HTTP 400", retryable=False)])
+    assert deliver(sender, Unlimited(), "05", "hi", time.monotonic() + 3600) == ("rejected", 1)
+    assert sender.calls == 1 and sleeps == []
+
+def test_backoff_past_deadline_defers(sleeps):
+    sender = Flaky([SendError("HTTP 503", retry_after=30)])
+    assert deliver(sender, Unlimited(), "05", "hi", time.monotonic() + 10) == ("deferred", 1)
+    assert sleeps == []
+
+# --- Rate limiting ---
+def test_rate_limiter_spaces_sends_after_the_burst():
+    limiter = RateLimiter(200, burst=5)
+    t0 = time.monotonic()
+    for _ in range(45): assert limiter.acquire()
+    # 5 back to back, then one every 5 ms.
+    assert time.monotonic() - t0 >= 40 / 200 * 0.95
+
+def test_rate_limiter_refuses_slots_past_the_deadline():
+    limiter = RateLimiter(10, burst=1)
+    deadline = time.monotonic() + 0.25
+    granted = sum(limiter.acquire(deadline) for _ in range(10))
+    assert 2 <= granted <= 4
+    assert limiter.acquire(deadline) is False
+
+def test_run_pass_respects_the_rate(store):
+    t0 = time.monotonic()
+    stats = run_pass(store, Recorder(), DAY, rate=100, workers=8, log=None)
+    assert stats["sent"] == 30
+    # burst = rate // 10 = 10, then 20 more at 100/s.
+    assert time.monotonic() - t0 >= 20 / 100 * 0.95
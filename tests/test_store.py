@@ -0,0 +1,37 @@
+import io
+import json
+from store import FitnessStore
+
+GOOD_FOOD = {"Meal": "Lunch", "Food": "Egg", "Grams": 100, "Calories": 155, "Protein": 13, "Carbs": 1.1, "Fat": 11}
+
+def legacy(tmp_path, users):
+    path = tmp_path / "legacy.json"
+    path.write_text(json.dumps({"users": users}), encoding="utf-8")
+    return str(path)
+
+def test_malformed_legacy_entries_are_skipped_not_fatal(tmp_path):
+    path = legacy(tmp_path, {
+        "a@example.com": {"password": "pw", "username": "a", "weight_log": [{"Date": "2025-01-01", "Weight": 80}, 81],
+                          "daily_log": [GOOD_FOOD, "Egg", None, {**GOOD_FOOD, "Food": {"name": "Egg"}}],
+                          "exercise_log": {"Exercise": "Run"}, "custom_foods": {"Bar": {"cals": 400}, "Bad": [1, 2]}},
+        "b@example.com": ["not", "a", "user"],
+        "c@example.com": {"password": "pw", "username": ["c"]},
+        "d@example.com": {"password": "pw", "daily_log": [GOOD_FOOD]},
+    })
+    log = io.StringIO()
+    store = FitnessStore(str(tmp_path / "app.db"), legacy_json=None)
+    assert store.migrate_json(path, log=log) == 4
+    rows = lambda sql: [tuple(r) for r in store._conn().execute(sql)]
+    assert rows('SELECT email, "Food" FROM food_log ORDER BY email') == [("a@example.com", "Egg"), ("d@example.com", "Egg")]
+    assert rows("SELECT email, name FROM custom_foods") == [("a@example.com", "Bar")]
+    assert rows("SELECT COUNT(*) FROM exercise_log") == [(0,)]
+    assert store.get_user("a@example.com")["weight"] == 80
+    assert not store.user_exists("b@example.com") and not store.user_exists("c@example.com")
+    skipped = log.getvalue().splitlines()
+    assert len(skipped) == 8 and all(line.startswith(path) for line in skipped)
+
+def test_unparseable_legacy_file_imports_nothing(tmp_path):
+    path = tmp_path / "legacy.json"
+    path.write_text('{"users": {"a@example.com": {"password": "pw"}, "b@', encoding="utf-8")
+    store = FitnessStore(str(tmp_path / "app.db"), legacy_json=str(path))
+    assert not store.user_exists("a@example.com")
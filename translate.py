@@ -0,0 +1,102 @@
+import re
+import sqlite3
+import threading
+from food_search import normalize
+from metrics import timed, span, count
+
+# --- Offline Hebrew -> English food-term table ---
+TRANSLATIONS_FILE = "translations.db"
+_HEBREW = re.compile("[\u05d0-\u05ea]")
+_ASCII = re.compile("^[ -~]*$")
+
+# Seed glossary covering the OFFLINE_DB / fitness_db.json catalog. Hebrew is noun-first ("חזה עוף" =
+# breast of chicken); the food index ignores token order, so word-by-word output still matches.
+SEED_HE = {
+    "חלב": "milk", "גבינה": "cheese", "גבינה לבנה": "white cheese", "גבינה צהובה": "yellow cheese", "קוטג": "cottage cheese",
+    "יוגורט": "yogurt", "יווני": "greek", "ביו": "bio", "לבנה": "labneh", "פטה": "feta", "בולגרית": "feta cheese", "צפתית": "tzfatit cheese",
+    "ריקוטה": "ricotta", "עיזים": "goat", "סויה": "soy", "שקדים": "almonds", "שקד": "almond", "חלב שקדים": "almond milk",
+    "עוף": "chicken", "חזה": "breast", "חזה עוף": "chicken breast", "פרגית": "chicken thigh", "שוק": "thigh", "בקר": "beef",
+    "טחון": "ground", "בשר טחון": "ground beef", "בשר": "beef", "פילה": "fillet", "אנטריקוט": "entrecote", "הודו": "turkey",
+    "טונה": "tuna", "במים": "in water", "בשמן": "in oil", "סלמון": "salmon", "דניס": "denis", "קבב": "kebab", "פסטרמה": "pastrami",
+    "כבד": "liver", "כבד עוף": "chicken liver", "שניצל": "schnitzel", "אמנון": "tilapia", "מושט": "tilapia", "ביצה": "egg", "ביצים": "egg",
+    "חלבון": "egg whites", "עגבניה": "tomato", "עגבנייה": "tomato", "מלפפון": "cucumber", "פלפל": "pepper", "פלפל אדום": "red pepper",
+    "גזר": "carrot", "בצל": "onion", "ברוקולי": "broccoli", "כרובית": "cauliflower", "תרד": "spinach", "חסה": "lettuce", "קישוא": "zucchini",
+    "חציל": "eggplant", "כרוב": "cabbage", "שום": "garlic", "פטריות": "mushroom", "פטריה": "mushroom", "שעועית ירוקה": "green beans",
+    "תפוח": "apple", "בננה": "banana", "תפוז": "orange", "ענבים": "grapes", "אבטיח": "watermelon", "תות": "strawberry", "אפרסק": "peach",
+    "אגס": "pear", "מנגו": "mango", "אננס": "pineapple", "תמר": "dates", "תמרים": "dates", "אבוקדו": "avocado", "שזיף": "plum", "מלון": "melon",
+    "קיווי": "kiwi", "אורז": "rice", "אורז לבן": "white rice", "אורז מלא": "brown rice", "פסטה": "pasta", "בטטה": "sweet potato",
+    "תפוח אדמה": "potato", "תפוחי אדמה": "potato", "שיבולת שועל": "oats", "קינואה": "quinoa", "עדשים": "lentils", "חומוס": "hummus",
+    "גרגרי חומוס": "chickpeas", "לחם": "bread", "לחם לבן": "white bread", "לחם מלא": "whole wheat bread", "פיתה": "pita bread",
+    "תירס": "corn", "כוסמת": "buckwheat", "קוסקוס": "couscous", "טופו": "tofu", "חמאת בוטנים": "peanut butter", "טחינה": "tahini",
+    "במבה": "bamba", "מבושל": "cooked", "מבושלת": "cooked", "לבן": "white", "מלא": "whole", "אדום": "red", "ירוק": "green",
+}
+
+class TranslationTable:
+    """Phrase- and token-level dictionary consulted before any remote translator.
+
+    Seeded from SEED_HE and extended with every successful remote translation, persisted in
+    SQLite so it survives restarts. Plain-ASCII queries are already English and pass through.
+    """
+
+    def __init__(self, remote=None, path=TRANSLATIONS_FILE):
+        self.remote, self.path = remote, path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS terms (src TEXT PRIMARY KEY, dst TEXT NOT NULL, origin TEXT NOT NULL)")
+        self.terms = {normalize(k): v for k, v in SEED_HE.items()}
+        # Learned rows override the seed: they are what the remote translator actually returned.
+        self.terms.update(dict(conn.execute("SELECT src, dst FROM terms")))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _count(self, key):
+        # translate.{lookups,phrase_hits,token_hits,passthrough,remote_calls,remote_failures,learned} in the metrics
+        # registry; the offline hit rate is (phrase_hits + token_hits + passthrough) / lookups.
+        count(f"translate.{key}")
+
+    def lookup(self, query):
+        """Offline translation, or None when some Hebrew word is unknown."""
+        q = normalize(query)
+        if not q: return None
+        if q in self.terms: self._count("phrase_hits"); return self.terms[q]
+        if _ASCII.match(q):
+            self._count("passthrough"); return q
+        if not _HEBREW.search(q): return None
+        toks, out, i = q.split(), [], 0
+        while i < len(toks):
+            # Longest known phrase first, so "חזה עוף" beats "חזה" + "עוף".
+            for j in range(min(len(toks), i + 3), i, -1):
+                src = " ".join(toks[i:j])
+                if src in self.terms: out.append(self.terms[src]); i = j; break
+            else:
+                if _HEBREW.search(toks[i]): return None
+                out.append(toks[i]); i += 1
+        self._count("token_hits")
+        return " ".join(out)
+
+    @timed("translate")
+    def translate(self, query):
+        self._count("lookups")
+        en = self.lookup(query)
+        if en is not None: return en
+        if self.remote is None: return query.lower()
+        self._count("remote_calls"); count("net.translate")
+        try:
+            with span("translate.remote"): en = self.remote(query)
+        except Exception: en = None
+        if not en or en.lower() == query.lower():
+            self._count("remote_failures"); return query.lower()
+        self.learn(query, en.lower())
+        return en.lower()
+
+    def learn(self, src, dst):
+        src = normalize(src)
+        if not src or not dst: return
+        self.terms[src] = dst
+        self._conn().execute("INSERT OR REPLACE INTO terms (src, dst, origin) VALUES (?, ?, 'learned')", (src, dst))
+        self._count("learned")
@@ -0,0 +1,48 @@
+import numpy as np
+
+# --- Weight chart series ---
+POINT_BUDGET = 400       # points per trace sent to the browser, whatever the history length
+RESOLUTIONS = ("Daily", "Weekly", "Monthly")
+
+def goal_rate(goal):
+    """Ideal weight change in kg/day for the Target line."""
+    return -0.07 if "Weight Loss" in goal else (0.035 if "Muscle" in goal else (0.07 if "Bodybuilding" in goal else 0))
+
+def resample(days, weight, trend, resolution):
+    """Weekly (Monday) or monthly buckets: mean weigh-in, trend as of the bucket's last entry. Daily passes through."""
+    if resolution == "Daily": return days, weight, trend
+    start = days - (days.astype(np.int64) + 3) % 7 if resolution == "Weekly" else days.astype("datetime64[M]").astype("datetime64[D]")
+    keys, first, inv = np.unique(start, return_index=True, return_inverse=True)
+    last = np.r_[first[1:], len(days)] - 1
+    return keys, np.bincount(inv, weight) / np.bincount(inv), trend[last]
+
+def lttb(x, y, n):
+    """Largest-Triangle-Three-Buckets: indices of n points that keep the visual shape of (x, y)."""
+    size = len(x)
+    if n >= size or n < 3: return np.arange(size)
+    every, a, out = (size - 2) / (n - 2), 0, [0]
+    for i in range(n - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nxt = slice(hi, min(int((i + 2) * every) + 1, size))
+        ax, ay = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - ax) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ay - y[a]))
+        a = lo + int(np.argmax(area)); out.append(a)
+    out.append(size - 1)
+    return np.asarray(out)
+
+def weight_series(rows, goal, resolution="Daily", budget=POINT_BUDGET):
+    """Chart-ready arrays from get_weights() rows: Date, Weight, Trend, Ideal (budget points at most) and the
+    resampled table, newest first. The Ideal line starts at the first weigh-in, as before."""
+    days = np.array([r["Date"][:10] for r in rows], dtype="datetime64[D]")
+    weight = np.array([r["Weight"] for r in rows], dtype=np.float64)
+    trend = np.array([r["Trend"] for r in rows], dtype=np.float64)
+    first_day, first_weight = days[0], weight[0]
+    days, weight, trend = resample(days, weight, trend, resolution)
+    keep = lttb(days.astype(np.float64), weight, budget)
+    x, w, t = days[keep], weight[keep], trend[keep]
+    ideal = first_weight + (x - first_day).astype(np.float64) * goal_rate(goal)
+    # numpy arrays rather than lists: Plotly validates and serializes them without a per-element Python pass.
+    return {
+        "Date": x.astype(str), "Weight": w.round(2), "Trend": t.round(2), "Ideal": ideal.round(2),
+        "table": {"Date": days[::-1].astype(str), "Weight": weight[::-1].round(2)}, "points": len(rows),
+    }